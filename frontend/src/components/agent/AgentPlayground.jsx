@@ -74,6 +74,7 @@ const AgentPlayground = ({ agent, initialExpanded = false }) => {
   const [connectionStatus, setConnectionStatus] = useState("pending_setup");
   const [sessionId, setSessionId] = useState(null);
   const [isTicketCreated, setIsTicketCreated] = useState(false);
+  const [historyCursor, setHistoryCursor] = useState(null);
   const webSocket = useRef(null);
   const messagesEndRef = useRef(null);
   const { toast } = useToast();
@@ -115,6 +116,7 @@ const AgentPlayground = ({ agent, initialExpanded = false }) => {
     const storageKey = `lyzr_playground_session_${agent.id}`;
     localStorage.removeItem(storageKey);
     setMessages([]);
+    setHistoryCursor(null);
     setIsTicketCreated(false);
     setSessionId(getOrCreateSessionId(agent.id)); // This will trigger the useEffect to reconnect
     setConnectionStatus('pending_setup');
@@ -151,7 +153,7 @@ const AgentPlayground = ({ agent, initialExpanded = false }) => {
     const getChatWebSocketURL = (agentId, sessionId) => {
       const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
       const host = import.meta.env.VITE_APP_WS_URL || "127.0.0.1:8000"; // Fallback for safety
-      return `${protocol}//${host}/ws/chat/${agentId}/${sessionId}/`;
+      return `${protocol}//${host}/ws/chat/${agentId}/${sessionId}/?stream=1`;
     };
 
     const wsUrl = getChatWebSocketURL(agent.id, sessionId);
@@ -162,9 +164,16 @@ const AgentPlayground = ({ agent, initialExpanded = false }) => {
     };
     
     webSocket.current.onmessage = (event) => {
-      setIsSending(false);
       const data = JSON.parse(event.data);
-      if (data.event_type === "new_message" || data.event_type === "ticket_created") {
+      if (data.event_type === "ping") {
+        webSocket.current.send(JSON.stringify({ event_type: "pong" }));
+        return;
+      }
+      setIsSending(false);
+      if (data.event_type === "history") {
+        setMessages((prev) => (data.initial ? data.messages : [...data.messages, ...prev]));
+        setHistoryCursor(data.cursor);
+      } else if (data.event_type === "new_message" || data.event_type === "ticket_created") {
         const newMessage = data.message;
         if (newMessage.sender === "SYSTEM" && newMessage.content.includes("support ticket")) {
           setIsTicketCreated(true);
@@ -173,6 +182,25 @@ const AgentPlayground = ({ agent, initialExpanded = false }) => {
           if (prev.find((m) => m.id === newMessage.id)) return prev;
           return [...prev, newMessage];
         });
+      } else if (data.event_type === "message_chunk") {
+        setMessages((prev) => {
+          if (!prev.some((m) => m.id === data.message_id)) {
+            return [...prev, { id: data.message_id, sender: "AI", content: data.content, feedback: null }];
+          }
+          return prev.map((m) =>
+            m.id === data.message_id ? { ...m, content: m.content + data.content } : m
+          );
+        });
+      } else if (data.event_type === "message_aborted") {
+        // The reply failed part-way; the error message follows on its own.
+        setMessages((prev) => prev.filter((m) => m.id !== data.message_id));
+      } else if (data.event_type === "message_complete") {
+        const finalMessage = data.message;
+        setMessages((prev) =>
+          prev.some((m) => m.id === finalMessage.id)
+            ? prev.map((m) => (m.id === finalMessage.id ? finalMessage : m))
+            : [...prev, finalMessage]
+        );
       } else if (data.event_type === "feedback_confirmation") {
         setMessages((prev) =>
           prev.map((msg) =>
@@ -219,6 +247,14 @@ const AgentPlayground = ({ agent, initialExpanded = false }) => {
     setInputValue("");
   };
 
+  const handleLoadHistory = () => {
+    if (connectionStatus !== "open" || !historyCursor) return;
+    webSocket.current.send(
+      JSON.stringify({ event_type: "load_history", cursor: historyCursor })
+    );
+    setHistoryCursor(null);
+  };
+
   const handleEscalate = () => {
     if (connectionStatus !== "open" || isTicketCreated) return;
     webSocket.current.send(
@@ -283,6 +319,11 @@ const AgentPlayground = ({ agent, initialExpanded = false }) => {
           </div>
         </div>
         <div className="flex-grow overflow-y-auto p-4 space-y-4 bg-white">
+          {historyCursor && (
+            <Button variant="ghost" size="sm" onClick={handleLoadHistory} className="w-full text-xs text-muted-foreground">
+              Load earlier messages
+            </Button>
+          )}
           {displayedMessages.map((msg, index) => (
             <div key={msg.id || index} className={`flex flex-col items-start gap-2 ${msg.sender === "USER" ? "items-end" : ""}`}>
               <div className={`flex items-start gap-3 w-full ${msg.sender === "USER" ? "justify-end" : ""}`}>
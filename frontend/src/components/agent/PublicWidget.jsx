@@ -5,6 +5,7 @@ import { Send, Bot, User, Loader2, LifeBuoy, Ticket, RefreshCcw, X, MessageSquar
 import { v4 as uuidv4 } from "uuid";
 import ReactMarkdown from "react-markdown";
 import remarkGfm from "remark-gfm";
+import { decodeMsgpack } from "@/lib/msgpack";
 
 const DEFAULT_WIDGET_SETTINGS = {
   theme_color: "#16a34a",
@@ -16,6 +17,7 @@ const DEFAULT_WIDGET_SETTINGS = {
 const ESCALATION_PHRASE = "connect you with a support team member";
 const isEscalationMessage = (content) => typeof content === "string" && content.includes(ESCALATION_PHRASE);
 const launcherIcons = { MessageSquare, Bot, Sparkles };
+const isPersistedId = (id) => /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i.test(id || "");
 
 const PublicWidget = ({ agentConfig }) => {
   const [isExpanded, setIsExpanded] = useState(false);
@@ -25,7 +27,11 @@ const PublicWidget = ({ agentConfig }) => {
   const [connectionStatus, setConnectionStatus] = useState("connecting");
   const [sessionId, setSessionId] = useState(null);
   const [isTicketCreated, setIsTicketCreated] = useState(false);
+  const [historyCursor, setHistoryCursor] = useState(null);
+  const [connectionAttempt, setConnectionAttempt] = useState(0);
   const webSocket = useRef(null);
+  const lastSeenMessageId = useRef(null);
+  const pendingSend = useRef(null);
   const messagesEndRef = useRef(null);
 
   const settings = { ...DEFAULT_WIDGET_SETTINGS, ...(agentConfig?.widget_settings || {}) };
@@ -54,46 +60,109 @@ const PublicWidget = ({ agentConfig }) => {
     const getChatWebSocketURL = (agentId, sessionId) => {
         const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
         const host = import.meta.env.VITE_APP_WS_URL || "127.0.0.1:8000";
-        return `${protocol}//${host}/ws/chat/${agentId}/${sessionId}/`;
+        const resume = lastSeenMessageId.current ? `&last_seen_message_id=${lastSeenMessageId.current}` : "";
+        // encoding=msgpack: server frames arrive as binary msgpack, which is smaller than JSON text.
+        return `${protocol}//${host}/ws/chat/${agentId}/${sessionId}/?stream=1&encoding=msgpack${resume}`;
     };
 
     const wsUrl = getChatWebSocketURL(agentConfig.id, sessionId);
     webSocket.current = new WebSocket(wsUrl);
+    webSocket.current.binaryType = "arraybuffer";
     setConnectionStatus("connecting");
 
-    webSocket.current.onopen = () => setConnectionStatus("open");
-    webSocket.current.onclose = () => setConnectionStatus("closed");
+    webSocket.current.onopen = () => {
+        setConnectionStatus("open");
+        // Resend a message whose reply never arrived; its client_message_id lets the server dedupe it.
+        if (pendingSend.current) {
+            webSocket.current.send(JSON.stringify(pendingSend.current));
+            setIsSending(true);
+        }
+    };
+    // 4001: closed by the server after a long idle period; reconnect when the user comes back.
+    webSocket.current.onclose = (event) => setConnectionStatus(event.code === 4001 ? "idle" : "closed");
     webSocket.current.onerror = (err) => console.error("Lyzr Widget WS Error:", err);
     webSocket.current.onmessage = (event) => {
+        // Servers without msgpack support ignore the flag and keep sending JSON text.
+        const data = typeof event.data === "string" ? JSON.parse(event.data) : decodeMsgpack(event.data);
+        if (data.event_type === "ping") {
+            webSocket.current.send(JSON.stringify({ event_type: "pong" }));
+            return;
+        }
         setIsSending(false);
-        const data = JSON.parse(event.data);
-        if (data.event_type === "new_message") {
+        if (data.message?.reply_to && data.message.reply_to === pendingSend.current?.client_message_id) {
+            pendingSend.current = null;
+        }
+        if (data.event_type === "history") {
+            setMessages((prev) => (data.initial ? data.messages : [...data.messages, ...prev]));
+            setHistoryCursor(data.cursor);
+        } else if (data.event_type === "sync") {
+            setMessages((prev) => {
+                const known = prev.filter((m) => isPersistedId(m.id));
+                const knownIds = new Set(known.map((m) => m.id));
+                return [...known, ...data.messages.filter((m) => !knownIds.has(m.id))];
+            });
+        } else if (data.event_type === "reset") {
+            setMessages([]);
+            setHistoryCursor(null);
+        } else if (data.event_type === "new_message") {
             const newMessage = data.message;
             if (newMessage.sender === "SYSTEM" && newMessage.content.includes("support ticket")) {
                 setIsTicketCreated(true);
             }
-            setMessages((prev) => [...prev, newMessage]);
+            setMessages((prev) => (prev.some((m) => m.id === newMessage.id) ? prev : [...prev, newMessage]));
+        } else if (data.event_type === "message_chunk") {
+            setMessages((prev) => {
+                if (!prev.some((m) => m.id === data.message_id)) {
+                    return [...prev, { id: data.message_id, sender: "AI", content: data.content, feedback: null }];
+                }
+                return prev.map((m) => (m.id === data.message_id ? { ...m, content: m.content + data.content } : m));
+            });
+        } else if (data.event_type === "message_aborted") {
+            // The reply failed part-way; the error message follows on its own.
+            setMessages((prev) => prev.filter((m) => m.id !== data.message_id));
+        } else if (data.event_type === "message_complete") {
+            const finalMessage = data.message;
+            setMessages((prev) =>
+                prev.some((m) => m.id === finalMessage.id)
+                    ? prev.map((m) => (m.id === finalMessage.id ? finalMessage : m))
+                    : [...prev, finalMessage]
+            );
         }
     };
 
     return () => {
         if (webSocket.current) webSocket.current.close();
     };
-  }, [isExpanded, sessionId, agentConfig]);
+  }, [isExpanded, sessionId, agentConfig, connectionAttempt]);
+
+  const resumeIfIdle = () => {
+    if (connectionStatus === "idle") setConnectionAttempt((attempt) => attempt + 1);
+  };
 
   const handleSend = () => {
     if (!inputValue.trim() || connectionStatus !== "open" || isSending) return;
-    setMessages((prev) => [...prev, { id: `user_${uuidv4()}`, sender: "USER", content: inputValue }]);
-    webSocket.current.send(JSON.stringify({ event_type: "user_message", message: inputValue }));
+    const clientMessageId = uuidv4();
+    setMessages((prev) => [...prev, { id: `user_${clientMessageId}`, sender: "USER", content: inputValue }]);
+    pendingSend.current = { event_type: "user_message", message: inputValue, client_message_id: clientMessageId };
+    webSocket.current.send(JSON.stringify(pendingSend.current));
     setIsSending(true);
     setInputValue("");
   };
 
+  const handleLoadHistory = () => {
+    if (connectionStatus !== "open" || !historyCursor) return;
+    webSocket.current.send(JSON.stringify({ event_type: "load_history", cursor: historyCursor }));
+    setHistoryCursor(null);
+  };
+
   const handleNewSession = () => {
     if (!agentConfig?.id) return;
     if (webSocket.current) webSocket.current.close();
     localStorage.removeItem(`lyzr_widget_session_${agentConfig.id}`);
     setMessages([]);
+    setHistoryCursor(null);
+    lastSeenMessageId.current = null;
+    pendingSend.current = null;
     setIsTicketCreated(false);
     setSessionId(getOrCreateSessionId(agentConfig.id));
   };
@@ -103,6 +172,11 @@ const PublicWidget = ({ agentConfig }) => {
     webSocket.current.send(JSON.stringify({ event_type: "escalate_to_ticket" }));
   };
   
+  useEffect(() => {
+    const lastPersisted = [...messages].reverse().find((m) => isPersistedId(m.id));
+    lastSeenMessageId.current = lastPersisted ? lastPersisted.id : null;
+  }, [messages]);
+
   useEffect(() => { messagesEndRef.current?.scrollIntoView({ behavior: "smooth" }); }, [messages]);
   
   const displayedMessages = messages.length > 0 ? messages : [{ id: "init", sender: "AI", content: settings.welcome_message }];
@@ -120,6 +194,7 @@ const PublicWidget = ({ agentConfig }) => {
                 </div>
             </div>
             <div className="flex-grow overflow-y-auto p-3 space-y-4">
+                {historyCursor && <Button variant="ghost" size="sm" onClick={handleLoadHistory} className="w-full text-xs text-muted-foreground">Load earlier messages</Button>}
                 {displayedMessages.map((msg, index) => (
                     <div key={msg.id || index} className={`flex items-start gap-2.5 ${msg.sender === "USER" ? "justify-end" : ""}`}>
                         {msg.sender !== "USER" && <div className="p-2 rounded-full" style={{ backgroundColor: themeColor + "20" }}><Bot className="h-5 w-5" style={{ color: themeColor }} /></div>}
@@ -139,9 +214,9 @@ const PublicWidget = ({ agentConfig }) => {
                 <div ref={messagesEndRef} />
             </div>
             <div className="p-3 border-t">
-                {connectionStatus !== "open" && <p className="text-xs text-center text-muted-foreground mb-2">Connecting...</p>}
+                {connectionStatus !== "open" && <p className="text-xs text-center text-muted-foreground mb-2">{connectionStatus === "idle" ? "Chat paused. Click the message box to continue." : "Connecting..."}</p>}
                 <div className="flex gap-2">
-                    <Input value={inputValue} onChange={(e) => setInputValue(e.target.value)} onKeyPress={(e) => e.key === "Enter" && handleSend()} placeholder="Type a message..." disabled={connectionStatus !== "open" || isSending} />
+                    <Input value={inputValue} onFocus={resumeIfIdle} onChange={(e) => setInputValue(e.target.value)} onKeyPress={(e) => e.key === "Enter" && handleSend()} placeholder="Type a message..." disabled={(connectionStatus !== "open" && connectionStatus !== "idle") || isSending} />
                     <Button onClick={handleSend} disabled={connectionStatus !== "open" || !inputValue.trim() || isSending} style={{ backgroundColor: themeColor }}><Send className="h-4 w-4 text-white" /></Button>
                 </div>
             </div>
@@ -0,0 +1,76 @@
+// Minimal msgpack decoder for chat socket frames (?encoding=msgpack). Covers
+// the types the backend's msgpack.packb() emits for JSON-like data: nil,
+// booleans, integers, floats, strings, binary, arrays and maps.
+const textDecoder = new TextDecoder();
+
+export function decodeMsgpack(buffer) {
+  const bytes = buffer instanceof Uint8Array ? buffer : new Uint8Array(buffer);
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  let offset = 0;
+
+  const str = (length) => {
+    const value = textDecoder.decode(bytes.subarray(offset, offset + length));
+    offset += length;
+    return value;
+  };
+  const bin = (length) => {
+    const value = bytes.slice(offset, offset + length);
+    offset += length;
+    return value;
+  };
+  const array = (length) => {
+    const value = new Array(length);
+    for (let i = 0; i < length; i++) value[i] = read();
+    return value;
+  };
+  const map = (length) => {
+    const value = {};
+    for (let i = 0; i < length; i++) {
+      const key = read();
+      value[key] = read();
+    }
+    return value;
+  };
+  const take = (size, getter) => {
+    const value = getter(offset);
+    offset += size;
+    return value;
+  };
+
+  function read() {
+    const type = bytes[offset++];
+    if (type <= 0x7f) return type;
+    if (type <= 0x8f) return map(type & 0x0f);
+    if (type <= 0x9f) return array(type & 0x0f);
+    if (type <= 0xbf) return str(type & 0x1f);
+    if (type >= 0xe0) return type - 0x100;
+    switch (type) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: return bin(take(1, (o) => view.getUint8(o)));
+      case 0xc5: return bin(take(2, (o) => view.getUint16(o)));
+      case 0xc6: return bin(take(4, (o) => view.getUint32(o)));
+      case 0xca: return take(4, (o) => view.getFloat32(o));
+      case 0xcb: return take(8, (o) => view.getFloat64(o));
+      case 0xcc: return take(1, (o) => view.getUint8(o));
+      case 0xcd: return take(2, (o) => view.getUint16(o));
+      case 0xce: return take(4, (o) => view.getUint32(o));
+      case 0xcf: return Number(take(8, (o) => view.getBigUint64(o)));
+      case 0xd0: return take(1, (o) => view.getInt8(o));
+      case 0xd1: return take(2, (o) => view.getInt16(o));
+      case 0xd2: return take(4, (o) => view.getInt32(o));
+      case 0xd3: return Number(take(8, (o) => view.getBigInt64(o)));
+      case 0xd9: return str(take(1, (o) => view.getUint8(o)));
+      case 0xda: return str(take(2, (o) => view.getUint16(o)));
+      case 0xdb: return str(take(4, (o) => view.getUint32(o)));
+      case 0xdc: return array(take(2, (o) => view.getUint16(o)));
+      case 0xdd: return array(take(4, (o) => view.getUint32(o)));
+      case 0xde: return map(take(2, (o) => view.getUint16(o)));
+      case 0xdf: return map(take(4, (o) => view.getUint32(o)));
+      default: throw new Error(`Unsupported msgpack type 0x${type.toString(16)}`);
+    }
+  }
+
+  return read();
+}
@@ -0,0 +1,65 @@
+// Run with `npm test` (node:test, no extra dependencies). Expected bytes are
+// what the backend's msgpack.packb() produces for the same values.
+import assert from "node:assert/strict";
+import { test } from "node:test";
+import { decodeMsgpack } from "./msgpack.js";
+
+const textEncoder = new TextEncoder();
+
+const frame = (...parts) =>
+  Uint8Array.from(parts.flatMap((part) => (typeof part === "string" ? [...textEncoder.encode(part)] : part)));
+
+test("nil and booleans", () => {
+  assert.equal(decodeMsgpack(frame([0xc0])), null);
+  assert.equal(decodeMsgpack(frame([0xc2])), false);
+  assert.equal(decodeMsgpack(frame([0xc3])), true);
+});
+
+test("fixstr and str8 with multi-byte characters", () => {
+  assert.equal(decodeMsgpack(frame([0xa2], "Hi")), "Hi");
+  const text = "é".repeat(20);
+  assert.equal(decodeMsgpack(frame([0xd9, 40], text)), text);
+});
+
+test("str16 and str32", () => {
+  const medium = "a".repeat(300);
+  assert.equal(decodeMsgpack(frame([0xda, 0x01, 0x2c], medium)), medium);
+  const long = "x".repeat(70000);
+  assert.equal(decodeMsgpack(frame([0xdb, 0x00, 0x01, 0x11, 0x70], long)), long);
+});
+
+test("integers", () => {
+  const bytes = frame(
+    [0x97, 0x01, 0xff, 0xd0, 0xdf, 0xcc, 0xc8, 0xce, 0x00, 0x01, 0x11, 0x70],
+    [0xd2, 0xff, 0xfe, 0xee, 0x90],
+    [0xcf, 0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0x00, 0x00],
+  );
+  assert.deepEqual(decodeMsgpack(bytes), [1, -1, -33, 200, 70000, -70000, 2 ** 40]);
+});
+
+test("float64", () => {
+  assert.equal(decodeMsgpack(frame([0xcb, 0x3f, 0xf8, 0, 0, 0, 0, 0, 0])), 1.5);
+});
+
+test("bin8 decodes to bytes", () => {
+  assert.deepEqual(decodeMsgpack(frame([0xc4, 0x03, 0x00, 0xff, 0x10])), Uint8Array.from([0x00, 0xff, 0x10]));
+});
+
+test("map16", () => {
+  const entries = Array.from({ length: 16 }, (_, i) => [String(i), i]);
+  const body = entries.flatMap(([key, value]) => [[0xa0 | key.length], key, [value]]);
+  assert.deepEqual(decodeMsgpack(frame([0xde, 0x00, 0x10], ...body)), Object.fromEntries(entries));
+});
+
+test("chat frame from an ArrayBuffer", () => {
+  const bytes = frame(
+    [0x83, 0xaa], "event_type", [0xad], "message_chunk",
+    [0xaa], "message_id", [0xa2], "m1",
+    [0xa7], "content", [0xa2], "Hi",
+  );
+  assert.deepEqual(decodeMsgpack(bytes.buffer), { event_type: "message_chunk", message_id: "m1", content: "Hi" });
+});
+
+test("unsupported types are rejected", () => {
+  assert.throws(() => decodeMsgpack(frame([0xc1])), /Unsupported msgpack type 0xc1/);
+});
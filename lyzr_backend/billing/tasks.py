@@ -0,0 +1,15 @@
+import logging
+from celery import shared_task
+from .usage_counters import flush_message_counters
+
+logger = logging.getLogger(__name__)
+
+@shared_task(name="flush_usage_counters_task")
+def flush_usage_counters_task():
+    """
+    Periodically reconciles the Redis message counters into billing.Usage rows.
+    """
+    flushed = flush_message_counters()
+    if flushed:
+        logger.info(f"Flushed {flushed} usage counters to the database.")
+    return flushed
@@ -1,3 +1,74 @@
+from unittest import mock
 from django.test import TestCase
+from django.utils import timezone
+from billing import usage_counters
+from billing.models import Subscription, Usage
+from billing.usage_counters import DIRTY_SET_KEY, flush_message_counters, increment_message_count_sync
+from core.models import User
+from core.testing import use_fake_redis
 
-# Create your tests here.
+
+class UsageCounterFlushTests(TestCase):
+    def setUp(self):
+        self.redis = use_fake_redis(self, usage_counters)
+        user = User.objects.create_user(email='owner@example.com', password='secret')
+        self.subscription = Subscription.objects.create(user=user)
+        self.today = timezone.now().date()
+
+    def stored_count(self):
+        return Usage.objects.get(subscription=self.subscription, date=self.today).messages_count
+
+    def race_flush(self, after_read: bool):
+        """Flushes with one message counted after the SPOP, either before or after the counters are read."""
+        mget = self.redis.mget
+        raced = []
+
+        def racing_mget(keys):
+            if not after_read and not raced:
+                raced.append(increment_message_count_sync(self.subscription.id))
+            values = mget(keys)
+            if after_read and not raced:
+                raced.append(increment_message_count_sync(self.subscription.id))
+            return values
+
+        with mock.patch.object(self.redis, 'mget', side_effect=racing_mget):
+            return flush_message_counters()
+
+    def test_increment_racing_the_read_is_flushed(self):
+        for _ in range(3):
+            increment_message_count_sync(self.subscription.id)
+
+        # The increment marks the counter dirty again, so the flush writes it twice.
+        self.assertEqual(self.race_flush(after_read=False), 2)
+        self.assertEqual(self.stored_count(), 4)
+        self.assertEqual(flush_message_counters(), 0)
+
+    def test_increment_after_the_read_is_not_lost(self):
+        for _ in range(3):
+            increment_message_count_sync(self.subscription.id)
+
+        # The stale total is written first, then the new one in the same flush.
+        self.assertEqual(self.race_flush(after_read=True), 2)
+        self.assertEqual(self.stored_count(), 4)
+        self.assertEqual(self.redis.scard(DIRTY_SET_KEY), 0)
+
+    def test_failed_write_leaves_counters_for_the_next_flush(self):
+        increment_message_count_sync(self.subscription.id, amount=2)
+
+        with mock.patch.object(Usage.objects, 'bulk_create', side_effect=RuntimeError("database down")):
+            with self.assertRaises(RuntimeError):
+                flush_message_counters()
+
+        self.assertEqual(flush_message_counters(), 1)
+        self.assertEqual(self.stored_count(), 2)
+
+    def test_counter_reseeded_after_eviction_does_not_lower_the_stored_count(self):
+        Usage.objects.create(subscription=self.subscription, date=self.today, messages_count=10)
+        increment_message_count_sync(self.subscription.id)
+        flush_message_counters()
+        self.redis.delete(usage_counters._counter_key(str(self.subscription.id), self.today))
+
+        # Reseeded from the stored row, not restarted from zero.
+        self.assertEqual(increment_message_count_sync(self.subscription.id), 12)
+        flush_message_counters()
+        self.assertEqual(self.stored_count(), 12)
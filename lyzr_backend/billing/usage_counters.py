@@ -0,0 +1,164 @@
+import logging
+from datetime import date, timedelta
+from typing import List, Optional
+from channels.db import database_sync_to_async
+from django.utils import timezone
+from redis.exceptions import RedisError
+from core.services.redis_client import get_redis, get_async_redis
+from billing.models import Subscription, Usage
+
+logger = logging.getLogger(__name__)
+
+# Matches the rolling 30-day window used by get_monthly_message_usage().
+WINDOW_DAYS = 30
+# Keys outlive the window so a day is never missing while it still counts.
+COUNTER_TTL_SECONDS = (WINDOW_DAYS + 5) * 24 * 60 * 60
+DIRTY_SET_KEY = "usage:messages:dirty"
+FLUSH_BATCH_SIZE = 500
+
+
+def _counter_key(subscription_id: str, day: date) -> str:
+    return f"usage:messages:{subscription_id}:{day.isoformat()}"
+
+
+def _window_days(today: Optional[date] = None) -> List[date]:
+    today = today or timezone.now().date()
+    return [today - timedelta(days=offset) for offset in range(WINDOW_DAYS + 1)]
+
+
+# Adds to a day's counter and marks it for the next flush, but only if the
+# counter exists: a missing one (new day, eviction, expiry) is first seeded
+# from billing.Usage so the flush never writes a total that lost the rows
+# already stored. KEYS: counter, dirty set. ARGV: amount, TTL, dirty member.
+# Returns the new total, or nil when the counter needs seeding.
+INCREMENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local total = redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('SADD', KEYS[2], ARGV[3])
+return total
+"""
+
+
+def _increment_args(subscription_id, amount: int):
+    today = timezone.now().date()
+    keys = [_counter_key(subscription_id, today), DIRTY_SET_KEY]
+    return today, keys, [amount, COUNTER_TTL_SECONDS, f"{subscription_id}|{today.isoformat()}"]
+
+
+def _load_stored_counts(subscription_id: str, days: List[date]) -> dict:
+    rows = Usage.objects.filter(subscription_id=subscription_id, date__in=days).values_list('date', 'messages_count')
+    return dict(rows)
+
+
+async def increment_message_count(subscription_id, amount: int = 1) -> int:
+    """
+    Atomically adds to today's message counter and marks it for the next
+    flush into billing.Usage. Returns the new daily total.
+    """
+    subscription_id = str(subscription_id)
+    today, keys, args = _increment_args(subscription_id, amount)
+    redis = get_async_redis()
+    script = redis.register_script(INCREMENT_SCRIPT)
+    total = await script(keys=keys, args=args)
+    if total is None:
+        stored = await database_sync_to_async(_load_stored_counts)(subscription_id, [today])
+        # NX: a concurrent increment may have seeded it already.
+        await redis.set(keys[0], stored.get(today, 0), ex=COUNTER_TTL_SECONDS, nx=True)
+        total = await script(keys=keys, args=args)
+    return int(total)
+
+
+def increment_message_count_sync(subscription_id, amount: int = 1) -> int:
+    """Same as increment_message_count(), for Celery workers."""
+    subscription_id = str(subscription_id)
+    today, keys, args = _increment_args(subscription_id, amount)
+    redis = get_redis()
+    script = redis.register_script(INCREMENT_SCRIPT)
+    total = script(keys=keys, args=args)
+    if total is None:
+        stored = _load_stored_counts(subscription_id, [today])
+        redis.set(keys[0], stored.get(today, 0), ex=COUNTER_TTL_SECONDS, nx=True)
+        total = script(keys=keys, args=args)
+    return int(total)
+
+
+async def get_rolling_message_count(subscription_id) -> int:
+    """
+    Returns the subscription's message count over the rolling window with a
+    single MGET. Days missing from Redis (first read, or after an eviction)
+    are seeded once from billing.Usage with SET NX, so a concurrent increment
+    is never overwritten. Falls back to summing billing.Usage if Redis is
+    unavailable.
+    """
+    subscription_id = str(subscription_id)
+    days = _window_days()
+    keys = [_counter_key(subscription_id, day) for day in days]
+    try:
+        redis = get_async_redis()
+        values = await redis.mget(keys)
+
+        missing = [day for day, value in zip(days, values) if value is None]
+        if missing:
+            stored = await database_sync_to_async(_load_stored_counts)(subscription_id, missing)
+            pipe = redis.pipeline(transaction=False)
+            for day in missing:
+                pipe.set(_counter_key(subscription_id, day), stored.get(day, 0), ex=COUNTER_TTL_SECONDS, nx=True)
+            await pipe.execute()
+            values = await redis.mget(keys)
+    except RedisError as e:
+        logger.warning(f"Usage counters unavailable, counting messages from billing.Usage: {e}")
+        return sum((await database_sync_to_async(_load_stored_counts)(subscription_id, days)).values())
+
+    return sum(int(value or 0) for value in values)
+
+
+def flush_message_counters() -> int:
+    """
+    Writes every counter touched since the last flush into billing.Usage with
+    one bulk upsert per batch. Counters are absolute daily totals (seeded
+    from billing.Usage before their first increment), so a flush that is
+    retried or races another one converges to the same rows.
+    """
+    redis = get_redis()
+    flushed = 0
+    while True:
+        members = redis.spop(DIRTY_SET_KEY, FLUSH_BATCH_SIZE)
+        if not members:
+            break
+        members = [m.decode() if isinstance(m, bytes) else m for m in members]
+        entries = [member.split('|', 1) for member in members]
+        values = redis.mget([_counter_key(sid, date.fromisoformat(day)) for sid, day in entries])
+        existing = {
+            str(pk) for pk in Subscription.objects.filter(id__in={sid for sid, _ in entries}).values_list('id', flat=True)
+        }
+
+        # A counter that was evicted and reseeded can trail what is already
+        # stored; never let a flush lower a stored count.
+        stored = {
+            (str(sid), day): count for sid, day, count in Usage.objects.filter(
+                subscription_id__in=existing, date__in={date.fromisoformat(day) for _, day in entries},
+            ).values_list('subscription_id', 'date', 'messages_count')
+        }
+        rows = [
+            Usage(
+                subscription_id=sid, date=date.fromisoformat(day),
+                messages_count=max(int(value), stored.get((sid, date.fromisoformat(day)), 0)),
+            )
+            for (sid, day), value in zip(entries, values)
+            if value is not None and sid in existing
+        ]
+        try:
+            Usage.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['subscription', 'date'],
+                update_fields=['messages_count'],
+            )
+        except Exception:
+            redis.sadd(DIRTY_SET_KEY, *members)
+            raise
+        flushed += len(rows)
+    return flushed
@@ -1,81 +1,363 @@
+import asyncio
+import base64
 import json
 import logging
+import socket
+import time
 import uuid
+from datetime import datetime
+from urllib.parse import parse_qs
+import msgpack
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
 from django.utils import timezone
-from core.models import Agent, Conversation, Message, KnowledgeBase
-from core.services.lyzr_client import LyzrClient, LyzrAPIError
-from billing.models import Subscription, Usage
+from core.models import Conversation, Message
+from core.services.lyzr_client import LyzrAPIError, LyzrStreamingUnsupported, get_async_lyzr_client
+from core.services.agent_runtime import get_agent_runtime
+from core.services.client_message_ids import claim_client_message, record_reply, release_client_message
+from core.services.connection_monitor import get_connection_monitor
+from core.services.rate_limit import chat_message_limits, check_rate, client_ip, widget_request_limits
+from core.services.presence import count_subscribers, join_session, leave_session, refresh_session
+from core.services.session_turns import queue_turn, release_turn, session_turn
+from core.services.metrics import aincr
+from core.services.message_buffer import build_message, get_message_buffer
+from core.services.response_cache import get_cached_response, store_response
+from billing.usage_counters import get_rolling_message_count, increment_message_count
 from tickets.models import Ticket
 from tickets.tasks import create_ticket_from_conversation_task
-from billing.utils import get_monthly_message_usage
+from core.tasks import run_chat_inference_task
 
 logger = logging.getLogger(__name__)
 
 ESCALATION_KEYWORDS = ['/raise_ticket', '/create_ticket', 'create ticket', 'raise ticket']
 
+# Close codes sent when the server reaps a socket.
+CLOSE_IDLE = 4001
+CLOSE_UNRESPONSIVE = 4002
+CLOSE_RATE_LIMITED = 4029
+SOCKET_METRICS_GROUP = f"chat_sockets:{socket.gethostname()}"
+
+# Lyzr agents whose inference backend rejected a streaming request; they get
+# single-frame replies for the lifetime of this process.
+STREAMING_UNSUPPORTED_AGENTS = set()
+
+
+def serialize_message(msg: Message) -> dict:
+    return {
+        'id': str(msg.id),
+        'sender': msg.sender_type,
+        'content': msg.content,
+        'feedback': msg.feedback,
+    }
+
+
+def encode_history_cursor(msg: Message) -> str:
+    raw = f"{msg.created_at.isoformat()}|{msg.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_history_cursor(cursor: str):
+    """Returns the (created_at, id) keyset position, or None if the cursor is malformed."""
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(message_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+class ConnectionState:
+    """
+    Everything a ChatConsumer keeps per socket. Slotted and limited to ids
+    and flags: agent details live in the AgentRuntime snapshot shared by all
+    sockets on the agent, and the message queue is only created once the
+    client sends something, so idle widget sockets stay small.
+    """
+    __slots__ = (
+        'agent_id', 'session_id', 'conversation_id', 'runtime', 'stream_requested', 'msgpack_frames',
+        'client_ip', 'has_context', 'counted_in_session', 'subscribers', 'queue', 'worker',
+        'last_seen', 'last_activity', 'group_joined_at', 'answers_pings',
+    )
+
+    def __init__(self, agent_id: str, session_id: str, stream_requested: bool, msgpack_frames: bool = False):
+        self.agent_id = agent_id
+        self.session_id = session_id
+        self.conversation_id = None
+        self.runtime = None
+        self.stream_requested = stream_requested
+        # Set by ?encoding=msgpack: server frames go out as binary msgpack.
+        self.msgpack_frames = msgpack_frames
+        self.client_ip = None
+        # Whether earlier turns could shape the next answer; see handle_user_message.
+        self.has_context = False
+        self.counted_in_session = False
+        # Sockets in the session across all nodes as last known, None if unknown.
+        self.subscribers = None
+        self.queue = None
+        self.worker = None
+        # time.monotonic() of the last frame of any kind, the last user action
+        # and the last group_add; see ChatConsumer.check_liveness.
+        self.last_seen = self.last_activity = self.group_joined_at = time.monotonic()
+        self.answers_pings = False
+
+
 class ChatConsumer(AsyncJsonWebsocketConsumer):
+    state = None
+
+    @property
+    def room_group_name(self) -> str:
+        return f'chat_{self.state.session_id}'
+
     async def connect(self):
-        self.agent_id = self.scope['url_route']['kwargs']['agent_id']
-        self.session_id = self.scope['url_route']['kwargs']['session_id']
-        self.room_group_name = f'chat_{self.session_id}'
+        query_params = parse_qs(self.scope.get('query_string', b'').decode())
+        last_seen_message_id = query_params.get('last_seen_message_id', [None])[0]
+        self.state = ConnectionState(
+            agent_id=self.scope['url_route']['kwargs']['agent_id'],
+            session_id=self.scope['url_route']['kwargs']['session_id'],
+            stream_requested=query_params.get('stream', ['0'])[0] in ('1', 'true'),
+            msgpack_frames=query_params.get('encoding', [''])[0] == 'msgpack',
+        )
+        self.state.client_ip = client_ip(self.scope)
 
         try:
-            self.agent = await self.get_agent(self.agent_id)
-            if not self.agent or not self.agent.is_active or not self.agent.lyzr_agent_id:
-                logger.warning(f"Connection denied for agent_id '{self.agent_id}': Agent not found, inactive, or not configured.")
+            self.state.runtime = await get_agent_runtime(self.state.agent_id)
+            if not self.state.runtime or not self.state.runtime.is_ready:
+                logger.warning(f"Connection denied for agent_id '{self.state.agent_id}': Agent not found, inactive, or not configured.")
                 await self.close(code=4004)
                 return
 
-            self.conversation = await self.get_or_create_conversation(self.agent.id, self.session_id)
+            if await check_rate(widget_request_limits(
+                self.state.agent_id, self.state.runtime.widget_requests_per_minute, self.state.client_ip
+            )):
+                logger.warning(f"Connection rate limited for agent '{self.state.agent_id}' from {self.state.client_ip}.")
+                await aincr(f"rate_limit:{self.state.agent_id}", 'connects_limited')
+                await self.close(code=CLOSE_RATE_LIMITED)
+                return
+
+            self.state.has_context = bool(last_seen_message_id)
+            self.state.conversation_id, missed_messages, history_page = await self.open_conversation(last_seen_message_id)
+            if await self.flush_pending_messages():
+                # Part of this conversation was still buffered; read it again now that it's written.
+                missed_messages, history_page = await self.get_catch_up(last_seen_message_id)
             
             await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+            subscribers = await join_session(self.state.session_id)
+            self.state.counted_in_session = subscribers is not None
+            self.state.subscribers = subscribers
+            if subscribers == 2:
+                # The socket already here may be sending straight to itself.
+                await self.notify_subscribers_changed()
             
             await self.accept()
-            logger.info(f"WebSocket connected for agent '{self.agent_id}' in session '{self.session_id}'.")
+            get_connection_monitor().register(self)
+            logger.info(f"WebSocket connected for agent '{self.state.agent_id}' in session '{self.state.session_id}'.")
             
-            await self.send_message_history()
+            await self.send_catch_up(missed_messages, history_page, reset=bool(last_seen_message_id))
 
         except Exception as e:
-            logger.error(f"Unexpected error during connect for agent '{self.agent_id}': {e}", exc_info=True)
+            logger.error(f"Unexpected error during connect for agent '{self.state.agent_id}': {e}", exc_info=True)
             await self.close()
 
     async def disconnect(self, close_code):
-        if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-        logger.info(f"WebSocket disconnected for session '{self.session_id}' with code: {close_code}")
+        if self.state is None:
+            return
+        get_connection_monitor().unregister(self)
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if self.state.counted_in_session:
+            remaining = await leave_session(self.state.session_id)
+            if remaining == 1:
+                # The socket left behind can go back to sending straight to itself.
+                await self.notify_subscribers_changed()
+        else:
+            # Never counted in, as Redis was down at connect: anyone counted now is another socket.
+            remaining = await count_subscribers(self.state.session_id)
+        # This socket no longer receives anything, and the session_subscribers
+        # events that would update the count are dropped from now on: replies
+        # still being generated must reach the other tabs through the group.
+        self.state.subscribers = None
+        worker = self.state.worker
+        # With another tab still in the group the replies have somewhere to
+        # go; otherwise, or when that can't be known, stop paying for
+        # inference nobody is known to be waiting for.
+        if not remaining and worker is not None and not worker.done():
+            logger.info(f"No subscribers known in session '{self.state.session_id}', cancelling pending replies.")
+            worker.cancel()
+        logger.info(f"WebSocket disconnected for session '{self.state.session_id}' with code: {close_code}")
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        # Clients that asked for msgpack may send binary frames as well as JSON text.
+        if bytes_data is not None and not text_data and self.state is not None and self.state.msgpack_frames:
+            await self.receive_json(msgpack.unpackb(bytes_data))
+        else:
+            await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
+    async def send_json(self, content, close=False):
+        """
+        Sends an event to this socket's client: JSON text by default, or one
+        binary msgpack frame for clients that connected with ?encoding=msgpack,
+        which is smaller and cheaper to encode for history pages and streams.
+        """
+        if self.state is not None and self.state.msgpack_frames:
+            await self.send(bytes_data=msgpack.packb(content), close=close)
+        else:
+            await super().send_json(content, close=close)
 
     async def receive_json(self, content):
         event_type = content.get('event_type')
+        now = time.monotonic()
+        self.state.last_seen = now
+
+        if event_type == 'pong':
+            self.state.answers_pings = True
+            return
+        if event_type == 'ping':
+            await self.send_json({'event_type': 'pong'})
+            return
+
+        self.state.last_activity = now
         
         handlers = {
-            'user_message': self.handle_user_message,
+            'user_message': self.enqueue_user_message,
             'feedback': self.handle_feedback,
             'escalate_to_ticket': self.handle_escalation,
+            'load_history': self.handle_load_history,
+            'resume': self.handle_resume,
         }
         
         handler = handlers.get(event_type)
         if handler:
             await handler(content)
         else:
-            logger.warning(f"Unknown event type received in session '{self.session_id}': {event_type}")
+            logger.warning(f"Unknown event type received in session '{self.state.session_id}': {event_type}")
+
 
+    async def check_liveness(self, now: float):
+        """
+        Called by the connection monitor every CHAT_HEARTBEAT_INTERVAL. Closes
+        sockets whose client stopped answering pings, or that have seen no
+        user activity for CHAT_IDLE_TIMEOUT while nothing is being answered;
+        otherwise sends the next ping, renewing the socket's group membership,
+        and its count in the session, once half of CHAT_GROUP_EXPIRY has
+        passed since the last group_add.
+        Clients that never answered a ping (older widget builds) are only
+        subject to the idle timeout.
+        """
+        state = self.state
+        busy = state.worker is not None and not state.worker.done()
+        if state.answers_pings and now - state.last_seen > settings.CHAT_HEARTBEAT_TIMEOUT:
+            await self.reap('unresponsive', CLOSE_UNRESPONSIVE)
+        elif not busy and now - state.last_activity > settings.CHAT_IDLE_TIMEOUT:
+            await self.reap('idle', CLOSE_IDLE)
+        else:
+            # channel_layer counts the expiry from the group_add, however busy the socket is.
+            if now - state.group_joined_at > settings.CHAT_GROUP_EXPIRY / 2:
+                state.group_joined_at = now
+                await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+                if state.counted_in_session:
+                    await refresh_session(state.session_id)
+            await self.send_json({'event_type': 'ping'})
+
+    async def reap(self, reason: str, code: int):
+        logger.info(f"Closing {reason} WebSocket in session '{self.state.session_id}'.")
+        get_connection_monitor().unregister(self)
+        await aincr(SOCKET_METRICS_GROUP, f'reaped_{reason}')
+        await self.close(code=code)
+
+    async def enqueue_user_message(self, event_data):
+        """
+        Queues a user message behind any still being answered in the session,
+        from this socket or any other, so replies come back in order and
+        other events aren't held up meanwhile; each is answered in its turn
+        (see session_turns). Once CHAT_SESSION_QUEUE_DEPTH messages are
+        waiting in the session, or the agent, session or client address is
+        over its message rate, new ones are refused.
+        """
+        if await check_rate(chat_message_limits(
+            self.state.agent_id, self.state.runtime.messages_per_minute, self.state.session_id, self.state.client_ip
+        )):
+            logger.warning(f"Message rate limited in session '{self.state.session_id}' from {self.state.client_ip}.")
+            await aincr(f"rate_limit:{self.state.agent_id}", 'messages_limited')
+            await self.send_system_message(
+                "You're sending messages too quickly. Please wait a moment and try again.",
+                reply_to=event_data.get('client_message_id'),
+            )
+            return
+        admitted, ticket = await queue_turn(self.state.session_id)
+        if self.state.queue is None:
+            # Also the bound while Redis, and with it the session's queue, is unavailable.
+            self.state.queue = asyncio.Queue(maxsize=settings.CHAT_SESSION_QUEUE_DEPTH)
+        if not admitted or self.state.queue.full():
+            if admitted and ticket:
+                await release_turn(self.state.session_id, ticket)
+            logger.warning(f"User message queue full in session '{self.state.session_id}', rejecting message.")
+            await self.send_system_message(
+                "You're sending messages faster than I can answer. Please wait for a reply and try again.",
+                reply_to=event_data.get('client_message_id'),
+            )
+            return
+        self.state.queue.put_nowait((event_data, ticket))
+        if self.state.worker is None or self.state.worker.done():
+            self.state.worker = asyncio.ensure_future(self.process_user_messages())
+
+    async def process_user_messages(self):
+        """Answers queued messages one at a time and exits once the queue is empty."""
+        try:
+            while not self.state.queue.empty():
+                event_data, ticket = self.state.queue.get_nowait()
+                try:
+                    async with session_turn(self.state.session_id, ticket) as turn:
+                        await self.handle_user_message(event_data, turn)
+                except Exception as e:
+                    logger.error(f"Failed to process user message in session '{self.state.session_id}': {e}", exc_info=True)
+        finally:
+            # Cancelled from disconnect(): give up the places of messages that won't be answered.
+            while not self.state.queue.empty():
+                _, ticket = self.state.queue.get_nowait()
+                if ticket:
+                    await release_turn(self.state.session_id, ticket)
 
     async def handle_escalation(self, event_data):
         """
         Handles a request from the user to create a ticket from the conversation.
         """
-        ticket_exists = await self.check_ticket_exists(self.conversation.id)
+        await self.flush_pending_messages()
+        ticket_exists = await self.check_ticket_exists(self.state.conversation_id)
         if ticket_exists:
             await self.send_system_message("A support ticket has already been created for this conversation.")
             return
 
-        create_ticket_from_conversation_task.delay(str(self.conversation.id))
+        create_ticket_from_conversation_task.delay(str(self.state.conversation_id))
         
         await self.send_system_message("We've received your request. A support ticket is being created...")
 
 
+    def sends_directly(self) -> bool:
+        return settings.CHAT_DIRECT_SEND and self.state.subscribers == 1
+
+    async def deliver(self, event: dict):
+        """
+        Hands a broadcast_* event to every socket in the session. Almost every
+        session has exactly one, and then the event goes straight to this
+        socket's handler with no channel-layer round trip; otherwise it goes
+        through the group.
+        """
+        if self.sends_directly():
+            await getattr(self, event['type'])(event)
+        else:
+            await self.channel_layer.group_send(self.room_group_name, event)
+
+    async def notify_subscribers_changed(self):
+        await self.channel_layer.group_send(self.room_group_name, {'type': 'session_subscribers'})
+
+    async def session_subscribers(self, event):
+        """
+        A socket joined or left the session somewhere. The count is re-read
+        rather than carried in the event, since joins and leaves from
+        different nodes can arrive out of order.
+        """
+        self.state.subscribers = await count_subscribers(self.state.session_id)
+
     async def ticket_created_message(self, event):
         """
         Receives the confirmation from the background task and sends it to the client.
@@ -85,25 +367,23 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             'message': event['message']
         })
         
-    @database_sync_to_async
-    def is_message_limit_exceeded(self):
-        try:
-            subscription = self.agent.user.subscription
-            plan = subscription.plan
-            limit = plan.features.get('messages', 0)
-            
-            if isinstance(limit, str) and limit.lower() == 'unlimited':
-                return False
-
-            current_usage = get_monthly_message_usage(subscription)
-            return current_usage >= limit
-        except (Subscription.DoesNotExist, AttributeError):
+    async def is_message_limit_exceeded(self):
+        if not self.state.runtime.subscription_id or not self.state.runtime.has_plan:
             return True
+        if self.state.runtime.message_limit is None:
+            return False
+        return await get_rolling_message_count(self.state.runtime.subscription_id) >= self.state.runtime.message_limit
         
-    async def handle_user_message(self, event_data):
+    async def handle_user_message(self, event_data, turn=None):
         message_text = event_data.get('message', '').strip()
         if not message_text:
             return
+
+        # Refreshed per message so agent edits apply without reconnecting.
+        self.state.runtime = await get_agent_runtime(self.state.agent_id)
+        if not self.state.runtime or not self.state.runtime.is_ready:
+            await self.send_system_message("This assistant is currently unavailable.")
+            return
         
         if await self.is_message_limit_exceeded():
             limit_message = {
@@ -111,10 +391,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 'sender': 'SYSTEM',
                 'content': "You have reached your monthly message limit. Please upgrade your plan to continue chatting."
             }
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {'type': 'broadcast_message', 'message': limit_message}
-            )
+            await self.deliver({'type': 'broadcast_message', 'message': limit_message})
             return 
 
 
@@ -123,43 +400,174 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             await self.handle_escalation(event_data) 
             return
 
-        await self.save_message('USER', message_text)
+        # A client resending after a reconnect gets the original reply (or,
+        # while it's still being generated, the group broadcast) rather than
+        # a second inference call.
+        client_message_id = str(event_data.get('client_message_id') or '')[:64] or None
+        if client_message_id:
+            is_new, previous_reply = await claim_client_message(self.state.session_id, client_message_id)
+            if not is_new:
+                logger.info(f"Duplicate client message '{client_message_id}' in session '{self.state.session_id}'.")
+                if previous_reply is not None:
+                    await self.send_json({'event_type': 'new_message', 'message': previous_reply})
+                return
+
+        # Only opening questions are answered from the cache: once the
+        # conversation has history the model's reply may depend on it.
+        use_cache = self.state.runtime.response_cache_enabled and not self.state.has_context
+        if self.state.runtime.response_cache_enabled and self.state.has_context:
+            await aincr(f"response_cache:{self.state.agent_id}", 'bypasses')
+        self.state.has_context = True
+
+        # The user's message is written (and counted) while the inference call
+        # is in flight; its timestamp is taken now so the transcript order holds.
+        user_message_task = asyncio.ensure_future(
+            self.save_user_message(message_text, timezone.now(), client_message_id)
+        )
         
         try:
-            client = LyzrClient()
-            rag_id = await self.get_rag_id(self.agent)
-
-            response_data = await database_sync_to_async(client.get_chat_response)(
-                agent_id=self.agent.lyzr_agent_id,
-                session_id=self.session_id,
-                message=message_text,
-                user_email=self.session_id,
-                rag_id=rag_id
-            )
-            
-            ai_content = response_data.get('response', "I'm sorry, I encountered an error and couldn't respond.")
-            
-            ai_message_obj = await self.save_message('AI', ai_content)
-
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'broadcast_message',
-                    'message': {
-                        'id': str(ai_message_obj.id),
-                        'sender': 'AI',
-                        'content': ai_content,
-                        'feedback': None
-                    }
-                }
-            )
+            if use_cache:
+                cached_content = await get_cached_response(self.state.agent_id, message_text)
+                if cached_content is not None:
+                    await self.send_ai_message(cached_content, user_message_task, client_message_id)
+                    return
+
+            request_kwargs = {
+                'agent_id': self.state.runtime.lyzr_agent_id,
+                'session_id': self.state.session_id,
+                'message': message_text,
+                'user_email': self.state.session_id,
+                'rag_id': self.state.runtime.rag_id,
+            }
+
+            if settings.CHAT_INFERENCE_MODE == 'worker':
+                # The reply comes back as a broadcast_message, sent to this
+                # socket's channel when it's alone in the session. The task
+                # holds the session's turn until it has replied.
+                run_chat_inference_task.delay(
+                    str(self.state.conversation_id), self.state.session_id, self.state.agent_id, request_kwargs,
+                    subscription_id=self.state.runtime.subscription_id if self.state.runtime.subscription_status == 'ACTIVE' else None,
+                    cache_response=use_cache,
+                    client_message_id=client_message_id,
+                    reply_channel=self.channel_name if self.sends_directly() else None,
+                    turn_ticket=turn.ticket if turn else None,
+                )
+                if turn:
+                    turn.hand_off()
+                return
+
+            client = get_async_lyzr_client()
+
+            ai_content = None
+            if self.should_stream():
+                ai_content = await self.stream_ai_response(client, request_kwargs, user_message_task, client_message_id)
+
+            if ai_content is None:
+                response_data = await client.get_chat_response(**request_kwargs)
+                ai_content = response_data.get('response')
+                await self.send_ai_message(
+                    ai_content or "I'm sorry, I encountered an error and couldn't respond.",
+                    user_message_task,
+                    client_message_id,
+                )
+
+            if use_cache and ai_content:
+                await store_response(self.state.agent_id, message_text, ai_content)
 
         except LyzrAPIError as e:
-            logger.error(f"Lyzr API Error for agent '{self.agent.id}': {e}")
-            await self.send_error_message("My apologies, I'm having trouble connecting to my core functions right now. Please try again in a moment.")
+            logger.error(f"Lyzr API Error for agent '{self.state.agent_id}': {e}")
+            await self.fail_user_message(
+                "My apologies, I'm having trouble connecting to my core functions right now. Please try again in a moment.",
+                client_message_id,
+            )
+        except Exception as e:
+            logger.error(f"General Error handling user message for agent '{self.state.agent_id}': {e}", exc_info=True)
+            await self.fail_user_message("An unexpected error occurred. Please try your message again.", client_message_id)
+        except asyncio.CancelledError:
+            # Cancelled from disconnect(); let a resend of this message run again.
+            if client_message_id:
+                await release_client_message(self.state.session_id, client_message_id)
+            raise
+        finally:
+            await user_message_task
+
+    async def fail_user_message(self, error_text: str, client_message_id=None):
+        if client_message_id:
+            await release_client_message(self.state.session_id, client_message_id)
+        await self.send_error_message(error_text, reply_to=client_message_id)
+
+    def build_ai_reply(self, message_id, content: str, client_message_id=None) -> dict:
+        """Payload of an AI reply; `reply_to` echoes the client id of the message it answers."""
+        reply = {'id': str(message_id), 'sender': 'AI', 'content': content, 'feedback': None}
+        if client_message_id:
+            reply['reply_to'] = client_message_id
+        return reply
+
+    async def send_ai_message(self, ai_content: str, user_message_task, client_message_id=None):
+        await user_message_task
+        ai_message_obj = await self.save_message('AI', ai_content)
+        reply = self.build_ai_reply(ai_message_obj.id, ai_content, client_message_id)
+
+        await self.deliver({'type': 'broadcast_message', 'message': reply})
+        if client_message_id:
+            await record_reply(self.state.session_id, client_message_id, reply)
+
+    async def save_user_message(self, message_text: str, created_at, client_message_id=None):
+        """
+        Persists the user's message without ever raising, so a failed write is
+        reported to the client but doesn't abort the reply being generated.
+        """
+        metadata = {'client_message_id': client_message_id} if client_message_id else None
+        try:
+            return await self.save_message('USER', message_text, created_at=created_at, metadata=metadata)
         except Exception as e:
-            logger.error(f"General Error handling user message for agent '{self.agent.id}': {e}", exc_info=True)
-            await self.send_error_message("An unexpected error occurred. Please try your message again.")
+            logger.error(f"Failed to save user message in session '{self.state.session_id}': {e}", exc_info=True)
+            await self.send_system_message("We couldn't save your last message to the conversation history.")
+            return None
+
+    def should_stream(self):
+        return (
+            self.state.stream_requested
+            and settings.LYZR_CHAT_STREAMING
+            and self.state.runtime.streaming_enabled
+            and self.state.runtime.lyzr_agent_id not in STREAMING_UNSUPPORTED_AGENTS
+        )
+
+    async def stream_ai_response(self, client, request_kwargs, user_message_task, client_message_id=None):
+        """
+        Forwards the reply to the session group as `message_chunk` events and
+        finishes with a `message_complete` carrying the persisted Message.
+        Returns the streamed text, or None, without having sent anything, when
+        the backend can't stream so the caller can fall back to a single-frame
+        reply. Other Lyzr errors (an open breaker, a queue timeout, a failed
+        or timed-out stream) are raised, not retried as a second full request,
+        after a `message_aborted` tells clients to drop any partial reply.
+        """
+        message_id = uuid.uuid4()
+        chunks = []
+        try:
+            async for chunk in client.stream_chat_response(**request_kwargs):
+                chunks.append(chunk)
+                await self.deliver({'type': 'broadcast_chunk', 'message_id': str(message_id), 'content': chunk})
+        except LyzrStreamingUnsupported as e:
+            logger.info(f"Streaming unavailable for Lyzr agent '{self.state.runtime.lyzr_agent_id}', falling back: {e}")
+            STREAMING_UNSUPPORTED_AGENTS.add(self.state.runtime.lyzr_agent_id)
+            return None
+        except Exception:
+            if chunks:
+                await self.deliver({'type': 'broadcast_abort', 'message_id': str(message_id)})
+            raise
+
+        streamed_content = ''.join(chunks)
+        ai_content = streamed_content or "I'm sorry, I encountered an error and couldn't respond."
+        await user_message_task
+        ai_message_obj = await self.save_message('AI', ai_content, message_id=message_id)
+        reply = self.build_ai_reply(ai_message_obj.id, ai_content, client_message_id)
+
+        await self.deliver({'type': 'broadcast_complete', 'message': reply})
+        if client_message_id:
+            await record_reply(self.state.session_id, client_message_id, reply)
+        return streamed_content
 
     async def handle_feedback(self, event_data):
         message_id = event_data.get('message_id')
@@ -168,7 +576,8 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         if not all([message_id, feedback]):
             logger.warning(f"Invalid feedback event received: {event_data}")
             return
-            
+
+        await self.flush_pending_messages()
         success = await self.save_feedback(message_id, feedback)
         
         if success:
@@ -177,13 +586,52 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 'message_id': message_id
             })
 
-    async def send_message_history(self):
-        messages = await self.get_message_history()
-        for msg in messages:
-            await self.send_json({
-                'event_type': 'new_message',
-                'message': msg
-            })
+    async def handle_load_history(self, event_data):
+        before = decode_history_cursor(event_data.get('cursor') or '')
+        if before is None:
+            logger.warning(f"Invalid history cursor received in session '{self.state.session_id}'.")
+            return
+        await self.send_message_history(before=before)
+
+    async def handle_resume(self, event_data):
+        await self.flush_pending_messages()
+        missed_messages, history_page = await self.get_catch_up(event_data.get('last_seen_message_id'))
+        await self.send_catch_up(missed_messages, history_page, reset=True)
+
+    async def send_catch_up(self, missed_messages, history_page, reset: bool):
+        """
+        Sends a `sync` frame with the messages the client hasn't seen yet. When
+        they can't be determined (unknown id, or more than
+        CHAT_RESUME_MAX_MESSAGES behind) the client gets a `reset`, if it had
+        asked to resume, followed by a fresh initial history page instead.
+        """
+        if missed_messages is not None:
+            await self.send_json({'event_type': 'sync', 'messages': missed_messages})
+            return
+        if reset:
+            await self.send_json({'event_type': 'reset'})
+        await self.send_history_page(*history_page, initial=True)
+
+    async def send_message_history(self, before=None):
+        """
+        Sends one `history` frame holding the latest page of messages (or the
+        page preceding `before`) in chronological order. `cursor` is passed
+        back in a `load_history` event to fetch the next older page.
+        """
+        await self.flush_pending_messages()
+        messages, cursor = await self.get_message_history(before=before)
+        await self.send_history_page(messages, cursor, initial=before is None)
+
+    async def send_history_page(self, messages, cursor, initial: bool):
+        if messages:
+            self.state.has_context = True
+        await self.send_json({
+            'event_type': 'history',
+            'messages': messages,
+            'cursor': cursor,
+            'has_more': cursor is not None,
+            'initial': initial,
+        })
 
     async def broadcast_message(self, event):
         await self.send_json({
@@ -191,84 +639,183 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             'message': event['message']
         })
 
-    async def send_system_message(self, text: str):
+    async def broadcast_chunk(self, event):
+        if not self.state.stream_requested:
+            return
         await self.send_json({
-            'event_type': 'new_message',
-            'message': {
-                'id': f'system_{uuid.uuid4()}',
-                'sender': 'SYSTEM',
-                'content': text,
-                'feedback': None,
-            }
+            'event_type': 'message_chunk',
+            'message_id': event['message_id'],
+            'content': event['content']
         })
-        
-    async def send_error_message(self, error_text: str):
+
+    async def broadcast_abort(self, event):
+        if not self.state.stream_requested:
+            return
         await self.send_json({
-            'event_type': 'new_message',
-            'message': {
-                'id': f'error_{uuid.uuid4()}',
-                'sender': 'AI',
-                'content': error_text,
-                'feedback': None,
-                'is_error': True
-            }
+            'event_type': 'message_aborted',
+            'message_id': event['message_id']
         })
 
+    async def broadcast_complete(self, event):
+        await self.send_json({
+            'event_type': 'message_complete' if self.state.stream_requested else 'new_message',
+            'message': event['message']
+        })
+
+    async def send_system_message(self, text: str, reply_to=None):
+        message = {
+            'id': f'system_{uuid.uuid4()}',
+            'sender': 'SYSTEM',
+            'content': text,
+            'feedback': None,
+        }
+        if reply_to:
+            message['reply_to'] = reply_to
+        await self.send_json({'event_type': 'new_message', 'message': message})
+        
+    async def send_error_message(self, error_text: str, reply_to=None):
+        message = {
+            'id': f'error_{uuid.uuid4()}',
+            'sender': 'AI',
+            'content': error_text,
+            'feedback': None,
+            'is_error': True
+        }
+        if reply_to:
+            message['reply_to'] = reply_to
+        await self.send_json({'event_type': 'new_message', 'message': message})
+
+    # Each chat event does its database work in a single thread hop: the
+    # @database_sync_to_async methods below are units of work built from the
+    # plain query_* helpers, not one hop per query.
+
     @database_sync_to_async
-    def get_agent(self, agent_id: str):
-        try:
-            return Agent.objects.select_related('knowledge_base', 'user__subscription').get(id=agent_id)
-        except Agent.DoesNotExist:
-            return None
+    def open_conversation(self, last_seen_message_id=None):
+        """
+        Everything connect() reads: the session's conversation, plus either the
+        messages after `last_seen_message_id` or, when there are none to resume
+        from, the initial history page. Returns (conversation_id,
+        missed_messages, history_page) with exactly one of the last two set.
+        """
+        conversation_id, missed_messages = None, None
+        if last_seen_message_id:
+            conversation_id, missed_messages = self.query_messages_since(last_seen_message_id)
+        if conversation_id is None:
+            conversation, created = Conversation.objects.get_or_create(
+                agent_id=self.state.agent_id,
+                end_user_id=self.state.session_id,
+            )
+            conversation_id = conversation.id
+            if created:
+                logger.info(f"Created new conversation '{conversation_id}' for session '{self.state.session_id}'.")
+        if missed_messages is not None:
+            return conversation_id, missed_messages, None
+        return conversation_id, None, self.query_history_page(conversation_id)
 
     @database_sync_to_async
-    def get_or_create_conversation(self, agent_id: uuid.UUID, session_id: str):
-        conversation, created = Conversation.objects.get_or_create(
-            agent_id=agent_id,
-            end_user_id=session_id,
+    def get_catch_up(self, last_seen_message_id):
+        """Returns (missed_messages, None), or (None, initial history page) if they can't be determined."""
+        missed_messages = None
+        if last_seen_message_id:
+            _, missed_messages = self.query_messages_since(last_seen_message_id)
+        if missed_messages is not None:
+            return missed_messages, None
+        return None, self.query_history_page(self.state.conversation_id)
+
+    async def save_message(self, sender: str, content: str, message_id: uuid.UUID = None, created_at=None, metadata=None):
+        msg, _ = await asyncio.gather(
+            self.persist_message(sender, content, message_id, created_at, metadata),
+            self.track_message_usage(),
         )
-        if created:
-            logger.info(f"Created new conversation '{conversation.id}' for session '{session_id}'.")
-        return conversation
+        return msg
+
+    async def persist_message(self, sender: str, content: str, message_id: uuid.UUID = None, created_at=None, metadata=None):
+        if settings.CHAT_MESSAGE_WRITE_BEHIND:
+            msg = build_message(self.state.conversation_id, sender, content, message_id, created_at, metadata)
+            get_message_buffer().add(msg)
+            return msg
+        return await self.create_message(sender, content, message_id, created_at, metadata)
+
+    async def flush_pending_messages(self) -> bool:
+        """
+        Makes this conversation's buffered writes visible before reading them
+        back, leaving other conversations' to the buffer's own batches.
+        Returns whether there were any.
+        """
+        if not settings.CHAT_MESSAGE_WRITE_BEHIND:
+            return False
+        buffer = get_message_buffer()
+        if not buffer.has_pending(self.state.conversation_id):
+            return False
+        await buffer.flush(conversation_id=self.state.conversation_id)
+        return True
 
     @database_sync_to_async
-    def save_message(self, sender: str, content: str):
+    def create_message(self, sender: str, content: str, message_id: uuid.UUID = None, created_at=None, metadata=None):
         msg = Message.objects.create(
-            conversation=self.conversation,
+            id=message_id or uuid.uuid4(),
+            conversation_id=self.state.conversation_id,
             sender_type=sender,
-            content=content
+            content=content,
+            created_at=created_at or timezone.now(),
+            metadata=metadata or {},
         )
-        self.conversation.updated_at = timezone.now()
-        self.conversation.save(update_fields=['updated_at'])
-        
+        Conversation.objects.filter(id=self.state.conversation_id).update(updated_at=timezone.now())
+        return msg
+
+    async def track_message_usage(self):
+        if self.state.runtime.subscription_status != 'ACTIVE':
+            if not self.state.runtime.subscription_id:
+                logger.warning(f"User {self.state.runtime.owner_email} has no subscription to track usage against.")
+            return
         try:
-            if hasattr(self.agent.user, 'subscription') and self.agent.user.subscription.status == 'ACTIVE':
-                usage, _ = Usage.objects.get_or_create(
-                    subscription=self.agent.user.subscription,
-                    date=timezone.now().date()
-                )
-                usage.messages_count += 1
-                usage.save()
-        except Subscription.DoesNotExist:
-            logger.warning(f"User {self.agent.user.email} has no subscription to track usage against.")
-            pass
+            await increment_message_count(self.state.runtime.subscription_id)
         except Exception as e:
-            logger.error(f"Could not track usage for user {self.agent.user.email}: {e}")
+            logger.error(f"Could not track usage for user {self.state.runtime.owner_email}: {e}")
 
-        return msg
+    def query_messages_since(self, last_seen_message_id: str):
+        """
+        Resolves the session's conversation from the last message the client saw
+        and returns its id with the messages stored after that one. Returns
+        (None, None) for an unknown id, and (conversation_id, None) when the gap
+        is larger than CHAT_RESUME_MAX_MESSAGES.
+        """
+        try:
+            last_seen = Message.objects.get(
+                id=last_seen_message_id,
+                conversation__agent_id=self.state.agent_id,
+                conversation__end_user_id=self.state.session_id,
+            )
+        except (Message.DoesNotExist, ValidationError, ValueError):
+            return None, None
+
+        limit = settings.CHAT_RESUME_MAX_MESSAGES
+        newer = list(
+            Message.objects.filter(conversation_id=last_seen.conversation_id)
+            .filter(Q(created_at__gt=last_seen.created_at) | Q(created_at=last_seen.created_at, id__gt=last_seen.id))
+            .order_by('created_at', 'id')[:limit + 1]
+        )
+        if len(newer) > limit:
+            return last_seen.conversation_id, None
+        return last_seen.conversation_id, [serialize_message(msg) for msg in newer]
 
     @database_sync_to_async
-    def get_message_history(self):
-        messages = Message.objects.filter(conversation=self.conversation).order_by('created_at')
-        return [
-            {
-                'id': str(msg.id),
-                'sender': msg.sender_type,
-                'content': msg.content,
-                'feedback': msg.feedback,
-            }
-            for msg in messages
-        ]
+    def get_message_history(self, before=None):
+        return self.query_history_page(self.state.conversation_id, before)
+
+    def query_history_page(self, conversation_id, before=None, limit=None):
+        limit = limit or settings.CHAT_HISTORY_PAGE_SIZE
+        queryset = Message.objects.filter(conversation_id=conversation_id)
+        if before:
+            created_at, message_id = before
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id)
+            )
+        page = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit][::-1]
+        cursor = encode_history_cursor(page[0]) if has_more else None
+        return [serialize_message(msg) for msg in page], cursor
 
     @database_sync_to_async
     def save_feedback(self, message_id: str, feedback: str):
@@ -276,25 +823,19 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             if feedback not in [Message.Feedback.POSITIVE, Message.Feedback.NEGATIVE]:
                 return False
                 
-            message = Message.objects.get(id=message_id, conversation=self.conversation)
-            message.feedback = feedback
-            message.save()
+            updated = Message.objects.filter(id=message_id, conversation_id=self.state.conversation_id).update(feedback=feedback)
+            if not updated:
+                logger.warning(f"Attempted to save feedback for non-existent message_id: {message_id}")
+                return False
             logger.info(f"Feedback '{feedback}' saved for message '{message_id}'.")
             return True
-        except Message.DoesNotExist:
-            logger.warning(f"Attempted to save feedback for non-existent message_id: {message_id}")
+        except ValidationError:
+            logger.warning(f"Attempted to save feedback for invalid message_id: {message_id}")
             return False
         except Exception as e:
             logger.error(f"Error saving feedback for message '{message_id}': {e}")
             return False
 
-    @database_sync_to_async
-    def get_rag_id(self, agent: Agent):
-        try:
-            return agent.knowledge_base.lyzr_rag_id
-        except KnowledgeBase.DoesNotExist:
-            return None
-        
     @database_sync_to_async
     def check_ticket_exists(self, conversation_id: uuid.UUID):
         return Ticket.objects.filter(conversation_id=conversation_id).exists()
\ No newline at end of file
@@ -0,0 +1,57 @@
+"""
+The ASGI application bench_chat_load serves with Daphne: lyzr_backend.asgi's,
+counting the database_sync_to_async thread hops and database queries of the
+whole server process, read with a GET of SERVER_DATABASE_PATH. A server you
+load with `bench_chat_load --url` reports them too if it serves
+`core.management.bench_server:application`.
+"""
+import json
+import threading
+from channels.db import DatabaseSyncToAsync
+from django.db.backends.signals import connection_created
+from lyzr_backend.asgi import application as chat_application
+from core.management.benchmark_fixtures import SERVER_DATABASE_PATH
+
+
+class DatabaseCounter:
+    """Thread hops and queries across all threads; its instances are connection execute wrappers."""
+    def __init__(self):
+        self.hops = 0
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+    def count_hop(self):
+        with self._lock:
+            self.hops += 1
+
+
+counter = DatabaseCounter()
+_thread_handler = DatabaseSyncToAsync.thread_handler
+
+
+def _counting_thread_handler(handler_self, loop, *args, **kwargs):
+    counter.count_hop()
+    return _thread_handler(handler_self, loop, *args, **kwargs)
+
+
+def _count_queries(sender, connection, **kwargs):
+    # Database connections are per thread and reopened per request, so each one is wrapped as it opens.
+    connection.execute_wrappers.append(counter)
+
+
+DatabaseSyncToAsync.thread_handler = _counting_thread_handler
+connection_created.connect(_count_queries)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == SERVER_DATABASE_PATH:
+        body = json.dumps({'hops': counter.hops, 'queries': counter.queries}).encode()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+        return
+    await chat_application(scope, receive, send)
@@ -0,0 +1,47 @@
+import uuid
+from contextlib import contextmanager
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from billing.models import Plan, Subscription
+from core.models import Agent, KnowledgeBase, User
+from core.routing import websocket_urlpatterns
+
+# The websocket side of lyzr_backend.asgi, for in-process benchmarks.
+chat_application = URLRouter(websocket_urlpatterns)
+# Where core.management.bench_server reports its database counts.
+SERVER_DATABASE_PATH = '/bench/database'
+
+
+@contextmanager
+def benchmark_agent(plan_features=None, **agent_fields):
+    """
+    Yields a throwaway active agent (with an owner, an active unlimited plan
+    and a knowledge base) and deletes all of it, conversations included, on
+    exit; `plan_features` override the plan's unlimited features and
+    `agent_fields` the Agent defaults. Benchmarks write real rows, so run
+    them against a development database.
+    """
+    suffix = uuid.uuid4().hex[:12]
+    user = User.objects.create_user(email=f"bench-{suffix}@example.invalid", password=None)
+    plan = Plan.objects.create(name=f"bench-{suffix}", price=0, features={
+        'messages': 'unlimited', 'messages_per_minute': 'unlimited', 'widget_requests_per_minute': 'unlimited',
+        **(plan_features or {}),
+    })
+    try:
+        Subscription.objects.create(user=user, plan=plan, status=Subscription.SubscriptionStatus.ACTIVE)
+        agent = Agent.objects.create(user=user, name="Benchmark agent", lyzr_agent_id=f"bench-{suffix}", **agent_fields)
+        KnowledgeBase.objects.create(agent=agent, collection_name=f"bench_{suffix}", lyzr_rag_id=f"bench-{suffix}")
+        yield Agent.objects.select_related('user').get(id=agent.id)
+    finally:
+        user.delete()
+        plan.delete()
+
+
+async def open_chat_socket(agent, session_id: str, application=chat_application) -> WebsocketCommunicator:
+    """Connects an in-process chat socket for `session_id` and reads its first frame."""
+    communicator = WebsocketCommunicator(application, f"/ws/chat/{agent.id}/{session_id}/")
+    connected, _ = await communicator.connect()
+    if not connected:
+        raise RuntimeError(f"Benchmark socket for session '{session_id}' was refused.")
+    await communicator.receive_json_from()
+    return communicator
@@ -0,0 +1,194 @@
+"""
+Simulated widget clients on real WebSocket connections, for bench_chat_load.
+Runs as its own process (`python -m core.management.chat_load_clients
+CONFIG_JSON`) without Django: setting Django up selects Twisted for
+autobahn, while these clients use its asyncio flavour. It prints one JSON
+line as the chat phase starts and another with the results.
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+from urllib.parse import urlsplit
+from autobahn.asyncio.websocket import WebSocketClientFactory, WebSocketClientProtocol
+
+
+class LoadStats:
+    def __init__(self):
+        self.connect_ms = []
+        self.reply_ms = []
+        self.first_chunk_ms = []
+        self.outcomes = Counter()
+
+
+class JsonSocket(WebSocketClientProtocol):
+    """A WebSocket client (autobahn, which Daphne itself is built on) whose JSON frames are awaited from an inbox."""
+    def __init__(self):
+        super().__init__()
+        loop = asyncio.get_running_loop()
+        self.opened = loop.create_future()
+        self.closed = loop.create_future()
+        self.inbox = asyncio.Queue()
+
+    def onOpen(self):
+        self.opened.set_result(True)
+
+    def onMessage(self, payload, isBinary):
+        self.inbox.put_nowait(json.loads(payload))
+
+    def onClose(self, wasClean, code, reason):
+        if not self.opened.done():
+            self.opened.set_result(False)
+        self.closed.set_result(True)
+        # Wakes a reader waiting on a socket the server has closed.
+        self.inbox.put_nowait(None)
+
+    def send_json(self, content: dict):
+        self.sendMessage(json.dumps(content).encode())
+
+    async def receive_json(self, timeout: float) -> dict:
+        event = await asyncio.wait_for(self.inbox.get(), timeout)
+        if event is None:
+            raise ConnectionError("Server closed the socket")
+        return event
+
+
+async def open_socket(url: str, timeout: float) -> Optional[JsonSocket]:
+    """Connects to `url` (ws:// or wss://); None if the server refused the handshake."""
+    parts = urlsplit(url)
+    factory = WebSocketClientFactory(url)
+    factory.protocol = JsonSocket
+    secure = parts.scheme == 'wss'
+    _, protocol = await asyncio.wait_for(
+        asyncio.get_running_loop().create_connection(
+            factory, parts.hostname, parts.port or (443 if secure else 80), ssl=secure or None,
+        ),
+        timeout,
+    )
+    if not await asyncio.wait_for(protocol.opened, timeout):
+        return None
+    return protocol
+
+
+class SimulatedClient:
+    """One widget: connects, then sends a message every `interval` seconds, waiting for each reply."""
+    def __init__(self, server_url: str, agent_id: str, index: int, stream: bool, stats: LoadStats, rng: random.Random):
+        self.session_id = f"load-{index}-{uuid.uuid4()}"
+        self.url = f"{server_url.rstrip('/')}/ws/chat/{agent_id}/{self.session_id}/" + ("?stream=1" if stream else "")
+        self.stats = stats
+        self.rng = rng
+        self.socket = None
+
+    async def connect(self, delay: float) -> bool:
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        try:
+            self.socket = await open_socket(self.url, timeout=30)
+            if self.socket is not None:
+                await self.socket.receive_json(timeout=30)
+        except (asyncio.TimeoutError, OSError):
+            self.socket = None
+        if self.socket is None:
+            self.stats.outcomes['connect_failed'] += 1
+            return False
+        self.stats.connect_ms.append((time.perf_counter() - started) * 1000)
+        return True
+
+    async def chat(self, interval: float, until: float, reply_timeout: float):
+        # Clients start out of phase so sends aren't synchronized.
+        next_send = time.perf_counter() + self.rng.uniform(0, interval)
+        turn = 0
+        while True:
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            if time.perf_counter() >= until:
+                return
+            next_send += interval
+            turn += 1
+            if not await self.turn(f"Load test question {turn} from {self.session_id}", reply_timeout):
+                return
+
+    async def turn(self, text: str, reply_timeout: float) -> bool:
+        """One message and its reply; False once the socket is gone."""
+        client_message_id = str(uuid.uuid4())
+        started = time.perf_counter()
+        self.socket.send_json({'event_type': 'user_message', 'message': text, 'client_message_id': client_message_id})
+        self.stats.outcomes['sent'] += 1
+        first_chunk = None
+        try:
+            while True:
+                event = await self.socket.receive_json(timeout=reply_timeout)
+                if event.get('event_type') == 'message_chunk' and first_chunk is None:
+                    first_chunk = time.perf_counter()
+                message = event.get('message') or {}
+                if message.get('reply_to') != client_message_id:
+                    continue
+                if message.get('is_error'):
+                    self.stats.outcomes['error_reply'] += 1
+                elif message.get('sender') == 'SYSTEM':
+                    self.stats.outcomes['refused'] += 1
+                else:
+                    self.stats.outcomes['replied'] += 1
+                    self.stats.reply_ms.append((time.perf_counter() - started) * 1000)
+                    if first_chunk is not None:
+                        self.stats.first_chunk_ms.append((first_chunk - started) * 1000)
+                return True
+        except asyncio.TimeoutError:
+            self.stats.outcomes['timed_out'] += 1
+            return True
+        except ConnectionError:
+            self.stats.outcomes['disconnected'] += 1
+            return False
+
+    async def close(self):
+        if self.socket is not None and not self.socket.closed.done():
+            self.socket.sendClose()
+            try:
+                await asyncio.wait_for(self.socket.closed, 5)
+            except asyncio.TimeoutError:
+                pass
+
+
+def emit(**fields):
+    print(json.dumps(fields), flush=True)
+
+
+async def run(config: dict):
+    """
+    `config`: url, agent_id, clients, rate (messages per minute per client),
+    duration, ramp, stream, reply_timeout, seed.
+    """
+    stats = LoadStats()
+    rng = random.Random(config['seed'])
+    clients = [
+        SimulatedClient(config['url'], config['agent_id'], i, config['stream'], stats, rng)
+        for i in range(config['clients'])
+    ]
+    spread = config['ramp'] / max(1, len(clients))
+
+    connect_started = time.perf_counter()
+    connected = await asyncio.gather(*(client.connect(i * spread) for i, client in enumerate(clients)))
+    connect_seconds = time.perf_counter() - connect_started
+    active = [client for client, ok in zip(clients, connected) if ok]
+
+    emit(phase='chat')
+    cpu_before = time.process_time()
+    chat_started = time.perf_counter()
+    until = chat_started + config['duration']
+    await asyncio.gather(*(client.chat(60 / config['rate'], until, config['reply_timeout']) for client in active))
+    chat_seconds = time.perf_counter() - chat_started
+    cpu_seconds = time.process_time() - cpu_before
+
+    await asyncio.gather(*(client.close() for client in clients))
+    emit(
+        phase='done', connected=len(active), connect_seconds=connect_seconds, chat_seconds=chat_seconds,
+        cpu_seconds=cpu_seconds, connect_ms=stats.connect_ms, reply_ms=stats.reply_ms,
+        first_chunk_ms=stats.first_chunk_ms, outcomes=dict(stats.outcomes),
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(run(json.loads(sys.argv[1])))
@@ -0,0 +1,219 @@
+import asyncio
+import functools
+import time
+import uuid
+from channels.db import DatabaseSyncToAsync, database_sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from redis import connection as redis_connection
+from redis.asyncio import connection as async_redis_connection
+from billing.models import Usage
+from billing.utils import get_monthly_message_usage
+from core.consumers import ChatConsumer, ConnectionState
+from core.management.benchmark_fixtures import benchmark_agent
+from core.models import Agent, Conversation, Message
+from core.services.agent_runtime import get_agent_runtime
+
+# A limit no benchmark reaches, so the limit is checked on every turn but never refuses.
+METERED_PLAN_MESSAGES = 10 ** 9
+
+
+class RoundTripCounter:
+    """
+    Counts database_sync_to_async thread hops, the queries run inside them,
+    and Redis round trips (a pipeline or script call is one; a script's
+    reload after NOSCRIPT is another).
+    """
+    def __init__(self):
+        self.hops = 0
+        self.queries = 0
+        self.redis = 0
+        self._originals = {}
+
+    def __enter__(self):
+        counter = self
+        original_handler = DatabaseSyncToAsync.thread_handler
+
+        def counting_handler(handler_self, loop, *args, **kwargs):
+            counter.hops += 1
+            with connection.execute_wrapper(counter._count_query):
+                return original_handler(handler_self, loop, *args, **kwargs)
+
+        self._originals[DatabaseSyncToAsync, 'thread_handler'] = original_handler
+        DatabaseSyncToAsync.thread_handler = counting_handler
+
+        # Every command or pipeline, sync or asyncio, is written with one send_packed_command().
+        for connection_class in (redis_connection.AbstractConnection, async_redis_connection.AbstractConnection):
+            self._originals[connection_class, 'send_packed_command'] = connection_class.send_packed_command
+            connection_class.send_packed_command = self._counting_send(connection_class.send_packed_command)
+        return self
+
+    def __exit__(self, *exc):
+        for (owner, name), original in self._originals.items():
+            setattr(owner, name, original)
+        self._originals.clear()
+
+    def _counting_send(self, send):
+        counter = self
+
+        @functools.wraps(send)
+        def counting_send(*args, **kwargs):
+            counter.redis += 1
+            return send(*args, **kwargs)
+        return counting_send
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def reset(self):
+        self.hops = self.queries = self.redis = 0
+
+
+class LegacyChatPath:
+    """The original consumer's data access: one hop per helper, ORM objects held per connection."""
+    def __init__(self, agent_id, session_id):
+        self.agent_id = agent_id
+        self.session_id = session_id
+
+    async def connect(self):
+        self.agent = await self.get_agent()
+        self.conversation = await self.get_or_create_conversation()
+        await self.get_message_history()
+
+    async def turn(self, text):
+        await self.is_message_limit_exceeded()
+        await self.save_message('USER', text)
+        await self.get_rag_id()
+        return await self.save_message('AI', f"Re: {text}")
+
+    async def feedback(self, message_id):
+        await self.save_feedback(message_id, Message.Feedback.POSITIVE)
+
+    @database_sync_to_async
+    def get_agent(self):
+        return Agent.objects.select_related('knowledge_base', 'user__subscription').get(id=self.agent_id)
+
+    @database_sync_to_async
+    def get_or_create_conversation(self):
+        return Conversation.objects.get_or_create(agent_id=self.agent_id, end_user_id=self.session_id)[0]
+
+    @database_sync_to_async
+    def get_message_history(self):
+        return list(Message.objects.filter(conversation=self.conversation).order_by('created_at'))
+
+    @database_sync_to_async
+    def is_message_limit_exceeded(self):
+        subscription = self.agent.user.subscription
+        limit = subscription.plan.features.get('messages', 0)
+        if isinstance(limit, str) and limit.lower() == 'unlimited':
+            return False
+        return get_monthly_message_usage(subscription) >= limit
+
+    @database_sync_to_async
+    def get_rag_id(self):
+        return self.agent.knowledge_base.lyzr_rag_id
+
+    @database_sync_to_async
+    def save_message(self, sender, content):
+        msg = Message.objects.create(conversation=self.conversation, sender_type=sender, content=content)
+        self.conversation.updated_at = timezone.now()
+        self.conversation.save(update_fields=['updated_at'])
+        usage, _ = Usage.objects.get_or_create(subscription=self.agent.user.subscription, date=timezone.now().date())
+        usage.messages_count += 1
+        usage.save()
+        return msg
+
+    @database_sync_to_async
+    def save_feedback(self, message_id, feedback):
+        message = Message.objects.get(id=message_id, conversation=self.conversation)
+        message.feedback = feedback
+        message.save()
+
+
+class CurrentChatPath:
+    """
+    Drives ChatConsumer's own data-access methods without a socket, including
+    the Redis work that replaced queries: the agent runtime snapshot, the
+    message limit check and usage counting.
+    """
+    def __init__(self, agent_id, session_id):
+        self.consumer = ChatConsumer()
+        self.consumer.state = ConnectionState(str(agent_id), session_id, stream_requested=False)
+
+    async def connect(self):
+        self.consumer.state.runtime = await get_agent_runtime(self.consumer.state.agent_id)
+        self.consumer.state.conversation_id, _, _ = await self.consumer.open_conversation()
+        if await self.consumer.flush_pending_messages():
+            await self.consumer.get_catch_up(None)
+
+    async def turn(self, text):
+        self.consumer.state.runtime = await get_agent_runtime(self.consumer.state.agent_id)
+        await self.consumer.is_message_limit_exceeded()
+        await self.consumer.save_message('USER', text, created_at=timezone.now())
+        return await self.consumer.save_message('AI', f"Re: {text}")
+
+    async def feedback(self, message_id):
+        await self.consumer.flush_pending_messages()
+        await self.consumer.save_feedback(str(message_id), Message.Feedback.POSITIVE)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the storage cost of the chat consumer per event (connect, message turn, feedback): "
+        "thread hops, queries, Redis round trips and wall time, for the original data-access pattern and "
+        "the current one. Both run against the same active subscription on a metered plan, so each turn "
+        "checks the message limit and counts usage. Creates and then deletes a throwaway agent, so point "
+        "it at a development database and Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=100, help="Message turns per profile.")
+
+    def handle(self, *args, **options):
+        with benchmark_agent(plan_features={'messages': METERED_PLAN_MESSAGES}) as agent:
+            results = asyncio.run(self.run_profiles(agent, options['turns']))
+
+        self.stdout.write(f"{'profile':<24}{'event':<10}{'hops':>8}{'queries':>10}{'redis':>8}{'ms':>10}")
+        for profile, events in results:
+            for event, (hops, queries, redis_trips, ms) in events.items():
+                self.stdout.write(
+                    f"{profile:<24}{event:<10}{hops:>8.1f}{queries:>10.1f}{redis_trips:>8.1f}{ms:>10.2f}"
+                )
+
+    async def run_profiles(self, agent, turns):
+        profiles = [
+            ('original', lambda session: LegacyChatPath(agent.id, session), False),
+            ('current', lambda session: CurrentChatPath(agent.id, session), False),
+            ('current+write-behind', lambda session: CurrentChatPath(agent.id, session), True),
+        ]
+        results = []
+        with RoundTripCounter() as counter:
+            for name, factory, write_behind in profiles:
+                with override_settings(CHAT_MESSAGE_WRITE_BEHIND=write_behind):
+                    results.append((name, await self.measure(factory(f"bench-{name}-{uuid.uuid4()}"), counter, turns)))
+        return results
+
+    async def measure(self, path, counter, turns):
+        events = {}
+
+        async def timed(event, coro, repeat=1):
+            counter.reset()
+            started = time.perf_counter()
+            result = await coro
+            elapsed = (time.perf_counter() - started) * 1000
+            hops, queries, redis_trips, ms = events.get(event, (0, 0, 0, 0))
+            events[event] = (
+                hops + counter.hops / repeat, queries + counter.queries / repeat,
+                redis_trips + counter.redis / repeat, ms + elapsed / repeat,
+            )
+            return result
+
+        await timed('connect', path.connect())
+        replies = []
+        for i in range(turns):
+            replies.append(await timed('turn', path.turn(f"Benchmark question {i}"), repeat=turns))
+        await timed('feedback', path.feedback(replies[-1].id))
+        return events
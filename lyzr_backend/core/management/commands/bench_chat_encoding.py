@@ -0,0 +1,52 @@
+import json
+import time
+import uuid
+import zlib
+import msgpack
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+ENCODERS = {
+    'json': lambda content: json.dumps(content).encode(),
+    'msgpack': msgpack.packb,
+}
+
+
+def sample_events(page_size: int, message_length: int):
+    """Typical server frames: a full history page, one reply and one stream chunk."""
+    text = ("Our support team is available Monday to Friday, 9am to 5pm. " * (message_length // 60 + 1))[:message_length]
+    messages = [
+        {'id': str(uuid.uuid4()), 'sender': 'AI' if i % 2 else 'USER', 'content': text, 'feedback': None}
+        for i in range(page_size)
+    ]
+    return {
+        'history page': {'event_type': 'history', 'messages': messages, 'cursor': 'x' * 60, 'has_more': True, 'initial': True},
+        'new_message': {'event_type': 'new_message', 'message': messages[1]},
+        'message_chunk': {'event_type': 'message_chunk', 'message_id': messages[1]['id'], 'content': text[:40]},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the JSON and msgpack (?encoding=msgpack) encodings of chat socket frames: bytes on the "
+        "wire, bytes after deflate for reference, and encode time. Needs no database or Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--message-length', type=int, default=400, help="Characters per chat message.")
+        parser.add_argument('--iterations', type=int, default=2000, help="Encodes timed per frame and encoding.")
+
+    def handle(self, *args, **options):
+        events = sample_events(settings.CHAT_HISTORY_PAGE_SIZE, options['message_length'])
+        iterations = options['iterations']
+
+        self.stdout.write(f"{'frame':<16}{'encoding':<10}{'bytes':>10}{'deflated':>10}{'us/encode':>12}")
+        for frame, content in events.items():
+            for name, encode in ENCODERS.items():
+                payload = encode(content)
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    encode(content)
+                micros = (time.perf_counter() - started) * 1_000_000 / iterations
+                deflated = len(zlib.compress(payload))
+                self.stdout.write(f"{frame:<16}{name:<10}{len(payload):>10}{deflated:>10}{micros:>12.1f}")
@@ -0,0 +1,107 @@
+import asyncio
+import contextvars
+import time
+import uuid
+from collections import Counter
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from core.management.benchmark_fixtures import benchmark_agent, open_chat_socket
+from core.services.response_cache import store_response
+
+QUESTION = "What are your opening hours?"
+COUNTED_OPERATIONS = ('send', 'group_send')
+# Set while a counted call runs, so layers that build group_send on send aren't counted twice.
+_in_layer_call = contextvars.ContextVar('in_layer_call', default=False)
+
+
+class LayerOpCounter:
+    """Counts calls to the channel layer's send and group_send."""
+    def __init__(self, layer):
+        self.layer = layer
+        self.ops = Counter()
+        self._originals = {}
+
+    def __enter__(self):
+        for name in COUNTED_OPERATIONS:
+            original = getattr(self.layer, name)
+            self._originals[name] = original
+            setattr(self.layer, name, self._wrap(name, original))
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._originals.items():
+            setattr(self.layer, name, original)
+
+    def _wrap(self, name, original):
+        async def counted(*args, **kwargs):
+            if _in_layer_call.get():
+                return await original(*args, **kwargs)
+            token = _in_layer_call.set(True)
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                _in_layer_call.reset(token)
+                self.ops[name] += 1
+        return counted
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures channel-layer operations and wall time per AI reply, for a session with one socket "
+        "(group send forced, then direct send) and with two sockets. Replies come from the response "
+        "cache, so no Lyzr calls are made. Needs the configured database, Redis and channel layer; "
+        "creates and then deletes a throwaway agent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100, help="Replies measured per profile.")
+
+    def handle(self, *args, **options):
+        with benchmark_agent(response_cache_enabled=True) as agent:
+            results = asyncio.run(self.run_profiles(agent, options['messages']))
+
+        self.stdout.write(f"{'profile':<26}" + ''.join(f"{op:>12}" for op in COUNTED_OPERATIONS) + f"{'ms':>10}")
+        for profile, ops, ms in results:
+            self.stdout.write(f"{profile:<26}" + ''.join(f"{ops[op]:>12.1f}" for op in COUNTED_OPERATIONS) + f"{ms:>10.2f}")
+
+    async def run_profiles(self, agent, messages):
+        await store_response(agent.id, QUESTION, "We're open from 9 to 5, Monday to Friday.")
+        profiles = [
+            ('1 socket, group send', 1, False),
+            ('1 socket, direct send', 1, True),
+            ('2 sockets', 2, True),
+        ]
+        results = []
+        for name, sockets, direct in profiles:
+            with override_settings(CHAT_DIRECT_SEND=direct):
+                results.append((name, *await self.measure(agent, sockets, messages)))
+        return results
+
+    async def measure(self, agent, sockets, messages):
+        total_ops = Counter()
+        total_ms = 0.0
+        for _ in range(messages):
+            # A fresh session per reply: the cache only answers opening questions.
+            session_id = f"bench-fanout-{uuid.uuid4()}"
+            communicators = [await open_chat_socket(agent, session_id) for _ in range(sockets)]
+            # Let the subscriber-count update from the last join settle first.
+            await asyncio.sleep(0.05)
+
+            with LayerOpCounter(get_channel_layer()) as counter:
+                started = time.perf_counter()
+                await communicators[0].send_json_to({'event_type': 'user_message', 'message': QUESTION})
+                for communicator in communicators:
+                    await self.wait_for_reply(communicator)
+                total_ms += (time.perf_counter() - started) * 1000
+            total_ops.update(counter.ops)
+
+            for communicator in communicators:
+                await communicator.disconnect()
+        return {op: total_ops[op] / messages for op in COUNTED_OPERATIONS}, total_ms / messages
+
+    async def wait_for_reply(self, communicator):
+        while True:
+            event = await communicator.receive_json_from(timeout=10)
+            if event.get('event_type') == 'new_message' and event['message']['sender'] == 'AI':
+                return
@@ -0,0 +1,250 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+import psutil
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.management.benchmark_fixtures import SERVER_DATABASE_PATH, benchmark_agent
+from core.management.lyzr_stub import lyzr_stub
+from core.services.hedging import METRICS_GROUP as HEDGING_METRICS
+from core.services.metrics import get_counters
+
+SERVER_START_TIMEOUT = 30
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class ServerSampler:
+    """Samples a server process's CPU time and RSS every `interval` seconds, from start() to stop()."""
+    def __init__(self, pid: int, interval: float):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.rss = []
+        self.cpu_seconds = 0.0
+        self._cpu_before = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _cpu(self) -> float:
+        times = self.process.cpu_times()
+        return times.user + times.system
+
+    def _sample(self):
+        while True:
+            self.rss.append(self.process.memory_info().rss)
+            if self._stopped.wait(self.interval):
+                return
+
+    def start(self):
+        self._cpu_before = self._cpu()
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.cpu_seconds = self._cpu() - self._cpu_before
+
+
+def server_database(url: str):
+    """(thread hops, queries) so far in a server serving core.management.bench_server, else None."""
+    parts = urlsplit(url)
+    scheme = 'https' if parts.scheme == 'wss' else 'http'
+    try:
+        with urllib.request.urlopen(urlunsplit((scheme, parts.netloc, SERVER_DATABASE_PATH, '', '')), timeout=5) as response:
+            counts = json.load(response)
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+    return counts['hops'], counts['queries']
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def daphne_server(environment: dict):
+    """
+    Runs Daphne on a free local port in a child process, with `environment`
+    on top of this one's, and yields (its ws:// URL, its PID).
+    """
+    port = free_port()
+    log = tempfile.TemporaryFile()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), 'core.management.bench_server:application'],
+        cwd=settings.BASE_DIR, env={**os.environ, **environment}, stdout=log, stderr=subprocess.STDOUT,
+    )
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            if server.poll() is not None or time.monotonic() > deadline:
+                log.seek(0)
+                raise CommandError(f"Daphne did not start:\n{log.read().decode(errors='replace')[-4000:]}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.2)
+        yield f"ws://127.0.0.1:{port}", server.pid
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests a running chat server with N widget clients on real WebSocket connections, each "
+        "sending messages at a fixed rate. By default starts Daphne in a child process against a local "
+        "Lyzr stub with configurable latency and error injection, in CHAT_INFERENCE_MODE=inline with the "
+        "per-session and per-address rate limits lifted; --url loads a server already running instead, "
+        "which must share this database and brings its own Lyzr settings. The clients run in a separate "
+        "process. Reports connect latency, time-to-reply percentiles, error rates, and the server "
+        "process's CPU and RSS over the chat phase (with --url, given --server-pid), and its database "
+        "thread hops and queries per message (with --url, if it serves core.management.bench_server). "
+        "Creates and then deletes a throwaway agent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help="Concurrent simulated widgets.")
+        parser.add_argument('--rate', type=float, default=6, help="Messages per minute per client.")
+        parser.add_argument('--duration', type=float, default=60, help="Seconds of chatting after all clients connect.")
+        parser.add_argument('--ramp', type=float, default=5, help="Seconds over which clients connect.")
+        parser.add_argument('--stream', action='store_true', help="Connect with ?stream=1.")
+        parser.add_argument('--url', help="ws:// or wss:// base URL of a running server to load instead of starting one.")
+        parser.add_argument('--server-pid', type=int, help="With --url, the server's PID on this host, to sample.")
+        parser.add_argument('--sample-interval', type=float, default=0.5, help="Seconds between server RSS samples.")
+        parser.add_argument('--latency-ms', type=float, default=800, help="Stub Lyzr latency per request.")
+        parser.add_argument('--jitter-ms', type=float, default=200, help="Uniform +/- jitter on the stub latency.")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of stub requests that fail.")
+        parser.add_argument('--error-status', type=int, default=500, help="HTTP status of injected failures.")
+        parser.add_argument('--reply-timeout', type=float, default=60, help="Seconds a client waits for a reply.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed for the stub and the client schedules.")
+        parser.add_argument('--hedge', action='store_true', help="Turn on LYZR_CHAT_HEDGING (non-streamed replies only).")
+
+    def handle(self, *args, **options):
+        hedging_before = get_counters(HEDGING_METRICS)
+        with benchmark_agent() as agent:
+            if options['url']:
+                stub = None
+                results, server, database = self.run_clients(options['url'], options['server_pid'], agent, options)
+            else:
+                stub_options = {
+                    'latency_ms': options['latency_ms'], 'jitter_ms': options['jitter_ms'], 'seed': options['seed'],
+                    'error_rate': options['error_rate'], 'error_status': options['error_status'],
+                }
+                with lyzr_stub(**stub_options) as stub, daphne_server(self.server_environment(stub, options)) as (url, pid):
+                    results, server, database = self.run_clients(url, pid, agent, options)
+        hedging = {
+            field: count - hedging_before.get(field, 0) for field, count in get_counters(HEDGING_METRICS).items()
+        }
+
+        self.report(results, server, database, stub, hedging, options)
+
+    def server_environment(self, stub, options) -> dict:
+        unlimited = str(10 ** 9)
+        return {
+            'LYZR_AGENT_API_BASE_URL': stub.base_url,
+            'CHAT_INFERENCE_MODE': 'inline',
+            'CHAT_MESSAGES_PER_MINUTE_PER_SESSION': unlimited,
+            'CHAT_MESSAGES_PER_MINUTE_PER_IP': unlimited,
+            'WIDGET_REQUESTS_PER_MINUTE_PER_IP': unlimited,
+            'LYZR_CHAT_HEDGING': str(options['hedge']),
+        }
+
+    def run_clients(self, url, server_pid, agent, options):
+        """
+        Runs core.management.chat_load_clients, sampling the server while its
+        clients chat. Returns the clients' results, the sampler and the
+        server's (thread hops, queries) over the chat phase, or None.
+        """
+        config = {
+            'url': url, 'agent_id': str(agent.id), 'clients': options['clients'], 'rate': options['rate'],
+            'duration': options['duration'], 'ramp': options['ramp'], 'stream': options['stream'],
+            'reply_timeout': options['reply_timeout'], 'seed': options['seed'],
+        }
+        sampler = ServerSampler(server_pid, options['sample_interval']) if server_pid else None
+        clients = subprocess.Popen(
+            [sys.executable, '-m', 'core.management.chat_load_clients', json.dumps(config)],
+            cwd=settings.BASE_DIR, stdout=subprocess.PIPE, text=True,
+        )
+        results = database_before = database = None
+        for line in clients.stdout:
+            event = json.loads(line)
+            if event['phase'] == 'chat':
+                database_before = server_database(url)
+                if sampler:
+                    sampler.start()
+            elif event['phase'] == 'done':
+                results = event
+                if sampler:
+                    sampler.stop()
+                if database_before:
+                    if settings.CHAT_MESSAGE_WRITE_BEHIND:
+                        # Let the last buffered messages reach the database.
+                        time.sleep(2 * settings.CHAT_MESSAGE_FLUSH_INTERVAL)
+                    database_after = server_database(url)
+                    if database_after:
+                        database = tuple(after - before for after, before in zip(database_after, database_before))
+        if clients.wait() != 0 or results is None:
+            raise CommandError(f"Load clients exited with status {clients.returncode}")
+        return results, sampler, database
+
+    def report(self, results, server, database, stub, hedging, options):
+        outcomes = Counter(results['outcomes'])
+        sent = outcomes['sent'] or 1
+        chat_seconds = results['chat_seconds']
+        connect_ms, reply_ms, first_chunk_ms = results['connect_ms'], results['reply_ms'], results['first_chunk_ms']
+        write = self.stdout.write
+
+        write(f"clients           {results['connected']}/{options['clients']} connected in {results['connect_seconds']:.1f}s")
+        write(f"connect ms        p50 {percentile(connect_ms, 50):.1f}  p95 {percentile(connect_ms, 95):.1f}  "
+              f"p99 {percentile(connect_ms, 99):.1f}")
+        write(f"reply ms          p50 {percentile(reply_ms, 50):.1f}  p95 {percentile(reply_ms, 95):.1f}  "
+              f"p99 {percentile(reply_ms, 99):.1f}  max {max(reply_ms, default=float('nan')):.1f}")
+        if options['stream']:
+            write(f"first chunk ms    p50 {percentile(first_chunk_ms, 50):.1f}  "
+                  f"p95 {percentile(first_chunk_ms, 95):.1f}  p99 {percentile(first_chunk_ms, 99):.1f}")
+        write(f"messages          {outcomes['sent']} sent, {outcomes['sent'] / chat_seconds:.1f}/s; "
+              f"{outcomes['replied']} replied, {outcomes['error_reply']} error replies, "
+              f"{outcomes['refused']} refused, {outcomes['timed_out']} timed out, "
+              f"{outcomes['disconnected']} lost to closed sockets")
+        failed = outcomes['error_reply'] + outcomes['refused'] + outcomes['timed_out'] + outcomes['disconnected']
+        injected = f" (stub injected {stub.errors} of {stub.requests} requests)" if stub else ""
+        write(f"error rate        {failed / sent:.2%}{injected}")
+        if database:
+            hops, queries = database
+            write(f"database per turn {hops / sent:.2f} thread hops, {queries / sent:.2f} queries (server process)")
+        else:
+            write("database per turn not measured (serve core.management.bench_server:application for --url)")
+        if options['hedge']:
+            calls = hedging.get('calls', 0) or 1
+            write(f"hedging           {hedging.get('hedged', 0) / calls:.1%} of calls hedged, "
+                  f"{hedging.get('hedge_wins', 0)} hedge wins, {hedging.get('budget_exhausted', 0)} over budget")
+        if server:
+            write(f"server process    {server.cpu_seconds:.1f} CPU s over {chat_seconds:.1f}s "
+                  f"({server.cpu_seconds / chat_seconds:.0%} of a core), RSS peak {max(server.rss) / 2 ** 20:.0f} MB, "
+                  f"end {server.rss[-1] / 2 ** 20:.0f} MB")
+        else:
+            write("server process    not sampled (pass --server-pid with --url)")
+        write(f"load clients      {results['cpu_seconds']:.1f} CPU s ({results['cpu_seconds'] / chat_seconds:.0%} of a "
+              f"core; near 100% means the clients, not the server, set the pace)")
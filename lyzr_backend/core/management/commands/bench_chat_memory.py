@@ -0,0 +1,64 @@
+import asyncio
+import gc
+import tracemalloc
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand
+from django.urls import path
+from core.management.benchmark_fixtures import benchmark_agent, chat_application, open_chat_socket
+
+
+class BareConsumer(AsyncJsonWebsocketConsumer):
+    """Accepts and sends one frame; measures what any idle socket costs before ChatConsumer adds its own."""
+    async def connect(self):
+        await self.accept()
+        await self.send_json({'event_type': 'history', 'messages': []})
+
+
+bare_application = URLRouter([
+    path('ws/chat/<uuid:agent_id>/<str:session_id>/', BareConsumer.as_asgi()),
+])
+
+
+class Command(BaseCommand):
+    help = (
+        "Opens N idle chat sockets in-process and reports the memory each one holds, measured with "
+        "tracemalloc, for ChatConsumer and for a bare consumer as the baseline. Needs the configured "
+        "database, Redis and channel layer; creates and then deletes a throwaway agent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=500, help="Sockets to open per run.")
+
+    def handle(self, *args, **options):
+        count = options['connections']
+        with benchmark_agent() as agent:
+            bare = asyncio.run(self.measure(bare_application, agent, count, 'bare'))
+            chat = asyncio.run(self.measure(chat_application, agent, count, 'chat'))
+
+        self.stdout.write(f"{'consumer':<14}{'bytes/conn':>12}{'in consumers.py':>18}")
+        self.stdout.write(f"{'bare':<14}{bare[0]:>12.0f}{'-':>18}")
+        self.stdout.write(f"{'ChatConsumer':<14}{chat[0]:>12.0f}{chat[1]:>18.0f}")
+        self.stdout.write(f"ChatConsumer overhead over a bare socket: {chat[0] - bare[0]:.0f} bytes per connection")
+
+    async def measure(self, application, agent, count, label):
+        # Warm caches (agent runtime snapshot, channel layer, connection pools) outside the measurement.
+        warmup = await open_chat_socket(agent, f"bench-{label}-warmup", application)
+        await warmup.disconnect()
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        communicators = [await open_chat_socket(agent, f"bench-{label}-{i}", application) for i in range(count)]
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        own = sum(
+            stat.size_diff for stat in after.compare_to(before, 'filename')
+            if stat.traceback[0].filename.endswith('core/consumers.py')
+        )
+        for communicator in communicators:
+            await communicator.disconnect()
+        return total / count, own / count
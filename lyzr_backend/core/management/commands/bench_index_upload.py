@@ -0,0 +1,80 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from core.management.lyzr_stub import lyzr_stub
+from core.services.lyzr_client import get_lyzr_client
+
+MODES = ('buffered', 'streamed')
+
+
+def peak_rss() -> int:
+    """This process's peak resident set size in bytes (ru_maxrss is in KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Uploads files of increasing size to a local Lyzr stub as index_knowledge_source_task would, "
+        "each upload in a fresh child process, and reports the child's peak RSS growth for the "
+        "buffered upload (index_file on an open file) and the streamed one (index_stored_file). "
+        "Files are written to a temporary FileSystemStorage. Uses Redis for the circuit breaker and "
+        "scheduler if it is reachable."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[8, 32, 128], help="File sizes in MB.")
+        parser.add_argument('--child', nargs=4, metavar=('MODE', 'DIRECTORY', 'NAME', 'BASE_URL'),
+                            help="Internal: run one upload in this process and print its RSS as JSON.")
+
+    def handle(self, *args, **options):
+        if options['child']:
+            return self.upload(*options['child'])
+
+        with tempfile.TemporaryDirectory() as directory, lyzr_stub(latency_ms=0) as stub:
+            self.write_file(directory, 'warmup.txt', 1024)
+            self.stdout.write(f"{'file MB':>8}{'buffered peak +MB':>20}{'streamed peak +MB':>20}")
+            for size in options['sizes']:
+                name = f"bench-{size}mb.txt"
+                self.write_file(directory, name, size * 2 ** 20)
+                growth = [self.run_child(mode, directory, name, stub.base_url) for mode in MODES]
+                self.stdout.write(f"{size:>8}{growth[0] / 2 ** 20:>20.1f}{growth[1] / 2 ** 20:>20.1f}")
+                os.remove(os.path.join(directory, name))
+        self.stdout.write(f"Streamed uploads read LYZR_UPLOAD_CHUNK_SIZE = {settings.LYZR_UPLOAD_CHUNK_SIZE} bytes at a time.")
+
+    def write_file(self, directory, name, size):
+        with open(os.path.join(directory, name), 'wb') as f:
+            for offset in range(0, size, 2 ** 20):
+                f.write(os.urandom(min(2 ** 20, size - offset)))
+
+    def run_child(self, mode, directory, name, base_url) -> int:
+        result = subprocess.run(
+            [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_index_upload',
+             '--child', mode, directory, name, base_url],
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"{mode} upload of {name} failed:\n{result.stderr}")
+        measured = json.loads(result.stdout.strip().splitlines()[-1])
+        return measured['peak'] - measured['baseline']
+
+    def upload(self, mode, directory, name, base_url):
+        storage = FileSystemStorage(location=directory)
+        with override_settings(LYZR_RAG_API_BASE_URL=base_url):
+            client = get_lyzr_client()
+            # The first call pays for imports, the session and the connection; keep that out of the baseline.
+            client.index_stored_file('bench', storage, 'warmup.txt')
+            baseline = peak_rss()
+            if mode == 'buffered':
+                with storage.open(name, 'rb') as f:
+                    client.index_file('bench', f, name)
+            else:
+                client.index_stored_file('bench', storage, name)
+        self.stdout.write(json.dumps({'baseline': baseline, 'peak': peak_rss()}))
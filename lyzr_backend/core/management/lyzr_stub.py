@@ -0,0 +1,136 @@
+import json
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import override_settings
+
+
+class LyzrStubServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Lyzr inference API (v3/inference/chat/ and
+    v3/inference/stream/) and the RAG train uploads (v3/train/*/), with
+    configurable latency and error injection. Uploads are read and
+    discarded, never held in memory.
+    Latency jitter and injected errors come from a seeded RNG, so a run is
+    repeatable.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency_ms: float = 500, jitter_ms: float = 0, error_rate: float = 0,
+                 error_status: int = 500, stream_chunks: int = 8, seed: int = 0):
+        super().__init__(('127.0.0.1', 0), LyzrStubHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunks = stream_chunks
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def next_outcome(self):
+        """Returns (latency in seconds, whether to fail) for the next request."""
+        with self._lock:
+            self.requests += 1
+            latency = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return latency, fail
+
+    def handle_error(self, request, client_address):
+        # Clients hang up mid-response when they time out or cancel a hedged call.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class LyzrStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if '/train/' in self.path:
+            return self.receive_upload()
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        latency, fail = self.server.next_outcome()
+        reply = f"Stub reply to: {body.get('message', '')}"
+
+        if fail:
+            time.sleep(latency)
+            return self.send_json(self.server.error_status, {'detail': 'Injected error'})
+        if self.path.rstrip('/').endswith('inference/stream'):
+            return self.send_stream(reply, latency)
+        if self.path.rstrip('/').endswith('inference/chat'):
+            time.sleep(latency)
+            return self.send_json(200, {'response': reply})
+        self.send_json(404, {'detail': 'Not found'})
+
+    def receive_upload(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        received = 0
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            received += len(chunk)
+            remaining -= len(chunk)
+        latency, fail = self.server.next_outcome()
+        time.sleep(latency)
+        if fail:
+            return self.send_json(self.server.error_status, {'detail': 'Injected error'})
+        self.send_json(200, {'success': True, 'bytes_received': received})
+
+    def do_GET(self):
+        self.send_json(200, {})
+
+    def send_json(self, status: int, data: dict):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, reply: str, latency: float):
+        """Spreads the latency over `stream_chunks` server-sent events."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        count = max(1, self.server.stream_chunks)
+        size = -(-len(reply) // count)
+        for i in range(count):
+            time.sleep(latency / count)
+            self.write_chunk(f"data: {json.dumps({'content': reply[i * size:(i + 1) * size]})}\n\n")
+        self.write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, text: str):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def lyzr_stub(**options):
+    """Runs a LyzrStubServer and points the Lyzr clients created meanwhile at it."""
+    server = LyzrStubServer(**options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with override_settings(LYZR_AGENT_API_BASE_URL=server.base_url):
+            yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_message_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='response_cache_enabled',
+            field=models.BooleanField(default=False, help_text='Serve repeated opening questions from a cache instead of calling the model.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_agent_response_cache_enabled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='lyzr_config_hash',
+            field=models.CharField(blank=True, default='', help_text="Fingerprint of the configuration last pushed to Lyzr; syncs that wouldn't change it are skipped.", max_length=64),
+        ),
+    ]
@@ -93,6 +93,16 @@ class Agent(models.Model):
     temperature = models.FloatField(default=0.2, validators=[MinValueValidator(0.0), MaxValueValidator(2.0)])
     top_p = models.FloatField(default=1.0, validators=[MinValueValidator(0.0), MaxValueValidator(1.0)])
     widget_settings = models.JSONField(default=dict)
+    response_cache_enabled = models.BooleanField(
+        default=False,
+        help_text="Serve repeated opening questions from a cache instead of calling the model."
+    )
+    lyzr_config_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="Fingerprint of the configuration last pushed to Lyzr; syncs that wouldn't change it are skipped."
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -289,12 +299,16 @@ class Message(models.Model):
     sender_type = models.CharField(max_length=10, choices=Sender.choices)
     content = models.TextField()
     feedback = models.CharField(max_length=10, choices=Feedback.choices, blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: write-behind batches keep the time each message was sent.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     metadata = models.JSONField(default=dict, help_text="Additional message metadata")
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at'], name='core_msg_conv_created_idx'),
+        ]
         
     def __str__(self): 
         return f"Message from {self.sender_type} at {self.created_at}"
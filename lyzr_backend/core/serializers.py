@@ -41,7 +41,7 @@ class AgentSerializer(serializers.ModelSerializer):
         model = Agent
         fields = [
             'id', 'user', 'lyzr_agent_id', 'name', 'is_active', 'description', 'agent_role', 'agent_goal', 'agent_instructions', 'examples',
-            'model', 'temperature', 'top_p', 'widget_settings', 'knowledge_base',
+            'model', 'temperature', 'top_p', 'widget_settings', 'response_cache_enabled', 'knowledge_base',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'lyzr_agent_id', 'user', 'knowledge_base', 'created_at', 'updated_at']
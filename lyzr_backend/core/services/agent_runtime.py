@@ -0,0 +1,143 @@
+import json
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+from channels.db import database_sync_to_async
+from django.conf import settings
+from redis.exceptions import RedisError
+from core.models import Agent, KnowledgeBase
+from core.services.rate_limit import plan_limit
+from core.services.redis_client import get_redis, get_async_redis
+from billing.models import Subscription
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL_SECONDS = 60 * 60
+# Part of the cache key; bump when AgentRuntime gains or loses fields.
+SNAPSHOT_SCHEMA = 3
+
+
+@dataclass(frozen=True)
+class AgentRuntime:
+    """
+    Everything the chat path needs to know about an agent, flattened out of
+    Agent, KnowledgeBase, Subscription and Plan so it can be cached.
+    `message_limit` is None for unlimited plans, as are the per-minute rate
+    limits.
+    """
+    agent_id: str
+    version: int
+    is_active: bool
+    lyzr_agent_id: Optional[str]
+    rag_id: Optional[str]
+    owner_email: str
+    subscription_id: Optional[str]
+    subscription_status: Optional[str]
+    has_plan: bool
+    message_limit: Optional[int]
+    streaming_enabled: bool
+    response_cache_enabled: bool
+    widget_requests_per_minute: Optional[int]
+    messages_per_minute: Optional[int]
+
+    @property
+    def is_ready(self) -> bool:
+        return self.is_active and bool(self.lyzr_agent_id)
+
+
+# Per-process copies, shared by every socket on the same agent.
+_local_snapshots: Dict[str, AgentRuntime] = {}
+
+
+def _version_key(agent_id: str) -> str:
+    return f"agent_runtime:version:{agent_id}"
+
+
+def _snapshot_key(agent_id: str, version: int) -> str:
+    return f"agent_runtime:{SNAPSHOT_SCHEMA}:{agent_id}:{version}"
+
+
+def _build_snapshot(agent_id: str, version: int) -> Optional[AgentRuntime]:
+    try:
+        agent = Agent.objects.select_related('knowledge_base', 'user__subscription__plan').get(id=agent_id)
+    except Agent.DoesNotExist:
+        return None
+
+    try:
+        rag_id = agent.knowledge_base.lyzr_rag_id
+    except KnowledgeBase.DoesNotExist:
+        rag_id = None
+
+    try:
+        subscription = agent.user.subscription
+    except Subscription.DoesNotExist:
+        subscription = None
+
+    plan = subscription.plan if subscription else None
+    limit = plan.features.get('messages', 0) if plan else 0
+    if isinstance(limit, str) and limit.lower() == 'unlimited':
+        limit = None
+
+    return AgentRuntime(
+        agent_id=str(agent.id),
+        version=version,
+        is_active=agent.is_active,
+        lyzr_agent_id=agent.lyzr_agent_id,
+        rag_id=rag_id,
+        owner_email=agent.user.email,
+        subscription_id=str(subscription.id) if subscription else None,
+        subscription_status=subscription.status if subscription else None,
+        has_plan=plan is not None,
+        message_limit=limit,
+        streaming_enabled=bool(agent.widget_settings.get('streaming', True)),
+        response_cache_enabled=agent.response_cache_enabled,
+        widget_requests_per_minute=plan_limit(plan, 'widget_requests_per_minute', settings.WIDGET_REQUESTS_PER_MINUTE_PER_AGENT),
+        messages_per_minute=plan_limit(plan, 'messages_per_minute', settings.CHAT_MESSAGES_PER_MINUTE_PER_AGENT),
+    )
+
+
+async def get_agent_runtime(agent_id) -> Optional[AgentRuntime]:
+    """
+    Returns the current runtime snapshot for an agent, or None if it doesn't
+    exist. A hit in the process cache costs one Redis GET for the version and
+    no database queries; a version bump from invalidate_agent_runtime() makes
+    every process rebuild on its next call.
+    """
+    agent_id = str(agent_id)
+    try:
+        redis = get_async_redis()
+        version = int(await redis.get(_version_key(agent_id)) or 0)
+
+        local = _local_snapshots.get(agent_id)
+        if local is not None and local.version == version:
+            return local
+
+        raw = await redis.get(_snapshot_key(agent_id, version))
+        if raw:
+            snapshot = AgentRuntime(**json.loads(raw))
+        else:
+            snapshot = await database_sync_to_async(_build_snapshot)(agent_id, version)
+            if snapshot is not None:
+                await redis.set(_snapshot_key(agent_id, version), json.dumps(asdict(snapshot)), ex=SNAPSHOT_TTL_SECONDS)
+    except RedisError as e:
+        logger.warning(f"Redis unavailable for agent runtime of '{agent_id}', reading from the database: {e}")
+        return await database_sync_to_async(_build_snapshot)(agent_id, -1)
+
+    if snapshot is None:
+        _local_snapshots.pop(agent_id, None)
+        return None
+    _local_snapshots[agent_id] = snapshot
+    return snapshot
+
+
+def invalidate_agent_runtime(*agent_ids):
+    """Bumps the snapshot version of each agent so every process reloads it."""
+    if not agent_ids:
+        return
+    try:
+        pipe = get_redis().pipeline()
+        for agent_id in agent_ids:
+            pipe.incr(_version_key(str(agent_id)))
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Could not invalidate agent runtime snapshots for {agent_ids}: {e}")
@@ -0,0 +1,41 @@
+import logging
+from django.conf import settings
+from redis.exceptions import RedisError
+from core.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Counters: debounced (edits folded into an already queued sync), unchanged
+# (edits or syncs with nothing for Lyzr) and pushed (syncs that updated Lyzr).
+METRICS_GROUP = 'lyzr_agent_sync'
+
+# How long past its countdown a queued sync keeps later edits from queuing
+# another; should the task be lost, the next edit after that queues a new one.
+PENDING_GRACE_SECONDS = 60
+
+
+def _pending_key(agent_id) -> str:
+    return f"lyzr:agent_sync:{agent_id}:pending"
+
+
+def mark_sync_pending(agent_id) -> bool:
+    """
+    True if no sync was queued for the agent, and the caller should queue one
+    with a countdown of LYZR_AGENT_SYNC_DEBOUNCE seconds; False if one is
+    already waiting and will pick this edit up. Redis errors return True, so
+    an edit is never left unsynced.
+    """
+    try:
+        ttl = settings.LYZR_AGENT_SYNC_DEBOUNCE + PENDING_GRACE_SECONDS
+        return bool(get_redis().set(_pending_key(agent_id), 1, nx=True, ex=ttl))
+    except RedisError as e:
+        logger.warning(f"Could not debounce sync for agent {agent_id}: {e}")
+        return True
+
+
+def clear_sync_pending(agent_id):
+    """Called as the sync starts, so edits made while it runs queue another."""
+    try:
+        get_redis().delete(_pending_key(agent_id))
+    except RedisError as e:
+        logger.warning(f"Could not clear pending sync for agent {agent_id}: {e}")
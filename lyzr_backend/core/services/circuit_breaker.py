@@ -0,0 +1,219 @@
+import logging
+import time
+from typing import Optional
+from django.conf import settings
+from redis.exceptions import RedisError
+from core.services.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# What admit() hands back for an admitted call: the circuit is closed, or
+# this call is the single probe let through a half-open circuit.
+CLOSED = 'closed'
+PROBE = 'probe'
+
+# Retry budget: across all processes, retries may be at most
+# LYZR_RETRY_BUDGET_RATIO of the calls started in the same window (with a
+# small floor), so retries can't multiply load on a struggling backend.
+RETRY_BUDGET_WINDOW_SECONDS = 10
+
+
+def _budget_key() -> str:
+    return f"lyzr:retry_budget:{int(time.time() // RETRY_BUDGET_WINDOW_SECONDS)}"
+
+
+def _queue_take_retry(pipe):
+    key = _budget_key()
+    pipe.hincrby(key, 'retries', 1)
+    pipe.hget(key, 'calls')
+    pipe.expire(key, RETRY_BUDGET_WINDOW_SECONDS * 2)
+
+
+def _retry_allowed(results) -> bool:
+    retries, calls = int(results[0]), int(results[1] or 0)
+    return retries <= max(settings.LYZR_RETRY_BUDGET_MIN, calls * settings.LYZR_RETRY_BUDGET_RATIO)
+
+
+def _admission(reply) -> Optional[str]:
+    return reply.decode() if isinstance(reply, bytes) else reply
+
+
+# admit() in one round trip. KEYS: open, half_open, probe, this window's
+# retry budget. ARGV: probe slot TTL, '1' to count the call in the budget,
+# budget TTL. Returns 'closed', 'probe', or nil when the call is refused.
+ADMIT_SCRIPT = """
+if ARGV[2] == '1' then
+    redis.call('HINCRBY', KEYS[4], 'calls', 1)
+    redis.call('EXPIRE', KEYS[4], ARGV[3])
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return false
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return 'closed'
+end
+if redis.call('SET', KEYS[3], 1, 'NX', 'EX', ARGV[1]) then
+    return 'probe'
+end
+return false
+"""
+
+# record_failure() in one round trip. KEYS: failures, open, half_open,
+# probe. ARGV: failure window, failure threshold, '1' for a probe's
+# failure, cooldown. Returns 1 if the circuit was opened.
+FAILURE_SCRIPT = """
+local failures = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+if ARGV[3] == '1' or failures >= tonumber(ARGV[2]) then
+    local cooldown = tonumber(ARGV[4])
+    redis.call('SET', KEYS[2], 1, 'EX', cooldown)
+    -- Outlives the open state; only a successful probe clears it.
+    redis.call('SET', KEYS[3], 1, 'EX', cooldown * 20)
+    redis.call('DEL', KEYS[1], KEYS[4])
+    return 1
+end
+return 0
+"""
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker whose state lives in Redis, so every web
+    and Celery process sees the same circuit. LYZR_BREAKER_FAILURES
+    failures within LYZR_BREAKER_WINDOW seconds open it for
+    LYZR_BREAKER_COOLDOWN seconds, during which admit() refuses every call.
+    After that it is half-open: one probe call at a time goes through, and
+    its success closes the circuit while its failure opens it again. Each
+    admission gets exactly one record_success(), record_failure() or
+    release(). A Redis outage leaves the circuit closed.
+
+    Each method is one round trip, its keys and arguments built by the
+    helpers below; the async methods have `_sync` twins for Celery and
+    other sync callers that differ only in how they reach Redis.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._open_key = f"lyzr:breaker:{name}:open"
+        self._half_open_key = f"lyzr:breaker:{name}:half_open"
+        self._probe_key = f"lyzr:breaker:{name}:probe"
+        self._failures_key = f"lyzr:breaker:{name}:failures"
+
+    def _admit_args(self, count_call: bool):
+        # The probe slot expires on its own should the probing process die.
+        keys = [self._open_key, self._half_open_key, self._probe_key, _budget_key()]
+        args = [settings.LYZR_BREAKER_COOLDOWN, int(count_call), RETRY_BUDGET_WINDOW_SECONDS * 2]
+        return keys, args
+
+    def _failure_args(self, admission: Optional[str]):
+        keys = [self._failures_key, self._open_key, self._half_open_key, self._probe_key]
+        args = [
+            settings.LYZR_BREAKER_WINDOW, settings.LYZR_BREAKER_FAILURES,
+            int(admission == PROBE), settings.LYZR_BREAKER_COOLDOWN,
+        ]
+        return keys, args
+
+    def _close_keys(self):
+        return self._half_open_key, self._probe_key, self._failures_key
+
+    def _log_open(self, admission):
+        reason = "probe failed" if admission == PROBE else f"{settings.LYZR_BREAKER_FAILURES} failures"
+        logger.error(f"Lyzr circuit '{self.name}' opened for {settings.LYZR_BREAKER_COOLDOWN}s ({reason}).")
+
+    async def admit(self, count_call: bool = True) -> Optional[str]:
+        """
+        Returns CLOSED or PROBE if the call may go ahead, None if the circuit
+        is open. `count_call` adds it to the retry budget's base; retries of
+        a call already counted pass False.
+        """
+        keys, args = self._admit_args(count_call)
+        try:
+            return _admission(await get_async_redis().register_script(ADMIT_SCRIPT)(keys=keys, args=args))
+        except RedisError as e:
+            logger.warning(f"Circuit breaker '{self.name}' unavailable, admitting call: {e}")
+            return CLOSED
+
+    async def record_success(self, admission: Optional[str]):
+        if admission != PROBE:
+            return
+        try:
+            await get_async_redis().delete(*self._close_keys())
+            logger.info(f"Lyzr circuit '{self.name}' closed after a successful probe.")
+        except RedisError as e:
+            logger.warning(f"Could not close circuit '{self.name}': {e}")
+
+    async def record_failure(self, admission: Optional[str]):
+        keys, args = self._failure_args(admission)
+        try:
+            if await get_async_redis().register_script(FAILURE_SCRIPT)(keys=keys, args=args):
+                self._log_open(admission)
+        except RedisError as e:
+            logger.warning(f"Could not record failure for circuit '{self.name}': {e}")
+
+    async def release(self, admission: Optional[str]):
+        """
+        Hands back an admission whose call ended with no outcome (it never
+        went out, or was abandoned part way), so a probe slot frees up now
+        rather than when it expires.
+        """
+        if admission != PROBE:
+            return
+        try:
+            await get_async_redis().delete(self._probe_key)
+        except RedisError as e:
+            logger.warning(f"Could not release probe for circuit '{self.name}': {e}")
+
+    def admit_sync(self, count_call: bool = True) -> Optional[str]:
+        """Same as admit()."""
+        keys, args = self._admit_args(count_call)
+        try:
+            return _admission(get_redis().register_script(ADMIT_SCRIPT)(keys=keys, args=args))
+        except RedisError as e:
+            logger.warning(f"Circuit breaker '{self.name}' unavailable, admitting call: {e}")
+            return CLOSED
+
+    def record_success_sync(self, admission: Optional[str]):
+        if admission != PROBE:
+            return
+        try:
+            get_redis().delete(*self._close_keys())
+            logger.info(f"Lyzr circuit '{self.name}' closed after a successful probe.")
+        except RedisError as e:
+            logger.warning(f"Could not close circuit '{self.name}': {e}")
+
+    def record_failure_sync(self, admission: Optional[str]):
+        keys, args = self._failure_args(admission)
+        try:
+            if get_redis().register_script(FAILURE_SCRIPT)(keys=keys, args=args):
+                self._log_open(admission)
+        except RedisError as e:
+            logger.warning(f"Could not record failure for circuit '{self.name}': {e}")
+
+    def release_sync(self, admission: Optional[str]):
+        if admission != PROBE:
+            return
+        try:
+            get_redis().delete(self._probe_key)
+        except RedisError as e:
+            logger.warning(f"Could not release probe for circuit '{self.name}': {e}")
+
+
+async def take_retry() -> bool:
+    """Spends one retry from the shared budget; False once this window's budget is used up."""
+    try:
+        pipe = get_async_redis().pipeline(transaction=False)
+        _queue_take_retry(pipe)
+        return _retry_allowed(await pipe.execute())
+    except RedisError as e:
+        logger.warning(f"Retry budget unavailable, allowing retry: {e}")
+        return True
+
+
+def take_retry_sync() -> bool:
+    """Same as take_retry()."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        _queue_take_retry(pipe)
+        return _retry_allowed(pipe.execute())
+    except RedisError as e:
+        logger.warning(f"Retry budget unavailable, allowing retry: {e}")
+        return True
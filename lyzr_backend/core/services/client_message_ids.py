@@ -0,0 +1,79 @@
+import json
+import logging
+from typing import Optional, Tuple
+from django.conf import settings
+from redis.exceptions import RedisError
+from core.services.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Stored under a claimed id until its reply has been delivered.
+PENDING = b'pending'
+
+
+def _key(session_id: str, client_message_id: str) -> str:
+    return f"chat:client_msg:{session_id}:{client_message_id}"
+
+
+def _claimed(stored: Optional[bytes]) -> Tuple[bool, Optional[dict]]:
+    """claim_client_message()'s answer for an id already stored as `stored`."""
+    if stored is None or stored == PENDING:
+        return False, None
+    return False, json.loads(stored)
+
+
+def _reply_entry(session_id: str, client_message_id: str, message: dict) -> Tuple[str, str]:
+    return _key(session_id, client_message_id), json.dumps(message)
+
+
+async def claim_client_message(session_id: str, client_message_id: str) -> Tuple[bool, Optional[dict]]:
+    """
+    Claims a client-generated message id for this session. Returns (True,
+    None) the first time an id is seen. For a repeat it returns (False, the
+    reply already sent for it), or (False, None) while that reply is still
+    being generated. Redis errors let the message through.
+    """
+    key = _key(session_id, client_message_id)
+    try:
+        redis = get_async_redis()
+        if await redis.set(key, PENDING, nx=True, ex=settings.CHAT_CLIENT_MESSAGE_ID_TTL):
+            return True, None
+        stored = await redis.get(key)
+    except RedisError as e:
+        logger.warning(f"Could not check client message id in session '{session_id}': {e}")
+        return True, None
+    return _claimed(stored)
+
+
+async def record_reply(session_id: str, client_message_id: str, message: dict):
+    """Keeps the reply so a retried send gets it back instead of a new inference call."""
+    key, value = _reply_entry(session_id, client_message_id, message)
+    try:
+        await get_async_redis().set(key, value, ex=settings.CHAT_CLIENT_MESSAGE_ID_TTL)
+    except RedisError as e:
+        logger.warning(f"Could not record reply for client message in session '{session_id}': {e}")
+
+
+async def release_client_message(session_id: str, client_message_id: str):
+    """Forgets a claimed id after a failed reply, so the client can retry it."""
+    try:
+        await get_async_redis().delete(_key(session_id, client_message_id))
+    except RedisError as e:
+        logger.warning(f"Could not release client message id in session '{session_id}': {e}")
+
+
+def record_reply_sync(session_id: str, client_message_id: str, message: dict):
+    """Same as record_reply(), for Celery workers."""
+    key, value = _reply_entry(session_id, client_message_id, message)
+    try:
+        get_redis().set(key, value, ex=settings.CHAT_CLIENT_MESSAGE_ID_TTL)
+    except RedisError as e:
+        logger.warning(f"Could not record reply for client message in session '{session_id}': {e}")
+
+
+def release_client_message_sync(session_id: str, client_message_id: str):
+    """Same as release_client_message(), for Celery workers."""
+    try:
+        get_redis().delete(_key(session_id, client_message_id))
+    except RedisError as e:
+        logger.warning(f"Could not release client message id in session '{session_id}': {e}")
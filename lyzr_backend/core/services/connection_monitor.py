@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import time
+import weakref
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionMonitor:
+    """
+    Heartbeat for every chat socket on one event loop. A single task wakes
+    each CHAT_HEARTBEAT_INTERVAL seconds and calls check_liveness(now) on
+    every registered consumer, which either pings its client or closes
+    itself; idle sockets don't each need a timer of their own.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._consumers = weakref.WeakSet()
+        self._task = None
+
+    def __len__(self):
+        return len(self._consumers)
+
+    def register(self, consumer):
+        self._consumers.add(consumer)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def unregister(self, consumer):
+        self._consumers.discard(consumer)
+
+    async def _run(self):
+        while self._consumers:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            for consumer in list(self._consumers):
+                try:
+                    await consumer.check_liveness(now)
+                except Exception as e:
+                    logger.error(f"Heartbeat check failed for {consumer.channel_name}: {e}", exc_info=True)
+
+
+_monitors = weakref.WeakKeyDictionary()
+
+def get_connection_monitor() -> ConnectionMonitor:
+    loop = asyncio.get_running_loop()
+    monitor = _monitors.get(loop)
+    if monitor is None:
+        monitor = ConnectionMonitor(settings.CHAT_HEARTBEAT_INTERVAL)
+        _monitors[loop] = monitor
+    return monitor
@@ -0,0 +1,120 @@
+import asyncio
+import bisect
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+from django.conf import settings
+from core.services.metrics import aincr
+
+T = TypeVar('T')
+
+METRICS_GROUP = 'lyzr_hedging'
+
+
+class LatencyTracker:
+    """Recent successful call durations, kept sorted so a percentile is a lookup."""
+    def __init__(self, size: int = 500):
+        self._recent = deque(maxlen=size)
+        self._sorted = []
+
+    def __len__(self):
+        return len(self._recent)
+
+    def record(self, seconds: float):
+        if len(self._recent) == self._recent.maxlen:
+            oldest = self._recent[0]
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._recent.append(seconds)
+        bisect.insort(self._sorted, seconds)
+
+    def percentile(self, p: float) -> float:
+        return self._sorted[min(len(self._sorted) - 1, int(p / 100 * len(self._sorted)))]
+
+
+class HedgeBudget:
+    """
+    Each call earns `ratio` of a hedge, up to `burst` saved; each hedge
+    spends one. Keeps hedges at no more than `ratio` of calls, so a slow
+    backend sees at most that much extra load from hedging.
+    """
+    def __init__(self, ratio: float, burst: float = 10):
+        self.ratio = ratio
+        self.burst = burst
+        self._credit = burst
+
+    def earn(self):
+        self._credit = min(self.burst, self._credit + self.ratio)
+
+    def spend(self) -> bool:
+        if self._credit < 1:
+            return False
+        self._credit -= 1
+        return True
+
+
+class Hedger:
+    """
+    Runs a call and, if it hasn't finished after the LYZR_CHAT_HEDGE_PERCENTILE
+    latency of recent calls (LYZR_CHAT_HEDGE_MIN_DELAY until enough have been
+    seen, and never less), starts a duplicate. The first to succeed wins and
+    the other is cancelled; a failure waits for the other call. Counters go to
+    metrics:lyzr_hedging (calls, hedged, hedge_wins, budget_exhausted).
+    Per process: state is shared by every event loop's client.
+    """
+    min_samples = 50
+
+    def __init__(self):
+        self.latencies = LatencyTracker()
+        self.budget = HedgeBudget(settings.LYZR_CHAT_HEDGE_BUDGET)
+
+    def delay(self) -> float:
+        floor = settings.LYZR_CHAT_HEDGE_MIN_DELAY
+        if len(self.latencies) < self.min_samples:
+            return floor
+        return max(floor, self.latencies.percentile(settings.LYZR_CHAT_HEDGE_PERCENTILE))
+
+    async def run(self, make_call: Callable[[], Awaitable[T]]) -> T:
+        self.budget.earn()
+        await aincr(METRICS_GROUP, 'calls')
+        primary = self._timed(make_call)
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.delay())
+            if not done:
+                if self.budget.spend():
+                    pending.add(self._timed(make_call))
+                    await aincr(METRICS_GROUP, 'hedged')
+                else:
+                    await aincr(METRICS_GROUP, 'budget_exhausted')
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            await aincr(METRICS_GROUP, 'hedge_wins')
+                        return task.result()
+                    if error is None or task is primary:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _timed(self, make_call) -> asyncio.Future:
+        async def call():
+            started = time.monotonic()
+            result = await make_call()
+            self.latencies.record(time.monotonic() - started)
+            return result
+        return asyncio.ensure_future(call())
+
+
+_hedger = None
+
+def get_chat_hedger() -> Hedger:
+    global _hedger
+    if _hedger is None:
+        _hedger = Hedger()
+    return _hedger
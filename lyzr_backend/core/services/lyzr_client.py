@@ -1,10 +1,28 @@
+import asyncio
+import hashlib
+import http.cookiejar
+import os
+import random
 import requests
+import httpx
 import logging
+import socket
+import threading
 import time
-from typing import Dict, Any, Optional, List
+import weakref
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.connection import HTTPConnection
+from typing import Dict, Any, Optional, List, AsyncIterator
 from django.conf import settings
+from django.core.files.storage import Storage
 import json
 from core.models import Agent
+from core.services.circuit_breaker import CircuitBreaker, take_retry, take_retry_sync
+from core.services.hedging import get_chat_hedger
+from core.services.lyzr_scheduler import LEASE_MARGIN_SECONDS, HostScheduler, scheduler_for
+from core.services.multipart import StreamingMultipartBody, stored_file_chunks
 import uuid 
 
 logger = logging.getLogger(__name__)
@@ -16,6 +34,116 @@ class LyzrAPIError(Exception):
         self.response_data = response_data or {}
         super().__init__(self.message)
 
+class LyzrStreamingUnsupported(LyzrAPIError):
+    """Raised when the inference backend cannot serve a streamed response."""
+    pass
+
+class LyzrCircuitOpenError(LyzrAPIError):
+    """Raised without calling Lyzr while the endpoint's circuit breaker is open."""
+    pass
+
+class LyzrQueueTimeout(LyzrAPIError):
+    """Raised without calling Lyzr when the host's scheduler had no slot free in time."""
+    pass
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def _breaker_for(base_url: str, endpoint: str) -> CircuitBreaker:
+    """One breaker per Lyzr host and API family (agents, inference, rag, train, ...)."""
+    segments = [s for s in urlsplit(endpoint).path.split('/') if s]
+    family = segments[1] if segments[:1] == ['v3'] and len(segments) > 1 else (segments[0] if segments else '')
+    name = f"{urlsplit(base_url).hostname}:{family}"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def _is_breaker_failure(status_code: int) -> bool:
+    """Responses that say the backend is struggling, as opposed to a bad request."""
+    return status_code >= 500 or status_code == 429
+
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff, so retrying clients don't arrive in lockstep."""
+    return random.uniform(0, min(settings.LYZR_RETRY_BACKOFF_CAP, settings.LYZR_RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
+def _prepare_request(api_key: str, base_url: str, endpoint: str, kwargs: Dict[str, Any]) -> str:
+    """The request's URL; adds the API key (and a JSON content type) to `kwargs`' headers."""
+    headers = {'x-api-key': api_key}
+    if 'json' in kwargs:
+        headers['Content-Type'] = 'application/json'
+    kwargs['headers'] = {**headers, **kwargs.get('headers', {})}
+    return f"{base_url.rstrip('/')}/{endpoint.lstrip('/')}"
+
+
+@dataclass(frozen=True)
+class _Attempt:
+    """What one attempt came to: its `result`, or an `error` and whether another attempt might help."""
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[LyzrAPIError] = None
+    breaker_failure: bool = False
+    retryable: bool = False
+    reason: str = ''
+
+
+def _network_failure(error: Exception, attempt: int) -> _Attempt:
+    return _Attempt(
+        error=LyzrAPIError(f"Network error after {attempt} retries: {error}"),
+        breaker_failure=True, retryable=True, reason=f"Network error: {error}",
+    )
+
+
+def _classify_response(response, url: str, attempt: int) -> _Attempt:
+    """Sorts a requests or httpx response into the retry loop's next step."""
+    logger.debug(f"Response status: {response.status_code}, content: {response.text[:500]}")
+    if 200 <= response.status_code < 300:
+        try:
+            return _Attempt(result=response.json() if response.text else {})
+        except ValueError:
+            # Typically an HTML page from a proxy in front of Lyzr: the backend isn't answering.
+            logger.error(f"Non-JSON {response.status_code} response for URL: {url}")
+            return _Attempt(
+                error=LyzrAPIError(
+                    f"Invalid JSON in {response.status_code} response after {attempt} retries",
+                    response.status_code, {'detail': response.text[:500]},
+                ),
+                breaker_failure=True, retryable=True, reason=f"Non-JSON {response.status_code} response",
+            )
+
+    try:
+        error_data = response.json()
+    except ValueError:
+        error_data = {'detail': response.text}
+    breaker_failure = _is_breaker_failure(response.status_code)
+
+    if response.status_code in [404, 422]:
+        error_msg = f"HTTP Error {response.status_code}: {error_data.get('detail', 'Unknown error')}"
+        logger.error(f"{error_msg} for URL: {url}")
+        return _Attempt(error=LyzrAPIError(error_msg, response.status_code, error_data), breaker_failure=breaker_failure)
+
+    error_msg = f"Request failed after {attempt} retries with status {response.status_code}"
+    return _Attempt(
+        error=LyzrAPIError(error_msg, response.status_code, error_data),
+        breaker_failure=breaker_failure, retryable=True, reason=f"Server error {response.status_code}",
+    )
+
+
+def _wants_retry(outcome: _Attempt, attempt: int, max_retries: int) -> bool:
+    """Whether a failed attempt may be retried, before spending from the shared retry budget."""
+    return outcome.retryable and attempt < max_retries
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled connections have TCP keep-alive on, so idle ones survive between calls."""
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.setdefault(
+            'socket_options', HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        )
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+
+
 class LyzrClient:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or settings.LYZR_API_KEY
@@ -23,50 +151,78 @@ class LyzrClient:
         self.rag_base_url = settings.LYZR_RAG_API_BASE_URL
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': 'Lyzr-Django-Client/1.0'})
+        # Keeps up to LYZR_HTTP_POOL_MAXSIZE idle connections per host; more
+        # concurrent calls than that still go out but their connections aren't kept.
+        adapter = PooledHTTPAdapter(pool_connections=4, pool_maxsize=settings.LYZR_HTTP_POOL_MAXSIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # The session is shared between threads (see get_lyzr_client); refusing
+        # cookies leaves it no per-request state to race on.
+        self.session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Requests sent through this client's pools and how many of them needed a new connection."""
+        requests_sent = new_connections = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_sent += pool.num_requests
+                    new_connections += pool.num_connections
+        return {
+            'requests': requests_sent,
+            'new_connections': new_connections,
+            'reused_connections': max(requests_sent - new_connections, 0),
+        }
 
-    def _make_request(self, base_url: str, method: str, endpoint: str, max_retries: int = 3, **kwargs) -> Dict[str, Any]:
-        url = f"{base_url.rstrip('/')}/{endpoint.lstrip('/')}"
-        headers = {'x-api-key': self.api_key}
-        if 'json' in kwargs:
-            headers['Content-Type'] = 'application/json'
-        kwargs['headers'] = {**headers, **kwargs.get('headers', {})}
+    def _make_request(self, base_url: str, method: str, endpoint: str, max_retries: int = 3,
+                      timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Calls Lyzr through the endpoint's circuit breaker. Failures are retried
+        up to `max_retries` times with jittered backoff while the shared retry
+        budget allows; `timeout` defaults to LYZR_REQUEST_TIMEOUT.
+        """
+        url = _prepare_request(self.api_key, base_url, endpoint, kwargs)
+        breaker = _breaker_for(base_url, endpoint)
         
         logger.debug(f"Making Lyzr request: {method} {url} with payload {kwargs.get('json')}")
         
         for attempt in range(max_retries + 1):
+            admission = breaker.admit_sync(count_call=attempt == 0)
+            if admission is None:
+                raise LyzrCircuitOpenError(f"Lyzr circuit '{breaker.name}' is open, not calling {url}")
             try:
-                response = self.session.request(method, url, timeout=90, **kwargs)
-                logger.debug(f"Response status: {response.status_code}, content: {response.text[:500]}")
-                
-                if 200 <= response.status_code < 300:
-                    return response.json() if response.text else {}
-
-                error_data = {}
-                try:
-                    error_data = response.json()
-                except ValueError:
-                    error_data = {'detail': response.text}
-
-                if response.status_code in [404, 422]:
-                    error_msg = f"HTTP Error {response.status_code}: {error_data.get('detail', 'Unknown error')}"
-                    logger.error(f"{error_msg} for URL: {url}")
-                    raise LyzrAPIError(error_msg, response.status_code, error_data)
-                
-                if attempt < max_retries:
-                    wait_time = 2 ** attempt
-                    logger.warning(f"Server error {response.status_code}. Retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    error_msg = f"Request failed after {max_retries} retries with status {response.status_code}"
-                    raise LyzrAPIError(error_msg, response.status_code, error_data)
+                response = self._send(scheduler_for(base_url), method, url, timeout or settings.LYZR_REQUEST_TIMEOUT, **kwargs)
+            except LyzrQueueTimeout:
+                breaker.release_sync(admission)
+                raise
             except requests.exceptions.RequestException as e:
-                if attempt < max_retries:
-                    wait_time = 2 ** attempt
-                    logger.warning(f"Network error: {e}. Retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-                raise LyzrAPIError(f"Network error after retries: {e}")
+                outcome = _network_failure(e, attempt)
+            else:
+                outcome = _classify_response(response, url, attempt)
+
+            if outcome.breaker_failure:
+                breaker.record_failure_sync(admission)
+            else:
+                breaker.record_success_sync(admission)
+            if outcome.error is None:
+                return outcome.result
+            if not (_wants_retry(outcome, attempt, max_retries) and take_retry_sync()):
+                raise outcome.error
+            wait_time = _backoff(attempt)
+            logger.warning(f"{outcome.reason}. Retrying in {wait_time:.1f}s...")
+            time.sleep(wait_time)
+
+    def _send(self, scheduler: HostScheduler, method: str, url: str, timeout: float, **kwargs) -> requests.Response:
+        """One HTTP request, made in a slot from the host's scheduler at the caller's lyzr_priority."""
+        lease = scheduler.acquire_sync(timeout + LEASE_MARGIN_SECONDS, max_wait=timeout)
+        if lease is None:
+            raise LyzrQueueTimeout(f"No Lyzr slot free on {scheduler.host} within {timeout:g}s, not calling {url}")
+        try:
+            return self.session.request(method, url, timeout=timeout, **kwargs)
+        finally:
+            scheduler.release_sync(lease)
 
     def _build_agent_payload(self, agent: Agent) -> Dict[str, Any]:
         provider_map = {
@@ -96,6 +252,11 @@ class LyzrClient:
         }
         return payload
 
+    def agent_fingerprint(self, agent: Agent) -> str:
+        """SHA-256 of the configuration Lyzr sees for the agent; fields Lyzr never gets don't change it."""
+        payload = json.dumps(self._build_agent_payload(agent), sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
     def create_rag_config(self, collection_name: str, model: str) -> Dict[str, Any]:
         payload = {
             "user_id": settings.LYZR_API_KEY, "collection_name": collection_name,
@@ -141,7 +302,8 @@ class LyzrClient:
         logger.info(f"Updating agent {lyzr_agent_id} with complete payload including RAG.")
         return self._make_request(self.agent_base_url, 'PUT', f"v3/agents/{lyzr_agent_id}", json=payload)
         
-    def index_file(self, rag_id: str, file_obj, file_name: str) -> Dict[str, Any]:
+    def _file_upload_target(self, rag_id: str, file_name: str):
+        """The train endpoint, data parser and MIME type for a file, by extension."""
         file_extension = file_name.lower().split('.')[-1]
         
         file_config = {
@@ -172,10 +334,30 @@ class LyzrClient:
             'md': 'text/markdown'
         }
         
-        files = {'file': (file_name, file_obj, mime_types.get(file_extension, 'application/octet-stream'))}
-        data = {"data_parser": config['parser']}
+        return endpoint, config['parser'], mime_types.get(file_extension, 'application/octet-stream')
+
+    def index_file(self, rag_id: str, file_obj, file_name: str) -> Dict[str, Any]:
+        endpoint, parser, mime_type = self._file_upload_target(rag_id, file_name)
+        files = {'file': (file_name, file_obj, mime_type)}
+        data = {"data_parser": parser}
         
-        return self._make_request(self.rag_base_url, 'POST', endpoint, files=files, data=data)
+        return self._make_request(self.rag_base_url, 'POST', endpoint, files=files, data=data, timeout=settings.LYZR_INDEXING_TIMEOUT)
+
+    def index_stored_file(self, rag_id: str, storage: Storage, name: str) -> Dict[str, Any]:
+        """
+        Like index_file, but streams the file from `storage` into the upload
+        in LYZR_UPLOAD_CHUNK_SIZE pieces, so memory use doesn't grow with the
+        file and a retry re-reads it from the start.
+        """
+        endpoint, parser, mime_type = self._file_upload_target(rag_id, name)
+        body = StreamingMultipartBody(
+            {"data_parser": parser}, 'file', name, mime_type, storage.size(name),
+            lambda: stored_file_chunks(storage, name),
+        )
+        return self._make_request(
+            self.rag_base_url, 'POST', endpoint, data=body, headers={'Content-Type': body.content_type},
+            timeout=settings.LYZR_INDEXING_TIMEOUT,
+        )
 
     def index_url(self, rag_id: str, url: str) -> Dict[str, Any]:
         if not url.startswith(('http://', 'https://')):
@@ -186,7 +368,7 @@ class LyzrClient:
         
         try:
             logger.info(f"Training website URL: {url} for RAG: {rag_id}")
-            response = self._make_request(self.rag_base_url, 'POST', endpoint, json=payload)
+            response = self._make_request(self.rag_base_url, 'POST', endpoint, json=payload, timeout=settings.LYZR_INDEXING_TIMEOUT)
             logger.info(f"Successfully indexed URL: {url}")
             return response
         except LyzrAPIError as e:
@@ -199,15 +381,19 @@ class LyzrClient:
         endpoint = f"v3/train/txt/?rag_id={rag_id}"
         files = {'file': (f'{title}.txt', text_content, 'text/plain')}
         data = {"data_parser": "txt_parser"}
-        return self._make_request(self.rag_base_url, 'POST', endpoint, files=files, data=data)
+        return self._make_request(self.rag_base_url, 'POST', endpoint, files=files, data=data, timeout=settings.LYZR_INDEXING_TIMEOUT)
 
-    def get_chat_response(self, agent_id: str, session_id: str, message: str, user_email: str, rag_id: Optional[str] = None) -> Dict[str, Any]:
+    def get_chat_response(self, agent_id: str, session_id: str, message: str, user_email: str, rag_id: Optional[str] = None,
+                          timeout: Optional[float] = None) -> Dict[str, Any]:
         endpoint = "v3/inference/chat/"
         payload = {
             "agent_id": agent_id, "session_id": str(session_id), "message": message,
             "user_id": user_email, "assets": [rag_id] if rag_id else []
         }
-        return self._make_request(self.agent_base_url, 'POST', endpoint, json=payload)
+        return self._make_request(
+            self.agent_base_url, 'POST', endpoint, json=payload,
+            timeout=timeout or settings.LYZR_CHAT_TIMEOUT, max_retries=settings.LYZR_CHAT_MAX_RETRIES,
+        )
 
     def summarize_text(self, text_to_summarize: str) -> Dict[str, Any]:
         """
@@ -223,7 +409,8 @@ class LyzrClient:
                 agent_id=summarizer_agent_id,
                 session_id=str(uuid.uuid4()),
                 message=text_to_summarize,
-                user_email="system-summarizer" 
+                user_email="system-summarizer",
+                timeout=settings.LYZR_REQUEST_TIMEOUT,
             )
             summary_text = response.get('response')
             return {"summary": summary_text}
@@ -238,4 +425,190 @@ class LyzrClient:
             self._make_request(self.rag_base_url, 'GET', 'v3/rag/', max_retries=1)
             return {"status": "healthy", "agent_api": "connected", "rag_api": "connected", "timestamp": time.time()}
         except Exception as e:
-            return {"status": "error", "error": str(e), "timestamp": time.time()}
\ No newline at end of file
+            return {"status": "error", "error": str(e), "timestamp": time.time()}
+
+
+_clients: Dict[tuple, LyzrClient] = {}
+_clients_lock = threading.Lock()
+# A forked Celery child must not share its parent's sockets.
+os.register_at_fork(after_in_child=_clients.clear)
+
+def get_lyzr_client() -> LyzrClient:
+    """
+    Returns the process-wide LyzrClient, whose pooled session keeps
+    connections to the agent and RAG hosts open between calls instead of
+    paying a TCP and TLS handshake per client. Shared by Celery and ASGI
+    worker threads. Keyed by the settings it was built from, so a settings
+    override (e.g. pointing at a local stub) gets a client of its own.
+    """
+    key = (settings.LYZR_API_KEY, settings.LYZR_AGENT_API_BASE_URL, settings.LYZR_RAG_API_BASE_URL)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = LyzrClient()
+    return client
+
+
+class AsyncLyzrClient:
+    """
+    asyncio-native counterpart to LyzrClient for use inside the ASGI consumers.
+    Talks to the same endpoints and raises the same LyzrAPIError, but awaits the
+    network and the retry backoff instead of parking a worker thread.
+    """
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or settings.LYZR_API_KEY
+        self.agent_base_url = settings.LYZR_AGENT_API_BASE_URL
+        self.rag_base_url = settings.LYZR_RAG_API_BASE_URL
+        self.http = httpx.AsyncClient(headers={'User-Agent': 'Lyzr-Django-Client/1.0'})
+
+    async def _make_request(self, base_url: str, method: str, endpoint: str, max_retries: int = 3,
+                            timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """Same as LyzrClient._make_request(), awaiting the network and the backoff."""
+        url = _prepare_request(self.api_key, base_url, endpoint, kwargs)
+        breaker = _breaker_for(base_url, endpoint)
+
+        logger.debug(f"Making async Lyzr request: {method} {url} with payload {kwargs.get('json')}")
+
+        for attempt in range(max_retries + 1):
+            admission = await breaker.admit(count_call=attempt == 0)
+            if admission is None:
+                raise LyzrCircuitOpenError(f"Lyzr circuit '{breaker.name}' is open, not calling {url}")
+            try:
+                response = await self._send(scheduler_for(base_url), method, url, timeout or settings.LYZR_REQUEST_TIMEOUT, **kwargs)
+            except (LyzrQueueTimeout, asyncio.CancelledError):
+                # Never reached Lyzr, or a hedge cancelled it: no outcome to record.
+                await breaker.release(admission)
+                raise
+            except httpx.HTTPError as e:
+                outcome = _network_failure(e, attempt)
+            else:
+                outcome = _classify_response(response, url, attempt)
+
+            if outcome.breaker_failure:
+                await breaker.record_failure(admission)
+            else:
+                await breaker.record_success(admission)
+            if outcome.error is None:
+                return outcome.result
+            if not (_wants_retry(outcome, attempt, max_retries) and await take_retry()):
+                raise outcome.error
+            wait_time = _backoff(attempt)
+            logger.warning(f"{outcome.reason}. Retrying in {wait_time:.1f}s...")
+            await asyncio.sleep(wait_time)
+
+    async def _send(self, scheduler: HostScheduler, method: str, url: str, timeout: float, **kwargs) -> httpx.Response:
+        """One HTTP request, made in a slot from the host's scheduler at the caller's lyzr_priority."""
+        lease = await scheduler.acquire(timeout + LEASE_MARGIN_SECONDS, max_wait=timeout)
+        if lease is None:
+            raise LyzrQueueTimeout(f"No Lyzr slot free on {scheduler.host} within {timeout:g}s, not calling {url}")
+        try:
+            return await self.http.request(method, url, timeout=timeout, **kwargs)
+        finally:
+            await scheduler.release(lease)
+
+    async def get_chat_response(self, agent_id: str, session_id: str, message: str, user_email: str, rag_id: Optional[str] = None) -> Dict[str, Any]:
+        endpoint = "v3/inference/chat/"
+        payload = {
+            "agent_id": agent_id, "session_id": str(session_id), "message": message,
+            "user_id": user_email, "assets": [rag_id] if rag_id else []
+        }
+        def call():
+            return self._make_request(
+                self.agent_base_url, 'POST', endpoint, json=payload,
+                timeout=settings.LYZR_CHAT_TIMEOUT, max_retries=settings.LYZR_CHAT_MAX_RETRIES,
+            )
+        if settings.LYZR_CHAT_HEDGING:
+            return await get_chat_hedger().run(call)
+        return await call()
+
+    async def stream_chat_response(self, agent_id: str, session_id: str, message: str, user_email: str, rag_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Yields the agent's reply incrementally from the server-sent-events
+        inference endpoint. Raises LyzrStreamingUnsupported before the first
+        chunk if the backend can't stream, so callers can fall back to
+        get_chat_response. There are no retries once output has started, and
+        LYZR_CHAT_TIMEOUT bounds the wait for each chunk.
+        """
+        url = f"{self.agent_base_url.rstrip('/')}/v3/inference/stream/"
+        breaker = _breaker_for(self.agent_base_url, 'v3/inference/stream/')
+        payload = {
+            "agent_id": agent_id, "session_id": str(session_id), "message": message,
+            "user_id": user_email, "assets": [rag_id] if rag_id else []
+        }
+        headers = {'x-api-key': self.api_key, 'Content-Type': 'application/json', 'Accept': 'text/event-stream'}
+
+        scheduler = scheduler_for(self.agent_base_url)
+        timeout = settings.LYZR_CHAT_TIMEOUT
+
+        admission = await breaker.admit()
+        if admission is None:
+            raise LyzrCircuitOpenError(f"Lyzr circuit '{breaker.name}' is open, not calling {url}")
+        # The slot is held until the stream ends, or until its lease lapses
+        # should a stream outlast the chunk timeout plus LEASE_MARGIN_SECONDS.
+        lease = await scheduler.acquire(timeout + LEASE_MARGIN_SECONDS, max_wait=timeout)
+        if lease is None:
+            await breaker.release(admission)
+            raise LyzrQueueTimeout(f"No Lyzr slot free on {scheduler.host} within {timeout:g}s, not calling {url}")
+
+        # The admission's one outcome, recorded once the stream is over; left
+        # None if the caller stops reading early, which says nothing about Lyzr.
+        succeeded = None
+        try:
+            async with self.http.stream('POST', url, json=payload, headers=headers, timeout=timeout) as response:
+                if response.status_code in [404, 405, 501]:
+                    succeeded = True
+                    raise LyzrStreamingUnsupported(f"Streaming not available (HTTP {response.status_code})", response.status_code)
+                if not 200 <= response.status_code < 300:
+                    await response.aread()
+                    succeeded = not _is_breaker_failure(response.status_code)
+                    raise LyzrAPIError(f"HTTP Error {response.status_code} while streaming", response.status_code, {'detail': response.text})
+                if 'text/event-stream' not in response.headers.get('content-type', ''):
+                    succeeded = True
+                    raise LyzrStreamingUnsupported("Inference endpoint did not return an event stream", response.status_code)
+
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[5:].lstrip(' ')
+                    if data == '[DONE]':
+                        break
+                    try:
+                        parsed = json.loads(data)
+                    except ValueError:
+                        parsed = data
+                    if isinstance(parsed, dict):
+                        parsed = parsed.get('content') or parsed.get('response') or ''
+                    if isinstance(parsed, str) and parsed:
+                        yield parsed
+                succeeded = True
+        except httpx.HTTPError as e:
+            succeeded = False
+            raise LyzrAPIError(f"Network error while streaming: {e}")
+        finally:
+            await scheduler.release(lease)
+            if succeeded is None:
+                await breaker.release(admission)
+            elif succeeded:
+                await breaker.record_success(admission)
+            else:
+                await breaker.record_failure(admission)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_lyzr_client() -> AsyncLyzrClient:
+    """
+    Returns the AsyncLyzrClient bound to the running event loop, so every
+    consumer on it shares one connection pool.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncLyzrClient()
+        _async_clients[loop] = client
+    return client
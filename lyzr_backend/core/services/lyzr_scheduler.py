@@ -0,0 +1,249 @@
+import asyncio
+import contextvars
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+from django.conf import settings
+from redis.exceptions import RedisError
+from core.services.metrics import counters_key, get_counters
+from core.services.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Priority classes for outbound Lyzr calls, highest first, each with the
+# share of a host's LYZR_HOST_CONCURRENCY slots and LYZR_HOST_REQUESTS_PER_SECOND
+# it may use. The rest is headroom only the classes above can take.
+INTERACTIVE = 'interactive'
+TICKETS = 'tickets'
+INDEXING = 'indexing'
+SUMMARIES = 'summaries'
+SYNC = 'sync'
+PRIORITY_SHARES = {INTERACTIVE: 1.0, TICKETS: 0.9, INDEXING: 0.75, SUMMARIES: 0.5, SYNC: 0.5}
+PRIORITIES = tuple(PRIORITY_SHARES)
+
+# Per class: calls, waited (calls that queued at all), wait_ms and timeouts.
+METRICS_GROUP = 'lyzr_scheduler'
+
+# A waiter re-registers on every poll and is forgotten this long after its
+# last one, so a process that dies while queued stops holding others back.
+WAITER_TTL_SECONDS = 2
+POLL_INTERVAL_SECONDS = (0.02, 0.08)
+# Leases outlive the call's own timeout by this much before they're reclaimed.
+LEASE_MARGIN_SECONDS = 10
+
+# One call against a host's budget. KEYS: leases (member -> expiry), token
+# bucket, the caller's class's waiters, the metrics hash, then the waiters
+# of every higher class. ARGV: now, member, share, concurrency, rate, lease
+# seconds, waiter TTL, milliseconds waited so far, class, '1' if this is
+# the caller's last try. Returns '0' when the call may go ahead. Otherwise
+# it is left registered as waiting and gets back the seconds until a token
+# frees up, or -1 to poll; on a last try it is unregistered and counted as
+# a timeout instead, and gets back 'timeout'.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+local share = tonumber(ARGV[3])
+local concurrency = tonumber(ARGV[4])
+local rate = tonumber(ARGV[5])
+local lease_seconds = tonumber(ARGV[6])
+local waiter_ttl = tonumber(ARGV[7])
+
+local function wait(seconds)
+    if ARGV[10] == '1' then
+        redis.call('ZREM', KEYS[3], member)
+        redis.call('HINCRBY', KEYS[4], ARGV[9] .. ':timeouts', 1)
+        return 'timeout'
+    end
+    redis.call('ZADD', KEYS[3], now + waiter_ttl, member)
+    redis.call('EXPIRE', KEYS[3], math.ceil(waiter_ttl) + 1)
+    return tostring(seconds)
+end
+
+for i = 5, #KEYS do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+    if redis.call('ZCARD', KEYS[i]) > 0 then
+        return wait(-1)
+    end
+end
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= concurrency * share then
+    return wait(-1)
+end
+
+local capacity = math.max(rate, 1)
+local bucket = redis.call('HMGET', KEYS[2], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+tokens = math.min(capacity, tokens + elapsed * rate)
+local reserve = capacity * (1 - share)
+if tokens - 1 < reserve then
+    return wait((1 + reserve - tokens) / rate)
+end
+
+redis.call('HSET', KEYS[2], 'tokens', tokens - 1, 'ts', now)
+redis.call('EXPIRE', KEYS[2], math.ceil(capacity / rate) + 1)
+redis.call('ZADD', KEYS[1], now + lease_seconds, member)
+if redis.call('TTL', KEYS[1]) < lease_seconds then
+    redis.call('EXPIRE', KEYS[1], math.ceil(lease_seconds))
+end
+redis.call('ZREM', KEYS[3], member)
+
+local waited_ms = tonumber(ARGV[8])
+redis.call('HINCRBY', KEYS[4], ARGV[9] .. ':calls', 1)
+if waited_ms > 0 then
+    redis.call('HINCRBY', KEYS[4], ARGV[9] .. ':waited', 1)
+    redis.call('HINCRBY', KEYS[4], ARGV[9] .. ':wait_ms', waited_ms)
+end
+return '0'
+"""
+
+_priority = contextvars.ContextVar('lyzr_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def lyzr_priority(priority: str):
+    """Runs Lyzr calls made inside it (or inside the function it decorates) at `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class HostScheduler:
+    """
+    Cluster-wide concurrency and request-rate budget for one Lyzr host,
+    shared by every web and Celery process through Redis. A call waits
+    while any higher class has callers waiting, or while its own class has
+    used up its share of slots or tokens, so a bulk re-index gives way to
+    live chats instead of competing with them. Each attempt, including the
+    last one that gives up, is one script call; Redis errors let the call
+    through.
+
+    acquire() hands back a lease to pass to release() once the response has
+    been read, or None if no slot came free within `max_wait`. The async
+    methods have `_sync` twins for Celery and other sync callers.
+    """
+    def __init__(self, host: str):
+        self.host = host
+        self._prefix = f"lyzr:sched:{host}"
+
+    def _waiting_key(self, priority: str) -> str:
+        return f"{self._prefix}:waiting:{priority}"
+
+    def _leases_key(self) -> str:
+        return f"{self._prefix}:leases"
+
+    def _script_args(self, priority: str, lease: str, lease_seconds: float, waited: float, last_try: bool):
+        higher = PRIORITIES[:PRIORITIES.index(priority)]
+        keys = [
+            self._leases_key(), f"{self._prefix}:bucket", self._waiting_key(priority),
+            counters_key(METRICS_GROUP), *(self._waiting_key(p) for p in higher),
+        ]
+        args = [
+            time.time(), lease, PRIORITY_SHARES[priority], settings.LYZR_HOST_CONCURRENCY,
+            settings.LYZR_HOST_REQUESTS_PER_SECOND, lease_seconds, WAITER_TTL_SECONDS, int(waited * 1000), priority,
+            int(last_try),
+        ]
+        return keys, args
+
+    def _pause(self, hint: float, remaining: float) -> float:
+        return min(hint if hint > 0 else random.uniform(*POLL_INTERVAL_SECONDS), max(remaining, 0))
+
+    def _log_timeout(self, priority: str, waited: float):
+        logger.warning(f"No Lyzr slot on {self.host} for a {priority} call after {waited:.1f}s.")
+
+    async def acquire(self, lease_seconds: float, max_wait: float) -> Optional[str]:
+        priority = current_priority()
+        lease = uuid.uuid4().hex
+        if not settings.LYZR_SCHEDULER:
+            return lease
+        started = time.monotonic()
+        try:
+            script = get_async_redis().register_script(ACQUIRE_SCRIPT)
+            while True:
+                waited = time.monotonic() - started
+                keys, args = self._script_args(priority, lease, lease_seconds, waited, waited >= max_wait)
+                reply = (await script(keys=keys, args=args)).decode()
+                if reply == '0':
+                    return lease
+                if reply == 'timeout':
+                    self._log_timeout(priority, waited)
+                    return None
+                await asyncio.sleep(self._pause(float(reply), max_wait - waited))
+        except RedisError as e:
+            logger.warning(f"Lyzr scheduler unavailable, admitting call: {e}")
+            return lease
+
+    async def release(self, lease: str):
+        if not settings.LYZR_SCHEDULER:
+            return
+        try:
+            await get_async_redis().zrem(self._leases_key(), lease)
+        except RedisError as e:
+            logger.warning(f"Could not release Lyzr slot on {self.host}: {e}")
+
+    def acquire_sync(self, lease_seconds: float, max_wait: float) -> Optional[str]:
+        """Same as acquire()."""
+        priority = current_priority()
+        lease = uuid.uuid4().hex
+        if not settings.LYZR_SCHEDULER:
+            return lease
+        started = time.monotonic()
+        try:
+            script = get_redis().register_script(ACQUIRE_SCRIPT)
+            while True:
+                waited = time.monotonic() - started
+                keys, args = self._script_args(priority, lease, lease_seconds, waited, waited >= max_wait)
+                reply = script(keys=keys, args=args).decode()
+                if reply == '0':
+                    return lease
+                if reply == 'timeout':
+                    self._log_timeout(priority, waited)
+                    return None
+                time.sleep(self._pause(float(reply), max_wait - waited))
+        except RedisError as e:
+            logger.warning(f"Lyzr scheduler unavailable, admitting call: {e}")
+            return lease
+
+    def release_sync(self, lease: str):
+        if not settings.LYZR_SCHEDULER:
+            return
+        try:
+            get_redis().zrem(self._leases_key(), lease)
+        except RedisError as e:
+            logger.warning(f"Could not release Lyzr slot on {self.host}: {e}")
+
+
+_schedulers: Dict[str, HostScheduler] = {}
+
+def scheduler_for(base_url: str) -> HostScheduler:
+    host = urlsplit(base_url).hostname
+    scheduler = _schedulers.get(host)
+    if scheduler is None:
+        scheduler = _schedulers[host] = HostScheduler(host)
+    return scheduler
+
+
+def queue_wait_stats() -> Dict[str, Dict[str, float]]:
+    """Per class: calls, how many queued, mean queue wait in ms over all calls, and timeouts."""
+    counters = get_counters(METRICS_GROUP)
+    stats = {}
+    for priority in PRIORITIES:
+        calls = counters.get(f'{priority}:calls', 0)
+        stats[priority] = {
+            'calls': calls,
+            'waited': counters.get(f'{priority}:waited', 0),
+            'mean_wait_ms': counters.get(f'{priority}:wait_ms', 0) / calls if calls else 0.0,
+            'timeouts': counters.get(f'{priority}:timeouts', 0),
+        }
+    return stats
@@ -0,0 +1,153 @@
+import asyncio
+import atexit
+import logging
+import uuid
+import weakref
+from typing import List
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from core.models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind queue for chat Messages on one event loop.
+
+    Messages already carry their primary key and created_at when they are
+    added, so the consumer can broadcast them straight away. Pending rows are
+    written with a single bulk_create, and the conversations they belong to
+    get one coalesced updated_at UPDATE, whenever CHAT_MESSAGE_FLUSH_INTERVAL
+    elapses or CHAT_MESSAGE_FLUSH_SIZE messages are waiting. Anything still
+    queued when the interpreter exits is flushed synchronously.
+
+    A batch rejected by the database is retried row by row and the rows that
+    still fail are dropped, so one bad message can't hold up the rest. Other
+    failures are retried `max_attempts` times, and at most `limit` messages
+    wait; past either, messages are dropped and logged.
+    """
+    def __init__(self, flush_interval: float, max_size: int, max_attempts: int = 5, limit: int = 5000):
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.limit = limit
+        self._pending: List[Message] = []
+        self._inflight: List[Message] = []
+        self._attempts = 0
+        self._lock = asyncio.Lock()
+        self._timer = None
+        atexit.register(self.flush_sync)
+
+    def add(self, message: Message):
+        self._pending.append(message)
+        overflow = len(self._pending) + len(self._inflight) - self.limit
+        if overflow > 0:
+            dropped, self._pending = self._pending[:overflow], self._pending[overflow:]
+            logger.error(f"Message buffer full; dropped {len(dropped)} unwritten messages: {[str(m.id) for m in dropped]}")
+        if len(self._pending) >= self.max_size:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(self.flush_interval)
+
+    def has_pending(self, conversation_id) -> bool:
+        return any(message.conversation_id == conversation_id for message in self._pending + self._inflight)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self, conversation_id=None):
+        """Writes every pending message, or with `conversation_id` only that conversation's."""
+        async with self._lock:
+            if conversation_id is None:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._inflight, self._pending = self._pending, []
+            else:
+                # The rest keep waiting for the timer, so they're still written in batches.
+                self._inflight = [m for m in self._pending if m.conversation_id == conversation_id]
+                self._pending = [m for m in self._pending if m.conversation_id != conversation_id]
+            if not self._inflight:
+                return
+            try:
+                await database_sync_to_async(self._write)(self._inflight)
+                self._attempts = 0
+            except Exception as e:
+                self._attempts += 1
+                if self._attempts >= self.max_attempts:
+                    logger.error(
+                        f"Dropped {len(self._inflight)} buffered messages after {self._attempts} failed flushes: {e}",
+                        exc_info=True,
+                    )
+                    self._attempts = 0
+                else:
+                    logger.error(f"Failed to flush {len(self._inflight)} buffered messages, will retry: {e}", exc_info=True)
+                    self._pending = self._inflight + self._pending
+                self._schedule(self.flush_interval)
+            finally:
+                self._inflight = []
+
+    @classmethod
+    def _write(cls, messages: List[Message]):
+        try:
+            cls._write_batch(messages)
+        except IntegrityError:
+            # E.g. a conversation deleted before the flush; keep the rest of the batch.
+            for message in messages:
+                try:
+                    cls._write_batch([message])
+                except IntegrityError as e:
+                    logger.error(f"Dropped buffered message {message.id} the database rejected: {e}")
+
+    @staticmethod
+    def _write_batch(messages: List[Message]):
+        conversation_ids = {message.conversation_id for message in messages}
+        last_activity = max(message.created_at for message in messages)
+
+        with transaction.atomic():
+            # ignore_conflicts keeps a retried batch from failing on rows that made it in.
+            Message.objects.bulk_create(messages, ignore_conflicts=True)
+            Conversation.objects.filter(id__in=conversation_ids).update(updated_at=last_activity)
+
+    def flush_sync(self):
+        """Writes whatever is still queued; used on interpreter shutdown."""
+        messages = self._inflight + self._pending
+        if not messages:
+            return
+        self._pending, self._inflight = [], []
+        try:
+            self._write(messages)
+            logger.info(f"Flushed {len(messages)} buffered messages on shutdown.")
+        except Exception as e:
+            logger.error(f"Lost {len(messages)} buffered messages on shutdown: {e}", exc_info=True)
+
+
+_buffers = weakref.WeakKeyDictionary()
+
+def get_message_buffer() -> MessageWriteBuffer:
+    loop = asyncio.get_running_loop()
+    buffer = _buffers.get(loop)
+    if buffer is None:
+        buffer = MessageWriteBuffer(
+            settings.CHAT_MESSAGE_FLUSH_INTERVAL, settings.CHAT_MESSAGE_FLUSH_SIZE,
+            settings.CHAT_MESSAGE_FLUSH_MAX_ATTEMPTS, settings.CHAT_MESSAGE_BUFFER_LIMIT,
+        )
+        _buffers[loop] = buffer
+    return buffer
+
+
+def build_message(conversation_id, sender: str, content: str, message_id=None, created_at=None, metadata=None) -> Message:
+    return Message(
+        id=message_id or uuid.uuid4(),
+        conversation_id=conversation_id,
+        sender_type=sender,
+        content=content,
+        created_at=created_at or timezone.now(),
+        metadata=metadata or {},
+    )
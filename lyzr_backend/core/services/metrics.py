@@ -0,0 +1,33 @@
+import logging
+from typing import Dict
+from redis.exceptions import RedisError
+from core.services.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Counters live in Redis hashes named metrics:<group> so every process and
+# worker adds to the same totals; read them back with get_counters(). Lua
+# scripts that bump counters themselves take the hash from counters_key().
+
+
+def counters_key(group: str) -> str:
+    return f"metrics:{group}"
+
+
+def incr(group: str, field: str, amount: int = 1):
+    try:
+        get_redis().hincrby(counters_key(group), field, amount)
+    except RedisError as e:
+        logger.debug(f"Dropped metric {group}.{field}: {e}")
+
+
+async def aincr(group: str, field: str, amount: int = 1):
+    try:
+        await get_async_redis().hincrby(counters_key(group), field, amount)
+    except RedisError as e:
+        logger.debug(f"Dropped metric {group}.{field}: {e}")
+
+
+def get_counters(group: str) -> Dict[str, int]:
+    raw = get_redis().hgetall(counters_key(group))
+    return {field.decode(): int(value) for field, value in raw.items()}
@@ -0,0 +1,73 @@
+import uuid
+from typing import Callable, Dict, Iterable, Iterator
+from django.conf import settings
+from django.core.files.storage import Storage
+from storages.backends.azure_storage import AzureStorage
+from storages.utils import clean_name, safe_join
+
+
+def _quote(value: str) -> str:
+    # The same escaping browsers (and urllib3) use for form-data names.
+    return value.replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class StreamingMultipartBody:
+    """
+    A multipart/form-data request body with form `fields` and one file,
+    produced a chunk at a time from `open_chunks()` so the file is never
+    held in memory whole. It has a length, so requests sends it with a
+    Content-Length rather than chunked encoding, and each iteration calls
+    `open_chunks()` afresh, so a retried request re-reads the file from the
+    start instead of sending an exhausted stream.
+    """
+    def __init__(self, fields: Dict[str, str], file_field: str, file_name: str, file_type: str,
+                 file_size: int, open_chunks: Callable[[], Iterable[bytes]]):
+        self.boundary = uuid.uuid4().hex
+        self.file_size = file_size
+        self._open_chunks = open_chunks
+        parts = [
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        ]
+        parts.append(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(file_field)}"; '
+            f'filename="{_quote(file_name)}"\r\nContent-Type: {file_type}\r\n\r\n'
+        )
+        self._head = ''.join(parts).encode()
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode()
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self) -> int:
+        return len(self._head) + self.file_size + len(self._tail)
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self._head
+        sent = 0
+        for chunk in self._open_chunks():
+            sent += len(chunk)
+            yield chunk
+        if sent != self.file_size:
+            # The declared Content-Length would be wrong; fail the request rather than send a corrupt upload.
+            raise IOError(f"File changed while uploading: expected {self.file_size} bytes, read {sent}")
+        yield self._tail
+
+
+def stored_file_chunks(storage: Storage, name: str, chunk_size: int = None) -> Iterator[bytes]:
+    """
+    Reads a stored file `chunk_size` (LYZR_UPLOAD_CHUNK_SIZE) bytes at a
+    time. Azure blobs are fetched with one ranged GET per chunk instead of
+    being downloaded to a temporary file first, as opening them would.
+    """
+    chunk_size = chunk_size or settings.LYZR_UPLOAD_CHUNK_SIZE
+    if isinstance(storage, AzureStorage):
+        # The blob name the backend itself would use: `name` under AZURE_LOCATION.
+        blob = storage.client.get_blob_client(safe_join(storage.location, clean_name(name)))
+        size = blob.get_blob_properties(timeout=storage.timeout).size
+        for offset in range(0, size, chunk_size):
+            yield blob.download_blob(offset=offset, length=min(chunk_size, size - offset), timeout=storage.timeout).readall()
+        return
+    with storage.open(name, 'rb') as f:
+        yield from f.chunks(chunk_size)
@@ -0,0 +1,59 @@
+import logging
+from typing import Optional
+from redis.exceptions import RedisError
+from core.services.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Live sockets refresh the count's TTL from the heartbeat (see
+# ChatConsumer.check_liveness), so it only lapses once none are left; a
+# process that dies without decrementing leaves a session looking busier
+# than it is until then.
+PRESENCE_TTL_SECONDS = 24 * 60 * 60
+
+
+def _key(session_id: str) -> str:
+    return f"chat:subscribers:{session_id}"
+
+
+async def join_session(session_id: str) -> Optional[int]:
+    """Counts a socket into the session's group; returns the new total, or None if Redis is down."""
+    try:
+        pipe = get_async_redis().pipeline(transaction=True)
+        pipe.incr(_key(session_id))
+        pipe.expire(_key(session_id), PRESENCE_TTL_SECONDS)
+        count, _ = await pipe.execute()
+        return count
+    except RedisError as e:
+        logger.warning(f"Could not record subscriber for session '{session_id}': {e}")
+        return None
+
+
+async def count_subscribers(session_id: str) -> Optional[int]:
+    """Sockets currently counted into the session across all nodes, or None if Redis is down."""
+    try:
+        return int(await get_async_redis().get(_key(session_id)) or 0)
+    except RedisError as e:
+        logger.warning(f"Could not count subscribers for session '{session_id}': {e}")
+        return None
+
+
+async def refresh_session(session_id: str):
+    """Keeps the session's count alive while a socket counted into it is still open."""
+    try:
+        await get_async_redis().expire(_key(session_id), PRESENCE_TTL_SECONDS)
+    except RedisError as e:
+        logger.warning(f"Could not refresh subscribers for session '{session_id}': {e}")
+
+
+async def leave_session(session_id: str) -> Optional[int]:
+    """Counts a socket out of the session's group; returns the remaining total, or None if unknown."""
+    try:
+        redis = get_async_redis()
+        count = await redis.decr(_key(session_id))
+        if count <= 0:
+            await redis.delete(_key(session_id))
+        return max(count, 0)
+    except RedisError as e:
+        logger.warning(f"Could not release subscriber for session '{session_id}': {e}")
+        return None
@@ -0,0 +1,141 @@
+import logging
+import time
+from typing import Iterable, Optional, Tuple
+from django.conf import settings
+from redis.exceptions import RedisError
+from core.services.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Token buckets, one hash per key holding the token level and when it was
+# last computed. All buckets of a check are tested and charged in one
+# script call, so a request is either admitted by every bucket or by none.
+# KEYS: bucket keys. ARGV[1]: now, in seconds on the caller's clock; then
+# per key, tokens per second and capacity. Returns '0' when admitted, else
+# the seconds to wait.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local capacity = tonumber(ARGV[2 * i + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    tokens = math.min(capacity, tokens + elapsed * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local capacity = tonumber(ARGV[2 * i + 1])
+    redis.call('HSET', key, 'tokens', levels[i] - 1, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return '0'
+"""
+
+# (bucket name, requests per minute); a None rate means no limit for that bucket.
+Limit = Tuple[str, Optional[int]]
+
+
+def plan_limit(plan, feature: str, default: int) -> Optional[int]:
+    """A per-minute limit from Plan.features, the default if unset, or None for 'unlimited'."""
+    value = plan.features.get(feature, default) if plan else default
+    if isinstance(value, str) and value.lower() == 'unlimited':
+        return None
+    return int(value)
+
+
+def _strip_port(address: str) -> str:
+    if address.startswith('['):
+        return address[1:].split(']')[0]
+    if address.count(':') == 1:
+        return address.split(':')[0]
+    return address
+
+
+def client_ip(source) -> Optional[str]:
+    """
+    The caller's address for the per-IP buckets, from an ASGI scope (chat
+    sockets) or a Django request (views), so both paths key a client the
+    same way. Behind TRUSTED_PROXY_HOPS proxies this is the X-Forwarded-For
+    entry the outermost of them appended, counted from the right: entries
+    to its left come from the client and can be forged. Without the header
+    it is the peer address. A port the proxy may append is dropped.
+    """
+    if isinstance(source, dict):
+        forwarded = ','.join(
+            value.decode('latin-1') for name, value in source.get('headers') or [] if name == b'x-forwarded-for'
+        )
+        peer = (source.get('client') or [None])[0]
+    else:
+        forwarded = source.META.get('HTTP_X_FORWARDED_FOR', '')
+        peer = source.META.get('REMOTE_ADDR')
+    entries = [entry.strip() for entry in forwarded.split(',') if entry.strip()]
+    hops = settings.TRUSTED_PROXY_HOPS
+    address = entries[-hops] if hops and len(entries) >= hops else peer
+    return _strip_port(address) if address else None
+
+
+def widget_request_limits(agent_id, agent_limit: Optional[int], ip: Optional[str]) -> Tuple[Limit, ...]:
+    """Buckets charged for loading the widget: its config fetch and each socket connect."""
+    return (
+        (f"widget:agent:{agent_id}", agent_limit),
+        (f"widget:ip:{ip}", settings.WIDGET_REQUESTS_PER_MINUTE_PER_IP if ip else None),
+    )
+
+
+def chat_message_limits(agent_id, agent_limit: Optional[int], session_id: str, ip: Optional[str]) -> Tuple[Limit, ...]:
+    """Buckets charged for each user message sent over a chat socket."""
+    return (
+        (f"messages:agent:{agent_id}", agent_limit),
+        (f"messages:session:{session_id}", settings.CHAT_MESSAGES_PER_MINUTE_PER_SESSION),
+        (f"messages:ip:{ip}", settings.CHAT_MESSAGES_PER_MINUTE_PER_IP if ip else None),
+    )
+
+
+def _script_args(limits: Iterable[Limit]):
+    keys, args = [], [time.time()]
+    for name, per_minute in limits:
+        if per_minute is None:
+            continue
+        # A bucket holds up to a minute's worth of requests.
+        keys.append(f"ratelimit:{name}")
+        args.extend((per_minute / 60, max(per_minute, 1)))
+    return keys, args
+
+
+async def check_rate(limits: Iterable[Limit]) -> float:
+    """
+    Takes one token from every bucket in `limits` in a single Redis round
+    trip. Returns 0 if the request is admitted, otherwise the seconds until
+    it would be. Redis errors admit the request.
+    """
+    keys, args = _script_args(limits)
+    if not keys:
+        return 0
+    try:
+        redis = get_async_redis()
+        return float(await redis.register_script(TOKEN_BUCKET_SCRIPT)(keys=keys, args=args))
+    except RedisError as e:
+        logger.warning(f"Rate limiter unavailable, admitting request: {e}")
+        return 0
+
+
+def check_rate_sync(limits: Iterable[Limit]) -> float:
+    """Same as check_rate(), for sync views."""
+    keys, args = _script_args(limits)
+    if not keys:
+        return 0
+    try:
+        return float(get_redis().register_script(TOKEN_BUCKET_SCRIPT)(keys=keys, args=args))
+    except RedisError as e:
+        logger.warning(f"Rate limiter unavailable, admitting request: {e}")
+        return 0
@@ -0,0 +1,25 @@
+import asyncio
+import weakref
+import redis.asyncio as aioredis
+from django.conf import settings
+from django_redis import get_redis_connection
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_redis():
+    """Raw connection to the cache Redis, for keys shared across processes."""
+    return get_redis_connection('default')
+
+
+def get_async_redis() -> aioredis.Redis:
+    """
+    asyncio connection to the same Redis as get_redis(), one pool per running
+    event loop so consumers never block the loop on Redis round trips.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(settings.CACHES['default']['LOCATION'])
+        _async_clients[loop] = client
+    return client
@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import re
+import time
+from typing import Optional
+from django.conf import settings
+from redis.exceptions import RedisError
+from core.services.metrics import aincr, incr
+from core.services.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Stores an answer and trims the agent's LRU index in one round trip.
+# KEYS: entry, LRU index. ARGV: response, TTL, max entries, now. Returns
+# how many least recently used entries were evicted.
+STORE_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[4], KEYS[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+local overflow = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[3])
+if overflow <= 0 then
+    return 0
+end
+local evicted = redis.call('ZPOPMIN', KEYS[2], overflow)
+for i = 1, #evicted, 2 do
+    redis.call('DEL', evicted[i])
+end
+return #evicted / 2
+"""
+
+
+def _agent_version_key(agent_id) -> str:
+    return f"chat_cache:agent_version:{agent_id}"
+
+
+def _kb_version_key(agent_id) -> str:
+    return f"chat_cache:kb_version:{agent_id}"
+
+
+def _lru_key(agent_id) -> str:
+    return f"chat_cache:lru:{agent_id}"
+
+
+def normalize_message(text: str) -> str:
+    """Folds case, whitespace and trailing punctuation so trivially different phrasings share an entry."""
+    return _WHITESPACE.sub(' ', text.strip().lower()).rstrip('?!. ')
+
+
+def bump_agent_config_version(agent_id):
+    """Called after the agent's configuration is pushed to Lyzr; orphans every cached answer."""
+    try:
+        get_redis().incr(_agent_version_key(agent_id))
+    except RedisError as e:
+        logger.error(f"Could not invalidate response cache for agent {agent_id}: {e}")
+
+
+def bump_knowledge_base_version(agent_id):
+    """Called after a knowledge source is indexed; orphans every cached answer."""
+    try:
+        get_redis().incr(_kb_version_key(agent_id))
+    except RedisError as e:
+        logger.error(f"Could not invalidate response cache for agent {agent_id}: {e}")
+
+
+def _version_keys(agent_id):
+    return _agent_version_key(agent_id), _kb_version_key(agent_id)
+
+
+def _build_entry_key(agent_id, versions, message_text: str) -> str:
+    agent_version, kb_version = versions
+    digest = hashlib.sha256(normalize_message(message_text).encode()).hexdigest()
+    return f"chat_cache:{agent_id}:{int(agent_version or 0)}:{int(kb_version or 0)}:{digest}"
+
+
+async def _entry_key(redis, agent_id, message_text: str) -> str:
+    return _build_entry_key(agent_id, await redis.mget(*_version_keys(agent_id)), message_text)
+
+
+async def get_cached_response(agent_id, message_text: str) -> Optional[str]:
+    """
+    Returns a previously generated answer for this question under the agent's
+    current configuration and knowledge base, refreshing its LRU position.
+    """
+    try:
+        redis = get_async_redis()
+        key = await _entry_key(redis, agent_id, message_text)
+        cached = await redis.get(key)
+        if cached is None:
+            await aincr(f"response_cache:{agent_id}", 'misses')
+            return None
+        await redis.zadd(_lru_key(agent_id), {key: time.time()})
+        await aincr(f"response_cache:{agent_id}", 'hits')
+        return cached.decode()
+    except RedisError as e:
+        logger.warning(f"Response cache lookup failed for agent {agent_id}: {e}")
+        return None
+
+
+def _store_args(agent_id, key: str, response: str):
+    keys = [key, _lru_key(agent_id)]
+    args = [response, settings.CHAT_RESPONSE_CACHE_TTL, settings.CHAT_RESPONSE_CACHE_MAX_ENTRIES, time.time()]
+    return keys, args
+
+
+async def store_response(agent_id, message_text: str, response: str):
+    """
+    Caches an answer for CHAT_RESPONSE_CACHE_TTL seconds, evicting the least
+    recently used entries once the agent holds more than
+    CHAT_RESPONSE_CACHE_MAX_ENTRIES.
+    """
+    try:
+        redis = get_async_redis()
+        keys, args = _store_args(agent_id, await _entry_key(redis, agent_id, message_text), response)
+        evicted = await redis.register_script(STORE_SCRIPT)(keys=keys, args=args)
+        if evicted:
+            await aincr(f"response_cache:{agent_id}", 'evictions', evicted)
+    except RedisError as e:
+        logger.warning(f"Could not cache response for agent {agent_id}: {e}")
+
+
+def store_response_sync(agent_id, message_text: str, response: str):
+    """Same as store_response(), for Celery workers."""
+    try:
+        redis = get_redis()
+        key = _build_entry_key(agent_id, redis.mget(*_version_keys(agent_id)), message_text)
+        keys, args = _store_args(agent_id, key, response)
+        evicted = redis.register_script(STORE_SCRIPT)(keys=keys, args=args)
+        if evicted:
+            incr(f"response_cache:{agent_id}", 'evictions', evicted)
+    except RedisError as e:
+        logger.warning(f"Could not cache response for agent {agent_id}: {e}")
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional, Tuple
+from django.conf import settings
+from redis.exceptions import RedisError
+from core.services.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 0.05
+# How long a ticket that reaches the front of the queue has to claim its
+# turn before it's taken for abandoned (its socket's node died) and dropped.
+CLAIM_GRACE_SECONDS = 5
+
+# A session's messages wait in a sorted set of tickets ordered by a per-session
+# sequence number; the first one holds the turn. The lease key names the
+# ticket at the front for as long as its turn lasts: a front ticket whose
+# lease lapsed is dropped, and each new front ticket is leased for the claim
+# grace until it claims a full turn. KEYS: tickets, sequence, lease.
+_FRONT = """
+local function promote(grace)
+    local front = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+    if front then
+        redis.call('SET', KEYS[3], front, 'PX', grace)
+    else
+        redis.call('DEL', KEYS[3])
+    end
+end
+
+local function front(grace)
+    while true do
+        local ticket = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+        if not ticket or redis.call('GET', KEYS[3]) == ticket then
+            return ticket
+        end
+        redis.call('ZREM', KEYS[1], ticket)
+        promote(grace)
+    end
+end
+"""
+
+# Queues a ticket unless `limit` are already queued or answering.
+# ARGV: ticket, limit, claim grace ms, key TTL. Returns 1 if queued, else 0.
+TAKE_SCRIPT = _FRONT + """
+front(ARGV[3])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], redis.call('INCR', KEYS[2]), ARGV[1])
+if redis.call('ZCARD', KEYS[1]) == 1 then
+    promote(ARGV[3])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+# Starts or renews the ticket's turn if it's at the front.
+# ARGV: ticket, claim grace ms, turn TTL ms, key TTL.
+# Returns 'turn', 'wait', or 'gone' for a ticket no longer queued.
+CLAIM_SCRIPT = _FRONT + """
+local ticket = front(ARGV[2])
+if ticket == ARGV[1] then
+    redis.call('SET', KEYS[3], ticket, 'PX', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+    return 'turn'
+end
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 'gone'
+end
+return 'wait'
+"""
+
+# Removes the ticket, handing the turn on if it was at the front. Harmless
+# for a ticket already dropped. ARGV: ticket, claim grace ms.
+RELEASE_SCRIPT = _FRONT + """
+local was_front = redis.call('ZRANGE', KEYS[1], 0, 0)[1] == ARGV[1]
+redis.call('ZREM', KEYS[1], ARGV[1])
+if was_front then
+    promote(ARGV[2])
+end
+return 0
+"""
+
+
+def _keys(session_id: str):
+    return [f"chat:turn:{session_id}", f"chat:turn:{session_id}:seq", f"chat:turn:{session_id}:lease"]
+
+
+def _take_args(ticket: str):
+    # The one being answered plus CHAT_SESSION_QUEUE_DEPTH waiting behind it.
+    limit = settings.CHAT_SESSION_QUEUE_DEPTH + 1
+    return [ticket, limit, _grace_ms(), _key_ttl()]
+
+
+def _claim_args(ticket: str):
+    return [ticket, _grace_ms(), settings.CHAT_SESSION_TURN_TTL * 1000, _key_ttl()]
+
+
+def _grace_ms() -> int:
+    return int(CLAIM_GRACE_SECONDS * 1000)
+
+
+def _key_ttl() -> int:
+    # Outlives every ticket that could still be queued.
+    return settings.CHAT_SESSION_TURN_TTL * (settings.CHAT_SESSION_QUEUE_DEPTH + 2)
+
+
+def _wait_limit() -> float:
+    return settings.CHAT_SESSION_TURN_TTL * (settings.CHAT_SESSION_QUEUE_DEPTH + 1)
+
+
+def _log_unavailable(session_id: str, error: Exception):
+    logger.warning(f"Session turns unavailable for '{session_id}', answering anyway: {error}")
+
+
+def _log_gone(session_id: str):
+    logger.warning(f"Turn in session '{session_id}' lapsed before it was used; answering anyway.")
+
+
+def _log_gave_up(session_id: str):
+    logger.warning(f"Gave up waiting for the turn in session '{session_id}' after {_wait_limit()}s.")
+
+
+async def queue_turn(session_id: str) -> Tuple[bool, Optional[str]]:
+    """
+    Takes a place in the session's queue for one user message. Returns
+    (admitted, ticket): not admitted once CHAT_SESSION_QUEUE_DEPTH messages
+    are already waiting behind the one being answered, from any socket on
+    any node; a None ticket (Redis unavailable) is admitted unordered.
+    """
+    ticket = uuid.uuid4().hex
+    try:
+        script = get_async_redis().register_script(TAKE_SCRIPT)
+        return bool(await script(keys=_keys(session_id), args=_take_args(ticket))), ticket
+    except RedisError as e:
+        _log_unavailable(session_id, e)
+        return True, None
+
+
+class Turn:
+    """The session's turn, held inside session_turn() until released or handed to a worker."""
+    def __init__(self, session_id: str, ticket: Optional[str]):
+        self.session_id = session_id
+        self.ticket = ticket
+        self.handed_off = False
+
+    def hand_off(self):
+        """Leaves the release to whoever was passed `ticket` (see resume_turn_sync)."""
+        self.handed_off = True
+
+
+@asynccontextmanager
+async def session_turn(session_id: str, ticket: Optional[str]):
+    """
+    Waits until `ticket` (from queue_turn) is at the front of the session's
+    queue and holds the turn while one user message is answered, so
+    messages from every socket, node and inference worker in the session
+    are answered one at a time in the order they were queued. A turn lapses
+    after CHAT_SESSION_TURN_TTL seconds; Redis errors let the message
+    through. The ticket is released on exit, cancellation included, unless
+    the turn was handed off.
+    """
+    turn = Turn(session_id, ticket)
+    try:
+        if ticket:
+            await _claim(session_id, ticket)
+        yield turn
+    finally:
+        if ticket and not turn.handed_off:
+            await release_turn(session_id, ticket)
+
+
+async def _claim(session_id: str, ticket: str):
+    deadline = time.monotonic() + _wait_limit()
+    try:
+        script = get_async_redis().register_script(CLAIM_SCRIPT)
+        while True:
+            result = await script(keys=_keys(session_id), args=_claim_args(ticket))
+            if result in (b'turn', 'turn'):
+                return
+            if result in (b'gone', 'gone'):
+                _log_gone(session_id)
+                return
+            if time.monotonic() >= deadline:
+                _log_gave_up(session_id)
+                return
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+    except RedisError as e:
+        _log_unavailable(session_id, e)
+
+
+async def release_turn(session_id: str, ticket: str):
+    """Gives up a ticket, queued or holding the turn."""
+    try:
+        script = get_async_redis().register_script(RELEASE_SCRIPT)
+        await script(keys=_keys(session_id), args=[ticket, _grace_ms()])
+    except RedisError as e:
+        logger.warning(f"Could not release the turn in session '{session_id}': {e}")
+
+
+@contextmanager
+def resume_turn_sync(session_id: str, ticket: Optional[str]):
+    """
+    Holds a turn handed off by session_turn() while a Celery worker answers
+    the message, renewing it for a full CHAT_SESSION_TURN_TTL first, and
+    releases it on exit.
+    """
+    if not ticket:
+        yield
+        return
+    redis = get_redis()
+    try:
+        if redis.register_script(CLAIM_SCRIPT)(keys=_keys(session_id), args=_claim_args(ticket)) not in (b'turn', 'turn'):
+            _log_gone(session_id)
+    except RedisError as e:
+        _log_unavailable(session_id, e)
+    try:
+        yield
+    finally:
+        try:
+            redis.register_script(RELEASE_SCRIPT)(keys=_keys(session_id), args=[ticket, _grace_ms()])
+        except RedisError as e:
+            logger.warning(f"Could not release the turn in session '{session_id}': {e}")
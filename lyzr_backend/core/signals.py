@@ -0,0 +1,35 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.models import Agent, KnowledgeBase
+from core.services.agent_runtime import invalidate_agent_runtime
+from billing.models import Plan, Subscription
+
+
+def _invalidate_on_commit(*agent_ids):
+    # Readers rebuilding a snapshot before the commit would cache stale rows
+    # under the new version, so bump only once the change is visible.
+    transaction.on_commit(partial(invalidate_agent_runtime, *agent_ids))
+
+
+@receiver([post_save, post_delete], sender=Agent)
+def agent_changed(sender, instance, **kwargs):
+    _invalidate_on_commit(instance.id)
+
+
+@receiver([post_save, post_delete], sender=KnowledgeBase)
+def knowledge_base_changed(sender, instance, **kwargs):
+    _invalidate_on_commit(instance.agent_id)
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    agent_ids = Agent.objects.filter(user_id=instance.user_id).values_list('id', flat=True)
+    _invalidate_on_commit(*agent_ids)
+
+
+@receiver(post_save, sender=Plan)
+def plan_changed(sender, instance, **kwargs):
+    agent_ids = Agent.objects.filter(user__subscription__plan=instance).values_list('id', flat=True)
+    _invalidate_on_commit(*agent_ids)
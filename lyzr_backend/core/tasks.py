@@ -1,20 +1,31 @@
 import logging
+import uuid
 from celery import shared_task
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from django.utils import timezone
 from .models import Agent, KnowledgeBase, KnowledgeSource, Conversation, Message
-from .services.lyzr_client import LyzrClient, LyzrAPIError
+from .services.lyzr_client import LyzrAPIError, get_lyzr_client
+from .services.lyzr_scheduler import INDEXING, SUMMARIES, SYNC, lyzr_priority
+from .services.agent_sync import METRICS_GROUP as AGENT_SYNC_METRICS, clear_sync_pending
+from .services.metrics import incr
+from .services.response_cache import bump_agent_config_version, bump_knowledge_base_version, store_response_sync
+from .services.client_message_ids import record_reply_sync, release_client_message_sync
+from .services.session_turns import resume_turn_sync
+from billing.usage_counters import increment_message_count_sync
 
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
+@lyzr_priority(SYNC)
 def create_lyzr_stack_task(self, agent_id: str):
     """Create Lyzr stack with proper error handling."""
     try:
         agent = Agent.objects.get(id=agent_id)
         kb = agent.knowledge_base
-        client = LyzrClient()
+        client = get_lyzr_client()
 
         logger.info(f"Creating Lyzr stack for agent {agent_id}")
 
@@ -46,6 +57,8 @@ def create_lyzr_stack_task(self, agent_id: str):
 
         logger.info(f"Linking RAG {rag_id} to agent {lyzr_agent_id}")
         client.update_agent_with_rag(lyzr_agent_id, rag_id, kb.collection_name, agent)
+        Agent.objects.filter(id=agent.id).update(lyzr_config_hash=client.agent_fingerprint(agent))
+        bump_agent_config_version(agent.id)
         logger.info(f"Successfully linked RAG to agent for agent {agent_id}")
 
     except Agent.DoesNotExist:
@@ -60,6 +73,7 @@ def create_lyzr_stack_task(self, agent_id: str):
     
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=30)
+@lyzr_priority(INDEXING)
 def index_knowledge_source_task(self, source_id: str):
     """Index knowledge source with better error handling, especially for URL 404s."""
     try:
@@ -75,13 +89,12 @@ def index_knowledge_source_task(self, source_id: str):
     source.status = KnowledgeSource.IndexingStatus.INDEXING
     source.save()
     
-    client = LyzrClient()
+    client = get_lyzr_client()
     try:
         logger.info(f"Indexing source {source.id} of type {source.type} for RAG {kb.lyzr_rag_id}")
         
         if source.type == 'FILE':
-            with source.file.open('rb') as f:
-                client.index_file(kb.lyzr_rag_id, f, source.file.name)
+            client.index_stored_file(kb.lyzr_rag_id, source.file.storage, source.file.name)
         elif source.type == 'URL':
             client.index_url(kb.lyzr_rag_id, source.content)
         elif source.type == 'TEXT':
@@ -89,6 +102,7 @@ def index_knowledge_source_task(self, source_id: str):
         
         source.status = KnowledgeSource.IndexingStatus.COMPLETED
         source.save()
+        bump_knowledge_base_version(kb.agent_id)
         logger.info(f"Successfully indexed source {source.id}")
 
     except LyzrAPIError as e:
@@ -116,6 +130,7 @@ def index_knowledge_source_task(self, source_id: str):
         raise self.retry(exc=exc)
 
 @shared_task
+@lyzr_priority(SUMMARIES)
 def summarize_conversation_task(conversation_id: str):
     """Enhanced conversation summarization with better error handling."""
     try:
@@ -125,7 +140,7 @@ def summarize_conversation_task(conversation_id: str):
             return
             
         transcript = "\n".join([f"{msg.sender_type}: {msg.content}" for msg in conversation.messages.all()])
-        client = LyzrClient()
+        client = get_lyzr_client()
         
         try:
             response = client.summarize_text(transcript)
@@ -144,14 +159,16 @@ def summarize_conversation_task(conversation_id: str):
         logger.error(f"Failed to summarize conversation {conversation_id}: {e}")
 
 @shared_task
+@lyzr_priority(SYNC)
 def health_check_lyzr_api():
     """Health check task to monitor Lyzr API status."""
     try:
-        client = LyzrClient()
+        client = get_lyzr_client()
         result = client.test_connection()
+        result['connections'] = client.connection_stats()
         
         if result['status'] == 'healthy':
-            logger.info("Lyzr API health check passed")
+            logger.info(f"Lyzr API health check passed; connection pool: {result['connections']}")
         else:
             logger.error(f"Lyzr API health check failed: {result.get('error')}")
             
@@ -232,11 +249,13 @@ def generate_usage_reports():
     return daily_stats
 
 @shared_task
+@lyzr_priority(SYNC)
 def test_lyzr_connection():
     """Test Lyzr API connection manually."""
     try:
-        client = LyzrClient()
+        client = get_lyzr_client()
         result = client.test_connection()
+        result['connections'] = client.connection_stats()
         logger.info(f"Lyzr connection test result: {result}")
         return result
     except Exception as e:
@@ -245,10 +264,13 @@ def test_lyzr_connection():
     
     
 @shared_task(bind=True, max_retries=3, default_retry_delay=120)
+@lyzr_priority(SYNC)
 def update_lyzr_agent_task(self, agent_id: str):
     """
-    Task to synchronize local agent updates with the Lyzr API.
+    Task to synchronize local agent updates with the Lyzr API. Makes no Lyzr
+    calls when the agent's fingerprint matches the configuration last pushed.
     """
+    clear_sync_pending(agent_id)
     try:
         agent = Agent.objects.get(id=agent_id)
 
@@ -257,7 +279,12 @@ def update_lyzr_agent_task(self, agent_id: str):
             create_lyzr_stack_task.delay(agent.id)
             return
 
-        client = LyzrClient()
+        client = get_lyzr_client()
+        fingerprint = client.agent_fingerprint(agent)
+        if fingerprint == agent.lyzr_config_hash:
+            logger.info(f"Agent {agent.id} has no changes for Lyzr since its last sync; skipping.")
+            incr(AGENT_SYNC_METRICS, 'unchanged')
+            return
 
         try:
             lyzr_agent_data = client.get_agent(agent.lyzr_agent_id)
@@ -273,6 +300,9 @@ def update_lyzr_agent_task(self, agent_id: str):
             agent=agent, 
             features=existing_features 
         )
+        Agent.objects.filter(id=agent.id).update(lyzr_config_hash=fingerprint)
+        incr(AGENT_SYNC_METRICS, 'pushed')
+        bump_agent_config_version(agent.id)
         
         logger.info(f"Successfully synced agent {agent.id} with Lyzr.")
 
@@ -286,6 +316,70 @@ def update_lyzr_agent_task(self, agent_id: str):
         raise self.retry(exc=exc)
     
     
+@shared_task(name="run_chat_inference_task", ignore_result=True)
+def run_chat_inference_task(conversation_id: str, session_id: str, agent_id: str, request: Dict[str, Any],
+                            subscription_id: Optional[str] = None, cache_response: bool = False,
+                            client_message_id: Optional[str] = None, reply_channel: Optional[str] = None,
+                            turn_ticket: Optional[str] = None):
+    """
+    Runs one chat completion on the inference worker pool (CHAT_INFERENCE_MODE
+    = 'worker'), saves the AI reply and pushes it to every socket in the
+    session as a `broadcast_message` event, exactly as the consumer would.
+    `reply_channel` is set when the asking socket was alone in the session;
+    the reply then goes to it directly instead of through the group. The
+    consumer hands over the session's turn as `turn_ticket` and the task
+    releases it once it has replied, so the session's next message isn't
+    answered, or even dispatched, before this one.
+    """
+    channel_layer = get_channel_layer()
+
+    with resume_turn_sync(session_id, turn_ticket):
+        try:
+            response_data = get_lyzr_client().get_chat_response(**request)
+            ai_content = response_data.get('response')
+            reply = Message.objects.create(
+                conversation_id=conversation_id,
+                sender_type='AI',
+                content=ai_content or "I'm sorry, I encountered an error and couldn't respond.",
+            )
+            Conversation.objects.filter(id=conversation_id).update(updated_at=reply.created_at)
+
+            if subscription_id:
+                try:
+                    increment_message_count_sync(subscription_id)
+                except Exception as e:
+                    logger.error(f"Could not track usage for subscription {subscription_id}: {e}")
+            if cache_response and ai_content:
+                store_response_sync(agent_id, request['message'], ai_content)
+
+            message = {'id': str(reply.id), 'sender': 'AI', 'content': reply.content, 'feedback': None}
+            if client_message_id:
+                message['reply_to'] = client_message_id
+                record_reply_sync(session_id, client_message_id, message)
+        except LyzrAPIError as e:
+            logger.error(f"Lyzr API Error for agent '{agent_id}': {e}")
+            message = {
+                'id': f'error_{uuid.uuid4()}', 'sender': 'AI', 'feedback': None, 'is_error': True,
+                'content': "My apologies, I'm having trouble connecting to my core functions right now. Please try again in a moment.",
+            }
+        except Exception as e:
+            logger.error(f"Inference task failed for conversation {conversation_id}: {e}", exc_info=True)
+            message = {
+                'id': f'error_{uuid.uuid4()}', 'sender': 'AI', 'feedback': None, 'is_error': True,
+                'content': "An unexpected error occurred. Please try your message again.",
+            }
+
+        if message.get('is_error') and client_message_id:
+            message['reply_to'] = client_message_id
+            release_client_message_sync(session_id, client_message_id)
+
+        event = {'type': 'broadcast_message', 'message': message}
+        if reply_channel:
+            async_to_sync(channel_layer.send)(reply_channel, event)
+        else:
+            async_to_sync(channel_layer.group_send)(f'chat_{session_id}', event)
+
+
 @shared_task(name="health_check_task")
 def health_check_task():
     """
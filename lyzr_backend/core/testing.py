@@ -0,0 +1,25 @@
+"""Helpers shared by the apps' tests."""
+from unittest import mock
+import fakeredis
+
+
+def use_fake_redis(test_case, *modules):
+    """
+    Points get_redis() and get_async_redis() in `modules` at one in-memory
+    Redis, Lua scripts included, for the rest of `test_case`. Returns a sync
+    client on it for arranging and inspecting keys.
+    """
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    factories = {
+        'get_redis': lambda: client,
+        # A client per call, as each async test runs on its own event loop.
+        'get_async_redis': lambda: fakeredis.FakeAsyncRedis(server=server),
+    }
+    for module in modules:
+        for name, factory in factories.items():
+            if hasattr(module, name):
+                patcher = mock.patch.object(module, name, factory)
+                patcher.start()
+                test_case.addCleanup(patcher.stop)
+    return client
@@ -1,2 +1,224 @@
-from django.test import TestCase
+from unittest import mock
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from storages.backends.azure_storage import AzureStorage
+from core.services import circuit_breaker, lyzr_client, lyzr_scheduler, metrics, rate_limit
+from core.services.circuit_breaker import CLOSED, PROBE, CircuitBreaker
+from core.services.lyzr_client import LyzrAPIError, LyzrClient
+from core.services.lyzr_scheduler import (
+    ACQUIRE_SCRIPT, INTERACTIVE, SUMMARIES, SYNC, HostScheduler, lyzr_priority, queue_wait_stats,
+)
+from core.services.multipart import stored_file_chunks
+from core.services.rate_limit import check_rate, check_rate_sync, client_ip, widget_request_limits
+from core.testing import use_fake_redis
 
+
+class StoredFileChunksTests(SimpleTestCase):
+    def azure_storage(self, container_client):
+        storage = AzureStorage(account_name='account', account_key='a2V5', azure_container='uploads',
+                               location='media', timeout=7)
+        patcher = mock.patch.object(AzureStorage, 'client', new_callable=mock.PropertyMock, return_value=container_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return storage
+
+    def test_azure_blob_is_read_with_one_ranged_get_per_chunk(self):
+        content = b'0123456789abcdefghij'
+        blob = mock.Mock()
+        blob.get_blob_properties.return_value.size = len(content)
+        blob.download_blob.side_effect = lambda offset, length, timeout: mock.Mock(
+            readall=mock.Mock(return_value=content[offset:offset + length])
+        )
+        container = mock.Mock()
+        container.get_blob_client.return_value = blob
+        storage = self.azure_storage(container)
+
+        chunks = list(stored_file_chunks(storage, 'knowledge/./report.pdf', chunk_size=8))
+
+        self.assertEqual(chunks, [b'01234567', b'89abcdef', b'ghij'])
+        container.get_blob_client.assert_called_once_with('media/knowledge/report.pdf')
+        blob.get_blob_properties.assert_called_once_with(timeout=7)
+        self.assertEqual(blob.download_blob.call_args_list, [
+            mock.call(offset=0, length=8, timeout=7),
+            mock.call(offset=8, length=8, timeout=7),
+            mock.call(offset=16, length=4, timeout=7),
+        ])
+
+    def test_azure_blob_name_cannot_leave_the_location(self):
+        storage = self.azure_storage(mock.Mock())
+
+        with self.assertRaises(ValueError):
+            list(stored_file_chunks(storage, '../outside.pdf'))
+
+
+class ClientIpTests(SimpleTestCase):
+    def scope(self, forwarded=None):
+        headers = [(b'host', b'example.com')]
+        if forwarded is not None:
+            headers.append((b'x-forwarded-for', forwarded.encode()))
+        return {'type': 'websocket', 'client': ['10.0.0.5', 51234], 'headers': headers}
+
+    def ip_bucket(self, source):
+        return dict(widget_request_limits('agent', None, client_ip(source)))
+
+    @override_settings(TRUSTED_PROXY_HOPS=1)
+    def test_forged_leading_forwarded_entries_do_not_change_the_bucket(self):
+        honest = self.ip_bucket(self.scope('203.0.113.7:50123'))
+        for forged in ('198.51.100.1', '198.51.100.2, 192.0.2.9'):
+            with self.subTest(forged=forged):
+                self.assertEqual(self.ip_bucket(self.scope(f'{forged}, 203.0.113.7:50123')), honest)
+        self.assertIn('widget:ip:203.0.113.7', honest)
+
+    @override_settings(TRUSTED_PROXY_HOPS=1)
+    def test_views_and_sockets_key_a_client_the_same_way(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.7', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(client_ip(request), client_ip(self.scope('198.51.100.1, 203.0.113.7')))
+
+    @override_settings(TRUSTED_PROXY_HOPS=0)
+    def test_forwarded_header_is_ignored_without_trusted_proxies(self):
+        self.assertEqual(client_ip(self.scope('203.0.113.7')), '10.0.0.5')
+
+    @override_settings(TRUSTED_PROXY_HOPS=1)
+    def test_peer_address_without_forwarded_header(self):
+        self.assertEqual(client_ip(self.scope()), '10.0.0.5')
+        self.assertEqual(client_ip(self.scope('[2001:db8::1]:443')), '2001:db8::1')
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = use_fake_redis(self, rate_limit)
+        clock = mock.patch.object(rate_limit, 'time')
+        self.clock = clock.start().time
+        self.addCleanup(clock.stop)
+        self.clock.return_value = 1000.0
+
+    def test_empty_bucket_waits_for_the_next_token(self):
+        limits = (('client', 60),)
+        for _ in range(60):
+            self.assertEqual(check_rate_sync(limits), 0)
+
+        self.assertAlmostEqual(check_rate_sync(limits), 1.0)
+        self.clock.return_value += 0.25
+        self.assertAlmostEqual(check_rate_sync(limits), 0.75)
+        self.clock.return_value += 0.75
+        self.assertEqual(check_rate_sync(limits), 0)
+        self.assertAlmostEqual(check_rate_sync(limits), 1.0)
+
+    async def test_bucket_refills_up_to_its_capacity(self):
+        limits = (('client', 120),)
+        for _ in range(120):
+            await check_rate(limits)
+        self.clock.return_value += 3600
+
+        for _ in range(120):
+            self.assertEqual(await check_rate(limits), 0)
+        self.assertAlmostEqual(await check_rate(limits), 0.5)
+
+    def test_refused_request_charges_no_bucket(self):
+        limits = (('roomy', 60), ('tight', 1))
+        self.assertEqual(check_rate_sync(limits), 0)
+
+        self.assertAlmostEqual(check_rate_sync(limits), 60.0)
+
+        self.assertEqual(float(self.redis.hget('ratelimit:roomy', 'tokens')), 59)
+
+    def test_unlimited_buckets_are_not_checked(self):
+        self.assertEqual(check_rate_sync((('client', None),)), 0)
+        self.assertEqual(self.redis.keys('ratelimit:*'), [])
+
+
+@override_settings(LYZR_SCHEDULER=True, LYZR_HOST_CONCURRENCY=2, LYZR_HOST_REQUESTS_PER_SECOND=100)
+class HostSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = use_fake_redis(self, lyzr_scheduler, metrics)
+        self.scheduler = HostScheduler('lyzr.test')
+
+    def poll(self, priority, lease):
+        """One attempt of acquire(), leaving the caller registered as waiting if refused."""
+        keys, args = self.scheduler._script_args(priority, lease, 30, 0, last_try=False)
+        return self.redis.register_script(ACQUIRE_SCRIPT)(keys=keys, args=args).decode()
+
+    def test_lower_class_yields_to_a_waiting_interactive_call(self):
+        self.assertEqual(self.poll(INTERACTIVE, 'chat-1'), '0')
+        self.assertEqual(self.poll(INTERACTIVE, 'chat-2'), '0')
+        self.assertEqual(self.poll(INTERACTIVE, 'chat-3'), '-1', "host is full")
+        self.scheduler.release_sync('chat-1')
+        self.scheduler.release_sync('chat-2')
+
+        # Both slots are free, but chat-3 is still queued ahead of any sync call.
+        with lyzr_priority(SYNC):
+            self.assertIsNone(self.scheduler.acquire_sync(lease_seconds=30, max_wait=0))
+        self.assertEqual(self.poll(INTERACTIVE, 'chat-3'), '0')
+        self.scheduler.release_sync('chat-3')
+        with lyzr_priority(SYNC):
+            self.assertIsNotNone(self.scheduler.acquire_sync(lease_seconds=30, max_wait=0))
+        self.assertEqual(queue_wait_stats()[SYNC]['timeouts'], 1)
+
+    async def test_lower_class_is_held_to_its_share_of_slots(self):
+        with lyzr_priority(SUMMARIES):
+            self.assertIsNotNone(await self.scheduler.acquire(lease_seconds=30, max_wait=0))
+            self.assertIsNone(await self.scheduler.acquire(lease_seconds=30, max_wait=0))
+        self.assertIsNotNone(await self.scheduler.acquire(lease_seconds=30, max_wait=0))
+
+
+class LyzrResponseTests(SimpleTestCase):
+    def test_non_json_success_body_settles_the_breaker_admission(self):
+        breaker = mock.Mock()
+        response = mock.Mock(status_code=200, text='<html>Bad gateway</html>')
+        response.json.side_effect = ValueError("Expecting value")
+        client = LyzrClient(api_key='key')
+
+        with mock.patch.object(lyzr_client, '_breaker_for', return_value=breaker), \
+                mock.patch.object(LyzrClient, '_send', return_value=response):
+            with self.assertRaises(LyzrAPIError) as raised:
+                client._make_request('http://lyzr.invalid', 'GET', 'v3/agents/', max_retries=0)
+
+        self.assertEqual(raised.exception.status_code, 200)
+        breaker.record_failure_sync.assert_called_once_with(breaker.admit_sync.return_value)
+        breaker.record_success_sync.assert_not_called()
+
+
+@override_settings(LYZR_BREAKER_FAILURES=2, LYZR_BREAKER_WINDOW=60, LYZR_BREAKER_COOLDOWN=30)
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = use_fake_redis(self, circuit_breaker)
+        self.breaker = CircuitBreaker('test')
+
+    def end_cooldown(self):
+        # The open state lapses with its key's TTL.
+        self.redis.delete(self.breaker._open_key)
+
+    async def test_breaker_opens_then_half_opens_then_closes_after_a_successful_probe(self):
+        for _ in range(2):
+            admission = await self.breaker.admit()
+            self.assertEqual(admission, CLOSED)
+            await self.breaker.record_failure(admission)
+        self.assertIsNone(await self.breaker.admit())
+
+        self.end_cooldown()
+        probe = await self.breaker.admit()
+        self.assertEqual(probe, PROBE)
+        self.assertIsNone(await self.breaker.admit(), "only one probe at a time")
+
+        await self.breaker.record_success(probe)
+        self.assertEqual(await self.breaker.admit(), CLOSED)
+        self.assertEqual(await self.breaker.admit(), CLOSED)
+
+    def test_failed_probe_reopens_the_breaker(self):
+        for _ in range(2):
+            self.breaker.record_failure_sync(self.breaker.admit_sync())
+        self.end_cooldown()
+
+        self.breaker.record_failure_sync(self.breaker.admit_sync())
+
+        self.assertIsNone(self.breaker.admit_sync())
+        self.end_cooldown()
+        self.assertEqual(self.breaker.admit_sync(), PROBE)
+
+    def test_released_probe_frees_the_slot(self):
+        for _ in range(2):
+            self.breaker.record_failure_sync(self.breaker.admit_sync())
+        self.end_cooldown()
+
+        self.breaker.release_sync(self.breaker.admit_sync())
+
+        self.assertEqual(self.breaker.admit_sync(), PROBE)
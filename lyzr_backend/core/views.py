@@ -7,6 +7,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled
 from .models import User, Agent, KnowledgeBase, KnowledgeSource, Conversation, Message
 from .serializers import (
     RegisterSerializer, UserSerializer, AgentSerializer, KnowledgeSourceSerializer,
@@ -29,6 +30,10 @@ from billing.models import Plan, Subscription, Usage
 from teams.models import Team, TeamMember,Invitation
 from billing.serializers import SubscriptionSerializer, UsageSerializer
 from billing.utils import check_plan_limit
+from core.services.agent_sync import METRICS_GROUP as AGENT_SYNC_METRICS, mark_sync_pending
+from core.services.lyzr_client import get_lyzr_client
+from core.services.metrics import incr
+from core.services.rate_limit import check_rate_sync, client_ip, plan_limit, widget_request_limits
 
 logger = logging.getLogger(__name__)
 
@@ -189,8 +194,16 @@ Key Instructions:
 
     def perform_update(self, serializer):
         instance = serializer.save()
+        # Edits Lyzr never sees (widget settings, is_active, ...) queue nothing;
+        # the rest are debounced into one sync per LYZR_AGENT_SYNC_DEBOUNCE window.
+        if get_lyzr_client().agent_fingerprint(instance) == instance.lyzr_config_hash:
+            incr(AGENT_SYNC_METRICS, 'unchanged')
+            return
+        if not mark_sync_pending(instance.id):
+            incr(AGENT_SYNC_METRICS, 'debounced')
+            return
         logger.info(f"Queuing Lyzr update task for agent {instance.id}")
-        update_lyzr_agent_task.delay(str(instance.id))
+        update_lyzr_agent_task.apply_async(args=[str(instance.id)], countdown=settings.LYZR_AGENT_SYNC_DEBOUNCE)
 
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
@@ -229,12 +242,28 @@ class KnowledgeSourceViewSet(viewsets.ModelViewSet):
             raise serializers.ValidationError("Agent or KnowledgeBase not found for this user.")
 
 class PublicAgentConfigView(generics.RetrieveAPIView):
-    queryset = Agent.objects.filter(is_active=True)
+    queryset = Agent.objects.filter(is_active=True).select_related('user__subscription__plan')
     serializer_class = PublicAgentConfigSerializer
     permission_classes = (permissions.AllowAny,)
+    # Limited per agent (by plan) and per client address in get_object()
+    # instead of the global per-IP daily anon throttle.
+    throttle_classes = ()
     lookup_field= 'id'
     lookup_url_kwarg = 'id'
 
+    def get_object(self):
+        agent = super().get_object()
+        subscription = getattr(agent.user, 'subscription', None)
+        agent_limit = plan_limit(
+            subscription.plan if subscription else None,
+            'widget_requests_per_minute', settings.WIDGET_REQUESTS_PER_MINUTE_PER_AGENT,
+        )
+        wait = check_rate_sync(widget_request_limits(agent.id, agent_limit, client_ip(self.request)))
+        if wait:
+            incr(f"rate_limit:{agent.id}", 'config_requests_limited')
+            raise Throttled(wait=wait)
+        return agent
+
 # REMOVED TicketViewSet from here
 
 class DashboardAnalyticsView(APIView):
@@ -107,17 +107,73 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# 'inline' runs chat inference inside the ASGI process; 'worker' hands it to
+# Celery workers consuming CHAT_INFERENCE_QUEUE so sockets and inference scale apart.
+CHAT_INFERENCE_MODE = config('CHAT_INFERENCE_MODE', default='inline')
+CHAT_INFERENCE_QUEUE = config('CHAT_INFERENCE_QUEUE', default='inference')
+
+CELERY_TASK_ROUTES = {
+    'run_chat_inference_task': {'queue': CHAT_INFERENCE_QUEUE},
+}
+
 CELERY_BEAT_SCHEDULE = {
     'celery-health-check': {
         'task': 'health_check_task',
         'schedule': crontab(minute='*'),
     },
+    'flush-usage-counters': {
+        'task': 'flush_usage_counters_task',
+        'schedule': crontab(minute='*'),
+    },
 }
+CHAT_HISTORY_PAGE_SIZE = config('CHAT_HISTORY_PAGE_SIZE', default=30, cast=int)
+CHAT_RESUME_MAX_MESSAGES = config('CHAT_RESUME_MAX_MESSAGES', default=100, cast=int)
+CHAT_MESSAGE_WRITE_BEHIND = config('CHAT_MESSAGE_WRITE_BEHIND', default=False, cast=bool)
+CHAT_MESSAGE_FLUSH_INTERVAL = config('CHAT_MESSAGE_FLUSH_INTERVAL', default=0.5, cast=float)
+CHAT_MESSAGE_FLUSH_SIZE = config('CHAT_MESSAGE_FLUSH_SIZE', default=100, cast=int)
+# A batch that keeps failing is dropped after this many flushes, and at most
+# CHAT_MESSAGE_BUFFER_LIMIT messages wait per event loop (oldest dropped first).
+CHAT_MESSAGE_FLUSH_MAX_ATTEMPTS = config('CHAT_MESSAGE_FLUSH_MAX_ATTEMPTS', default=5, cast=int)
+CHAT_MESSAGE_BUFFER_LIMIT = config('CHAT_MESSAGE_BUFFER_LIMIT', default=5000, cast=int)
+CHAT_RESPONSE_CACHE_TTL = config('CHAT_RESPONSE_CACHE_TTL', default=6 * 60 * 60, cast=int)
+CHAT_RESPONSE_CACHE_MAX_ENTRIES = config('CHAT_RESPONSE_CACHE_MAX_ENTRIES', default=500, cast=int)
+CHAT_CLIENT_MESSAGE_ID_TTL = config('CHAT_CLIENT_MESSAGE_ID_TTL', default=10 * 60, cast=int)
+# Messages a session may have waiting behind the one being answered, across
+# all its sockets; see core/services/session_turns.py.
+CHAT_SESSION_QUEUE_DEPTH = config('CHAT_SESSION_QUEUE_DEPTH', default=3, cast=int)
+# Longest one message may hold its session's turn; covers LYZR_CHAT_TIMEOUT
+# with a retry, and in worker mode the wait for a free inference worker.
+CHAT_SESSION_TURN_TTL = config('CHAT_SESSION_TURN_TTL', default=90, cast=int)
+# Token-bucket limits for the public widget, in requests per minute, each
+# allowing a burst of one minute's worth; see core/services/rate_limit.py.
+# The per-agent limits are defaults for plans whose features don't set
+# 'widget_requests_per_minute' / 'messages_per_minute' (or 'unlimited').
+WIDGET_REQUESTS_PER_MINUTE_PER_AGENT = config('WIDGET_REQUESTS_PER_MINUTE_PER_AGENT', default=600, cast=int)
+WIDGET_REQUESTS_PER_MINUTE_PER_IP = config('WIDGET_REQUESTS_PER_MINUTE_PER_IP', default=30, cast=int)
+CHAT_MESSAGES_PER_MINUTE_PER_AGENT = config('CHAT_MESSAGES_PER_MINUTE_PER_AGENT', default=300, cast=int)
+CHAT_MESSAGES_PER_MINUTE_PER_SESSION = config('CHAT_MESSAGES_PER_MINUTE_PER_SESSION', default=12, cast=int)
+CHAT_MESSAGES_PER_MINUTE_PER_IP = config('CHAT_MESSAGES_PER_MINUTE_PER_IP', default=30, cast=int)
+# Proxies in front of Daphne that append to X-Forwarded-For (the App Service
+# front end is one). The per-IP limits key on the entry the outermost one
+# appended; set 0 when clients reach Daphne directly.
+TRUSTED_PROXY_HOPS = config('TRUSTED_PROXY_HOPS', default=1, cast=int)
+# A socket that is alone in its session sends replies straight to itself
+# instead of through the channel-layer group; see ChatConsumer.deliver.
+CHAT_DIRECT_SEND = config('CHAT_DIRECT_SEND', default=True, cast=bool)
+CHAT_HEARTBEAT_INTERVAL = config('CHAT_HEARTBEAT_INTERVAL', default=25, cast=float)
+CHAT_HEARTBEAT_TIMEOUT = config('CHAT_HEARTBEAT_TIMEOUT', default=70, cast=float)
+CHAT_IDLE_TIMEOUT = config('CHAT_IDLE_TIMEOUT', default=30 * 60, cast=float)
+# How long a channel-layer group membership lasts after its last group_add.
+# Live sockets renew theirs from the heartbeat once half of it has passed
+# (see ChatConsumer.check_liveness), so only a vanished socket's entry lapses.
+CHAT_GROUP_EXPIRY = int(CHAT_IDLE_TIMEOUT + 2 * CHAT_HEARTBEAT_INTERVAL)
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
             "hosts": [config('CHANNEL_LAYER_REDIS_URL')],
+            "group_expiry": CHAT_GROUP_EXPIRY,
         },
     },
 }
@@ -208,6 +264,47 @@ LYZR_API_KEY = config('LYZR_API_KEY')
 LYZR_AGENT_API_BASE_URL = config('LYZR_AGENT_API_BASE_URL', default='https://agent-prod.studio.lyzr.ai/v3/')
 LYZR_RAG_API_BASE_URL = config('LYZR_RAG_API_BASE_URL', default='https://rag-prod.studio.lyzr.ai/v3/')
 LYZR_SUMMARIZER_AGENT_ID = config('LYZR_SUMMARIZER_AGENT_ID')
+# Idle connections the shared LyzrClient keeps per Lyzr host; size it to the
+# threads that call Lyzr at once (inference worker concurrency, ASGI threads).
+LYZR_HTTP_POOL_MAXSIZE = config('LYZR_HTTP_POOL_MAXSIZE', default=32, cast=int)
+# Per-operation timeouts (seconds) for Lyzr calls: chat turns fail fast,
+# indexing uploads may take minutes; everything else uses LYZR_REQUEST_TIMEOUT.
+LYZR_REQUEST_TIMEOUT = config('LYZR_REQUEST_TIMEOUT', default=60, cast=float)
+LYZR_CHAT_TIMEOUT = config('LYZR_CHAT_TIMEOUT', default=30, cast=float)
+LYZR_CHAT_MAX_RETRIES = config('LYZR_CHAT_MAX_RETRIES', default=1, cast=int)
+LYZR_INDEXING_TIMEOUT = config('LYZR_INDEXING_TIMEOUT', default=300, cast=float)
+# FILE knowledge sources are streamed to Lyzr this many bytes at a time.
+LYZR_UPLOAD_CHUNK_SIZE = config('LYZR_UPLOAD_CHUNK_SIZE', default=1024 * 1024, cast=int)
+# Retries back off with full jitter, up to LYZR_RETRY_BACKOFF_CAP seconds,
+# and across all processes may not exceed LYZR_RETRY_BUDGET_RATIO of calls
+# (or LYZR_RETRY_BUDGET_MIN per 10s window, whichever is larger).
+LYZR_RETRY_BACKOFF_BASE = config('LYZR_RETRY_BACKOFF_BASE', default=1, cast=float)
+LYZR_RETRY_BACKOFF_CAP = config('LYZR_RETRY_BACKOFF_CAP', default=8, cast=float)
+LYZR_RETRY_BUDGET_RATIO = config('LYZR_RETRY_BUDGET_RATIO', default=0.2, cast=float)
+LYZR_RETRY_BUDGET_MIN = config('LYZR_RETRY_BUDGET_MIN', default=10, cast=int)
+# Per-endpoint circuit breaker; see core/services/circuit_breaker.py.
+LYZR_BREAKER_FAILURES = config('LYZR_BREAKER_FAILURES', default=5, cast=int)
+LYZR_BREAKER_WINDOW = config('LYZR_BREAKER_WINDOW', default=30, cast=int)
+LYZR_BREAKER_COOLDOWN = config('LYZR_BREAKER_COOLDOWN', default=30, cast=int)
+# Cluster-wide budget per Lyzr host, shared through Redis by every process.
+# Background work (ticket summaries, indexing, conversation summaries,
+# agent sync) gets only part of it and yields to live chats; see
+# core/services/lyzr_scheduler.py.
+LYZR_SCHEDULER = config('LYZR_SCHEDULER', default=True, cast=bool)
+LYZR_HOST_CONCURRENCY = config('LYZR_HOST_CONCURRENCY', default=64, cast=int)
+LYZR_HOST_REQUESTS_PER_SECOND = config('LYZR_HOST_REQUESTS_PER_SECOND', default=50, cast=float)
+# Agent edits are pushed to Lyzr at most once per this many seconds.
+LYZR_AGENT_SYNC_DEBOUNCE = config('LYZR_AGENT_SYNC_DEBOUNCE', default=5, cast=int)
+# Hedged chat inference (AsyncLyzrClient.get_chat_response only): a call
+# still unanswered after the LYZR_CHAT_HEDGE_PERCENTILE latency of recent
+# calls (at least LYZR_CHAT_HEDGE_MIN_DELAY seconds) is sent a second time
+# and the first reply wins. At most LYZR_CHAT_HEDGE_BUDGET of calls are
+# hedged. Off by default: both copies reach the agent's session memory.
+LYZR_CHAT_HEDGING = config('LYZR_CHAT_HEDGING', default=False, cast=bool)
+LYZR_CHAT_HEDGE_PERCENTILE = config('LYZR_CHAT_HEDGE_PERCENTILE', default=95, cast=float)
+LYZR_CHAT_HEDGE_MIN_DELAY = config('LYZR_CHAT_HEDGE_MIN_DELAY', default=2, cast=float)
+LYZR_CHAT_HEDGE_BUDGET = config('LYZR_CHAT_HEDGE_BUDGET', default=0.05, cast=float)
+LYZR_CHAT_STREAMING = config('LYZR_CHAT_STREAMING', default=True, cast=bool)
 
 LYZR_LLM_PROVIDER_ID = config('LYZR_LLM_PROVIDER_ID', default='OpenAI')
 LYZR_LLM_CREDENTIAL_ID = config('LYZR_LLM_CREDENTIAL_ID')
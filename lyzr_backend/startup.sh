@@ -10,8 +10,17 @@ rm -f celerybeat-schedule
 echo "Starting Celery worker in the background..."
 celery -A lyzr_backend.celery worker -l info --pool=threads &
 
+# Chat replies only go through the inference queue in worker mode.
+if [ "${CHAT_INFERENCE_MODE:-inline}" = "worker" ]; then
+    echo "Starting Celery inference worker in the background..."
+    celery -A lyzr_backend.celery worker -l info --pool=threads -Q "${CHAT_INFERENCE_QUEUE:-inference}" \
+        --concurrency="${CHAT_INFERENCE_CONCURRENCY:-16}" -n inference@%h &
+fi
+
 echo "Starting Celery Beat scheduler in the background..."
 celery -A lyzr_backend.celery beat -l info &
 
 echo "Starting Daphne server (in foreground)..."
+# No --proxy-headers: Daphne would trust the client-supplied first
+# X-Forwarded-For entry. rate_limit.client_ip() reads the proxy's own entry.
 exec daphne -b 0.0.0.0 -p 8000 lyzr_backend.asgi:application
\ No newline at end of file
@@ -5,13 +5,15 @@ from channels.layers import get_channel_layer
 from django.db import transaction
 
 from core.models import Conversation
-from core.services.lyzr_client import LyzrClient, LyzrAPIError
+from core.services.lyzr_client import LyzrAPIError, get_lyzr_client
+from core.services.lyzr_scheduler import TICKETS, lyzr_priority
 from teams.models import Team
 from .models import Ticket
 
 logger = logging.getLogger(__name__)
 
 @shared_task
+@lyzr_priority(TICKETS)
 def create_ticket_from_conversation_task(conversation_id: str):
     """
     Summarizes a conversation and creates a ticket, then notifies the client via WebSocket.
@@ -32,7 +34,7 @@ def create_ticket_from_conversation_task(conversation_id: str):
             summary = "User needs assistance" # Default title
             if transcript:
                 try:
-                    client = LyzrClient()
+                    client = get_lyzr_client()
                     response = client.summarize_text(transcript)
                     if response.get('summary'):
                         summary = response['summary']